@@ -2,6 +2,7 @@
 # Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
 #     http://aws.amazon.com/asl/
 # or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+import base64
 import os
 import shutil
 import zipfile
@@ -72,7 +73,15 @@ def packagelambda(* functions):
         zipf = zipfile.ZipFile("%s.zip" % function, "w", zipfile.ZIP_DEFLATED)
         
         write_dir_to_zip("../lambda/%s/" % function, zipf)
-        zipf.write("../config/%s-params.json" % function, "%s-params.json" % function)
+
+        params = read_json("../config/%s-params.json" % function)
+        if function == "framefetcher" and not params.get("cursor_signing_key"):
+            #Every container of the package must verify the cursors of the others
+            print('Generating a cursor_signing_key for this "%s" package' % function)
+            params["cursor_signing_key"] = base64.urlsafe_b64encode(os.urandom(32)).decode("ascii")
+            zipf.writestr("%s-params.json" % function, json.dumps(params, indent=4))
+        else:
+            zipf.write("../config/%s-params.json" % function, "%s-params.json" % function)
 
         zipf.close()
 
@@ -229,6 +238,42 @@ def updatestack(**kwargs):
         print("EXCEPTION: " + e.response["Error"]["Message"])
 
 
+@task()
+def updateeventsource(**kwargs):
+    '''Apply the Image Processor event source settings in cfn-params.json without a full stack update.'''
+    cfn_params_path = kwargs.get("cfn_params_path", "config/cfn-params.json")
+    function_name = kwargs.get("function_name", "imageprocessor")
+
+    cfn_params_dict = read_json(cfn_params_path)
+    lambda_client = boto3.client('lambda')
+
+    failure_destination_arn = cfn_params_dict.get("ImageProcessorFailureDestinationArnParameter", "")
+
+    settings = {
+        'BatchSize': int(cfn_params_dict.get("ImageProcessorBatchSizeParameter", 100)),
+        'MaximumBatchingWindowInSeconds': int(cfn_params_dict.get("ImageProcessorBatchingWindowParameter", 0)),
+        'ParallelizationFactor': int(cfn_params_dict.get("ImageProcessorParallelizationFactorParameter", 1)),
+        'BisectBatchOnFunctionError': cfn_params_dict.get("ImageProcessorBisectOnErrorParameter", "false") == "true",
+        'MaximumRetryAttempts': int(cfn_params_dict.get("ImageProcessorMaximumRetryAttemptsParameter", -1))
+    }
+    if failure_destination_arn:
+        settings['DestinationConfig'] = {'OnFailure': {'Destination': failure_destination_arn}}
+
+    response = lambda_client.list_event_source_mappings(FunctionName=function_name)
+    for mapping in response["EventSourceMappings"]:
+        print("Updating event source mapping '%s' of '%s' with %s" % (mapping["UUID"], function_name, settings))
+        lambda_client.update_event_source_mapping(UUID=mapping["UUID"], **settings)
+
+    print("Run updatestack with the same cfn-params.json to keep the stack in sync.")
+
+@task()
+def loadsim(**kwargs):
+    '''Simulate Image Processor under load to pick event source settings. Options are passed to lambda/load_simulation.py, e.g. loadsim[fps=20,shards=2].'''
+    args = ["python", "lambda/load_simulation.py"]
+    for key, value in kwargs.items():
+        args.extend(["--%s" % key.replace("_", "-"), str(value)])
+    call(args)
+
 @task()
 def stackstatus(global_params_path="config/global-params.json"):
     '''Check the status of the Amazon Rekognition Video Analyzer CloudFormation stack.'''
@@ -0,0 +1,106 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+from collections import Counter
+
+import cv2
+
+#Each downscale step shrinks both dimensions by this factor.
+downscale_step = 0.75
+
+
+class AdaptiveJpegEncoder(object):
+    '''Encodes frames as JPEG at the highest quality that fits a byte budget.
+
+    The quality chosen for a camera is remembered and tried first for its next
+    frame, so a search only happens when the scene gets busier. When a frame is
+    comfortably under budget, the next one is tried one step higher. If even
+    min_quality does not fit, the frame is downscaled (down to min_scale).
+    '''
+
+    def __init__(self, max_bytes, initial_quality=90, min_quality=40, quality_step=10,
+                 allow_downscale=True, min_scale=0.25):
+        self.max_bytes = max_bytes
+        self.initial_quality = initial_quality
+        self.min_quality = min_quality
+        self.quality_step = quality_step
+        self.allow_downscale = allow_downscale
+        self.min_scale = min_scale
+
+        self.frames_encoded = 0
+        self.encode_calls = 0
+        self.frames_over_budget = 0
+        self.quality_counts = Counter()
+        self.total_bytes = 0
+        self.max_frame_bytes = 0
+
+        self._quality_by_camera = {}
+
+    def _encode(self, frame, quality):
+        self.encode_calls += 1
+        retval, buff = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buff
+
+    def encode(self, frame, camera_id=''):
+        '''Encode a frame and return the JPEG bytes (as a numpy buffer).'''
+        quality = self._quality_by_camera.get(camera_id, self.initial_quality)
+        buff = self._encode(frame, quality)
+
+        if len(buff) > self.max_bytes:
+            #Binary search for the highest quality below the remembered one that fits.
+            low, high = self.min_quality, quality - 1
+            best = None
+            while low <= high:
+                mid = (low + high) // 2
+                candidate = self._encode(frame, mid)
+                if len(candidate) <= self.max_bytes:
+                    best, quality = candidate, mid
+                    low = mid + 1
+                else:
+                    high = mid - 1
+
+            if best is None:
+                quality = self.min_quality
+                buff = self._downscale_to_budget(frame, quality)
+            else:
+                buff = best
+
+            self._quality_by_camera[camera_id] = quality
+
+        elif len(buff) < self.max_bytes // 2 and quality < self.initial_quality:
+            self._quality_by_camera[camera_id] = min(self.initial_quality, quality + self.quality_step)
+
+        else:
+            self._quality_by_camera[camera_id] = quality
+
+        self.frames_encoded += 1
+        self.quality_counts[quality] += 1
+        self.total_bytes += len(buff)
+        self.max_frame_bytes = max(self.max_frame_bytes, len(buff))
+        if len(buff) > self.max_bytes:
+            self.frames_over_budget += 1
+
+        return buff
+
+    def _downscale_to_budget(self, frame, quality):
+        scale = 1.0
+        buff = self._encode(frame, quality)
+        while len(buff) > self.max_bytes and self.allow_downscale and scale * downscale_step >= self.min_scale:
+            scale *= downscale_step
+            height, width = frame.shape[:2]
+            small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+            buff = self._encode(small, quality)
+        return buff
+
+    def stats(self):
+        return {
+            'frames': self.frames_encoded,
+            'encodes_per_frame': float(self.encode_calls) / self.frames_encoded if self.frames_encoded else 0.0,
+            'mean_bytes': self.total_bytes // self.frames_encoded if self.frames_encoded else 0,
+            'max_bytes': self.max_frame_bytes,
+            'over_budget': self.frames_over_budget,
+            'quality': dict(sorted(self.quality_counts.items()))
+        }
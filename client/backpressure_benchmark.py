@@ -0,0 +1,130 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Shows how FrameDispatcher keeps memory flat when the sender cannot keep up.
+
+usage: backpressure_benchmark.py [seconds] [cameras] [fps-per-camera] [send-ms]
+
+Cameras offer decoded 720p frames at fps-per-camera to a stub sender with two
+workers that each take send-ms per frame, so frames arrive faster than they can
+be sent. The capture client before FrameDispatcher, which submitted every frame
+straight to its workers, is run first, then FrameDispatcher with the client's
+default limits (max_frames_in_flight, max_frames_pending) under each drop
+policy. Each run is a separate process. It prints the frames sent and dropped,
+the largest number of frames held (queued or being sent), the process's peak
+RSS growth, and the mean and largest time from offer to sent.
+'''
+
+import multiprocessing
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from frame_dispatcher import FrameDispatcher, drop_policies
+
+frame_shape = (720, 1280, 3)
+sender_workers = 2
+max_in_flight = 6
+max_pending = 6
+
+
+class SlowSender(object):
+    '''Stands in for the encoder workers and Kinesis: each frame takes send_secs.'''
+
+    def __init__(self, send_secs):
+        self.send_secs = send_secs
+        self.executor = ThreadPoolExecutor(max_workers=sender_workers)
+        self.held = 0
+        self.max_held = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def submit(self, frame, offered_at, done=None):
+        with self._lock:
+            self.held += 1
+            self.max_held = max(self.max_held, self.held)
+        self.executor.submit(self._send, frame, offered_at, done)
+
+    def _send(self, frame, offered_at, done):
+        time.sleep(self.send_secs)
+        with self._lock:
+            self.held -= 1
+            self.latencies.append(time.time() - offered_at)
+        if done is not None:
+            done(True)
+
+
+def run(mode, seconds, cameras, fps, send_secs, results):
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sender = SlowSender(send_secs)
+    offered_at = {}
+    dispatcher = None
+    if mode != 'unbounded':
+        dispatcher = FrameDispatcher(
+            lambda camera_id, frame, frame_count, done: sender.submit(frame, offered_at[frame_count], done),
+            max_in_flight=max_in_flight, max_pending=max_pending, drop_policy=mode)
+
+    template = np.random.RandomState(7).randint(0, 256, frame_shape).astype(np.uint8)
+    max_held = 0
+    frame_count = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        for camera in range(cameras):
+            #Every decoded frame is a new buffer
+            frame = template.copy()
+            offered_at[frame_count] = time.time()
+            if dispatcher is None:
+                sender.submit(frame, offered_at[frame_count])
+            else:
+                dispatcher.offer('camera{}'.format(camera), frame, frame_count)
+                max_held = max(max_held, dispatcher.pending() + dispatcher.in_flight())
+            frame_count += 1
+            del frame
+        time.sleep(max(0.0, start + frame_count / float(cameras * fps) - time.time()))
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = sorted(sender.latencies) or [0.0]
+    stats = dispatcher.stats() if dispatcher is not None else {'dropped': 0}
+    results.put({
+        'mode': mode,
+        'offered': frame_count,
+        'sent': len(sender.latencies),
+        'dropped': stats['dropped'],
+        'max_held': max(max_held, sender.max_held),
+        'peak_rss_growth_mb': (peak_kb - baseline_kb) // 1024,
+        'mean_latency_secs': round(sum(latencies) / len(latencies), 2),
+        'max_latency_secs': round(latencies[-1], 2)
+    })
+    #Frames still queued in the unbounded run are abandoned
+    sender.executor.shutdown(wait=False)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cameras = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    fps = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    send_secs = float(sys.argv[4]) / 1000 if len(sys.argv) > 4 else 0.2
+
+    print("{} s, {} cameras at {} frames/s, {} sender workers taking {:.0f} ms per {}x{} frame "
+          "(sends at most {:.0f} of {:.0f} frames/s).".format(
+              seconds, cameras, fps, sender_workers, send_secs * 1000, frame_shape[1], frame_shape[0],
+              sender_workers / send_secs, cameras * fps))
+
+    context = multiprocessing.get_context('spawn')
+    for mode in ('unbounded',) + drop_policies:
+        results = context.Queue()
+        process = context.Process(target=run, args=(mode, seconds, cameras, fps, send_secs, results))
+        process.start()
+        result = results.get()
+        process.join()
+        print("  {:<24} {}".format(result.pop('mode') + ':', result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares the client's capture modes on a local video file.
+
+usage: capture_benchmark.py <video-file> [capture-rate] [offer-cost-secs]
+
+The file is played back at its own frame rate, the way a live camera delivers
+frames: a frame cannot be grabbed before it "arrives", and frames that are not
+grabbed in time pile up as they would in the FFMPEG buffer. Every sampled frame
+costs offer-cost-secs of (idle) time to hand off, standing in for a busy capture
+thread. For each mode it prints the CPU time spent per second of video captured,
+and how old sampled frames were (since they arrived) when they were handed off.
+'''
+
+import sys
+import time
+
+import cv2
+
+from capture_supervisor import CameraStream, CAPTURE_READ, CAPTURE_GRAB
+
+
+class LiveFileCapture(object):
+    '''Plays a video file back in real time, like a live stream.'''
+
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.start = None
+        self.frame_index = 0
+
+    def arrival_time(self, frame_index):
+        return self.start + frame_index / self.fps
+
+    def grab(self):
+        if self.start is None:
+            self.start = time.time()
+
+        delay = self.arrival_time(self.frame_index) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        self.frame_index += 1
+        return self.cap.grab()
+
+    def retrieve(self):
+        return self.cap.retrieve()
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.cap.release()
+
+
+class BenchmarkPipeline(object):
+    '''Stands in for FramePipeline and records how old each offered frame is.'''
+
+    def __init__(self, offer_cost_secs):
+        self.offer_cost_secs = offer_cost_secs
+        self.capture = None
+        self.staleness = []
+
+    def offer(self, camera_id, frame, frame_count):
+        self.staleness.append(time.time() - self.capture.arrival_time(frame_count))
+        time.sleep(self.offer_cost_secs)
+
+
+class LiveFileCameraStream(CameraStream):
+
+    def _open(self):
+        self.pipeline.capture = LiveFileCapture(self.url)
+        return self.pipeline.capture
+
+
+def run(path, capture_mode, latest_frame_only, capture_rate, offer_cost_secs):
+    pipeline = BenchmarkPipeline(offer_cost_secs)
+    stream = LiveFileCameraStream('benchmark', path, pipeline, capture_rate=capture_rate,
+                                  reconnect=False, capture_mode=capture_mode,
+                                  latest_frame_only=latest_frame_only)
+
+    cpu_start = time.process_time()
+    wall_start = time.time()
+    stream.start()
+    stream.join()
+    cpu_secs = time.process_time() - cpu_start
+    wall_secs = time.time() - wall_start
+
+    video_secs = stream.frames_read / pipeline.capture.fps
+    staleness = sorted(pipeline.staleness) or [0.0]
+
+    return {
+        'mode': '{}{}'.format(capture_mode, ' + latest frame' if latest_frame_only else ''),
+        'cpu_ms_per_video_sec': round(1000 * cpu_secs / video_secs, 1),
+        'wall_secs': round(wall_secs, 1),
+        'offered': len(pipeline.staleness),
+        'superseded': stream.frames_superseded,
+        'mean_staleness_secs': round(sum(staleness) / len(staleness), 3),
+        'max_staleness_secs': round(staleness[-1], 3)
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: capture_benchmark.py <video-file> [capture-rate] [offer-cost-secs]")
+        return
+
+    path = sys.argv[1]
+    capture_rate = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    offer_cost_secs = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    for capture_mode, latest_frame_only in [(CAPTURE_READ, False), (CAPTURE_GRAB, False),
+                                            (CAPTURE_READ, True), (CAPTURE_GRAB, True)]:
+        print(run(path, capture_mode, latest_frame_only, capture_rate, offer_cost_secs))
+
+
+if __name__ == '__main__':
+    main()
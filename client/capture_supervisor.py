@@ -0,0 +1,269 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import json
+import threading
+import time
+
+import cv2
+
+#"read" decodes every frame. "grab" decodes only the frames that are sampled.
+CAPTURE_READ = 'read'
+CAPTURE_GRAB = 'grab'
+
+capture_modes = (CAPTURE_READ, CAPTURE_GRAB)
+
+
+def load_cameras(cameras_path):
+    '''Load the camera list from a JSON file.'''
+    with open(cameras_path, 'r') as cameras_file:
+        return json.loads(cameras_file.read())["cameras"]
+
+
+class CameraStream(object):
+    '''Captures one camera on its own thread and offers sampled frames to a pipeline.
+
+    capture_mode "read" decodes every frame. "grab" only demuxes the frames that
+    are skipped by capture_rate (VideoCapture.grab()) and decodes just the sampled
+    ones (retrieve()).
+
+    With latest_frame_only, a separate reader thread keeps pulling frames off the
+    stream and only the newest sampled frame is kept. Sampled frames that are
+    superseded before the capture thread gets to them are dropped, so a slow
+    capture thread never works through a backlog of old frames.
+
+    The stream is reopened with exponential backoff when it fails. Local video files
+    are not reopened by default, so a file source simply ends the stream.
+    '''
+
+    def __init__(self, camera_id, url, pipeline, capture_rate=30, motion_gate=None,
+                 reconnect=None, min_backoff_secs=1.0, max_backoff_secs=60.0,
+                 capture_mode=CAPTURE_GRAB, latest_frame_only=False):
+        if capture_mode not in capture_modes:
+            raise ValueError('Unknown capture mode "{}". Expected one of {}.'.format(capture_mode, capture_modes))
+
+        self.camera_id = camera_id
+        self.url = url
+        self.pipeline = pipeline
+        self.capture_rate = capture_rate
+        self.motion_gate = motion_gate
+        self.reconnect = ('://' in url) if reconnect is None else reconnect
+        self.min_backoff_secs = min_backoff_secs
+        self.max_backoff_secs = max_backoff_secs
+        self.capture_mode = capture_mode
+        self.latest_frame_only = latest_frame_only
+
+        self.frames_read = 0
+        self.frames_sampled = 0
+        self.frames_superseded = 0
+        self.reconnects = 0
+        self.fps = 0.0
+        self.staleness = 0.0
+
+        self._frame_count = 0
+        self._latest = None
+        self._reader_done = False
+        self._latest_ready = threading.Condition()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='camera-{}'.format(camera_id))
+        self._thread.daemon = True
+        self._fps_window_start = time.time()
+        self._fps_window_frames = 0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._latest_ready:
+            self._latest_ready.notify_all()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _open(self):
+        print("Capturing from '{}' ({}) at a rate of 1 every {} frames...".format(
+            self.url, self.camera_id, self.capture_rate))
+        return cv2.VideoCapture(str(self.url), cv2.CAP_FFMPEG)
+
+    def _run(self):
+        backoff = self.min_backoff_secs
+
+        while not self._stop.is_set():
+            cap = self._open()
+
+            if self.latest_frame_only:
+                frames_read = self._capture_latest(cap)
+            else:
+                frames_read = self._capture(cap)
+
+            cap.release()
+
+            if frames_read:
+                backoff = self.min_backoff_secs
+
+            if self._stop.is_set() or not self.reconnect:
+                break
+
+            print("Stream '{}' failed. Reconnecting in {:.1f} secs.".format(self.camera_id, backoff))
+            self.reconnects += 1
+            self._stop.wait(backoff)
+            backoff = min(self.max_backoff_secs, backoff * 2)
+
+        print("Stream '{}' ended after {} frames.".format(self.camera_id, self.frames_read))
+
+    def _read_frame(self, cap):
+        '''Read the next frame off the stream.
+
+        Returns (ok, frame, frame_count, captured_at). ok is False at the end of the
+        stream. frame is None for frames that are not sampled.
+        '''
+        frame_count = self._frame_count
+        sampled = frame_count % self.capture_rate == 0
+
+        if self.capture_mode == CAPTURE_GRAB:
+            if not cap.grab():
+                return False, None, frame_count, None
+            captured_at = time.time()
+            frame = None
+            if sampled:
+                ret, frame = cap.retrieve()
+                if ret is False:
+                    return False, None, frame_count, None
+        else:
+            ret, frame = cap.read()
+            if ret is False:
+                return False, None, frame_count, None
+            captured_at = time.time()
+            if not sampled:
+                frame = None
+
+        self._frame_count += 1
+        self._count_frame()
+        return True, frame, frame_count, captured_at
+
+    def _capture(self, cap):
+        '''Read and offer frames on this thread until the stream ends.'''
+        frames_read = 0
+        while not self._stop.is_set():
+            ok, frame, frame_count, captured_at = self._read_frame(cap)
+            if not ok:
+                break
+
+            frames_read += 1
+            if frame is not None:
+                self._offer(frame, frame_count, captured_at)
+
+        return frames_read
+
+    def _capture_latest(self, cap):
+        '''Read frames on a reader thread and offer only the newest sampled frame.'''
+        frames_read = [0]
+
+        def read_latest():
+            while not self._stop.is_set():
+                ok, frame, frame_count, captured_at = self._read_frame(cap)
+                if not ok:
+                    break
+
+                frames_read[0] += 1
+                if frame is not None:
+                    with self._latest_ready:
+                        if self._latest is not None:
+                            self.frames_superseded += 1
+                        self._latest = (frame, frame_count, captured_at)
+                        self._latest_ready.notify()
+
+            with self._latest_ready:
+                self._reader_done = True
+                self._latest_ready.notify()
+
+        self._latest = None
+        self._reader_done = False
+        reader = threading.Thread(target=read_latest, name='camera-{}-reader'.format(self.camera_id))
+        reader.daemon = True
+        reader.start()
+
+        while True:
+            with self._latest_ready:
+                while self._latest is None and not self._reader_done and not self._stop.is_set():
+                    self._latest_ready.wait()
+                latest, self._latest = self._latest, None
+
+            if latest is None:
+                break
+            self._offer(*latest)
+
+        reader.join()
+        return frames_read[0]
+
+    def _offer(self, frame, frame_count, captured_at):
+        if self.motion_gate is not None and not self.motion_gate.should_send(frame):
+            return
+
+        self.frames_sampled += 1
+        self.staleness = time.time() - captured_at
+        self.pipeline.offer(self.camera_id, frame, frame_count)
+
+    def _count_frame(self):
+        self.frames_read += 1
+        self._fps_window_frames += 1
+
+        elapsed = time.time() - self._fps_window_start
+        if elapsed >= 1.0:
+            self.fps = self._fps_window_frames / elapsed
+            self._fps_window_start = time.time()
+            self._fps_window_frames = 0
+
+    def stats(self):
+        return {
+            'fps': round(self.fps, 1),
+            'read': self.frames_read,
+            'sampled': self.frames_sampled,
+            'superseded': self.frames_superseded,
+            'reconnects': self.reconnects,
+            'staleness_secs': round(self.staleness, 3)
+        }
+
+
+class CaptureSupervisor(object):
+    '''Runs one CameraStream per camera, all feeding a single shared pipeline.'''
+
+    def __init__(self, streams, pipeline, stats_interval_secs=30.0):
+        self.streams = streams
+        self.pipeline = pipeline
+        self.stats_interval_secs = stats_interval_secs
+
+    def run(self):
+        '''Run until every stream has ended or the process is interrupted.'''
+        for stream in self.streams:
+            stream.start()
+
+        last_stats_ts = time.time()
+        try:
+            while any(stream.is_alive() for stream in self.streams):
+                time.sleep(0.1)
+                self.pipeline.tick()
+
+                if time.time() - last_stats_ts >= self.stats_interval_secs:
+                    self.print_stats()
+                    last_stats_ts = time.time()
+        except KeyboardInterrupt:
+            print("Stopping capture.")
+        finally:
+            for stream in self.streams:
+                stream.stop()
+            for stream in self.streams:
+                stream.join()
+
+    def print_stats(self):
+        for stream in self.streams:
+            camera_stats = stream.stats()
+            camera_stats.update(self.pipeline.camera_stats(stream.camera_id))
+            print("Camera '{}': {}".format(stream.camera_id, camera_stats))
@@ -0,0 +1,180 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+KEEP_LATEST_PER_CAMERA = 'keep-latest-per-camera'
+
+drop_policies = (DROP_OLDEST, DROP_NEWEST, KEEP_LATEST_PER_CAMERA)
+
+
+class FrameDispatcher(object):
+    '''Bounds the number of frames queued and in flight between capture and sending.
+
+    submit(camera_id, frame, frame_count, done) starts processing a frame (e.g. on a
+    Pool) and must arrange for done(success) to be called exactly once when the
+    frame is finished. A frame handed on to a later stage, such as a batching
+    sender, calls done.release() to free its place, then done(success) once the
+    later stage knows whether the frame was sent. At most max_in_flight frames are processing at a time; up to max_pending more wait in a
+    queue. When the queue is full, drop_policy decides which frame is dropped:
+
+    drop-oldest             the oldest waiting frame
+    drop-newest             the frame being offered
+    keep-latest-per-camera  the waiting frame from the same camera, if any, else the oldest
+
+    Counters are kept overall and per camera. A camera's lag is the time its last
+    finished frame spent between offer() and done(). Frames released but not yet
+    done are counted as sending.
+    '''
+
+    def __init__(self, submit, max_in_flight=6, max_pending=6, drop_policy=DROP_OLDEST):
+        if drop_policy not in drop_policies:
+            raise ValueError('Unknown drop policy "{}". Expected one of {}.'.format(drop_policy, drop_policies))
+
+        self.submit = submit
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.drop_policy = drop_policy
+
+        self.frames_offered = 0
+        self.frames_sent = 0
+        self.frames_failed = 0
+        self.frames_dropped = 0
+        self.frames_sending = 0
+
+        self._camera_counters = defaultdict(Counter)
+        self._camera_lag = {}
+
+        self._pending = deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def offer(self, camera_id, frame, frame_count):
+        '''Queue a frame for processing, dropping a frame if the queue is full.'''
+        with self._lock:
+            self.frames_offered += 1
+            self._camera_counters[camera_id]['offered'] += 1
+
+            if self.drop_policy == KEEP_LATEST_PER_CAMERA:
+                for index, pending in enumerate(self._pending):
+                    if pending[0] == camera_id:
+                        del self._pending[index]
+                        self._count_drop(camera_id)
+                        break
+
+            if len(self._pending) >= self.max_pending:
+                if self.drop_policy == DROP_NEWEST:
+                    self._count_drop(camera_id)
+                    return
+                self._count_drop(self._pending.popleft()[0])
+
+            self._pending.append((camera_id, frame, frame_count, time.time()))
+
+        self._submit_pending()
+
+    def _submit_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._in_flight >= self.max_in_flight:
+                    return
+                camera_id, frame, frame_count, offered_at = self._pending.popleft()
+                self._in_flight += 1
+
+            self.submit(camera_id, frame, frame_count, FrameDone(self, camera_id, offered_at))
+
+    def _count_drop(self, camera_id):
+        self.frames_dropped += 1
+        self._camera_counters[camera_id]['dropped'] += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.frames_sending += 1
+            self._idle.notify_all()
+
+        self._submit_pending()
+
+    def _done(self, camera_id, offered_at, success, released):
+        with self._lock:
+            if released:
+                self.frames_sending -= 1
+            else:
+                self._in_flight -= 1
+            if success:
+                self.frames_sent += 1
+                self._camera_counters[camera_id]['sent'] += 1
+            else:
+                self.frames_failed += 1
+                self._camera_counters[camera_id]['failed'] += 1
+            self._camera_lag[camera_id] = time.time() - offered_at
+            self._idle.notify_all()
+
+        if not released:
+            self._submit_pending()
+
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def wait_idle(self, timeout=None):
+        '''Wait until no frames are queued or in flight. Returns False on timeout.'''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'offered': self.frames_offered,
+                'sent': self.frames_sent,
+                'failed': self.frames_failed,
+                'dropped': self.frames_dropped,
+                'sending': self.frames_sending,
+                'pending': len(self._pending),
+                'in_flight': self._in_flight
+            }
+
+    def camera_stats(self, camera_id):
+        with self._lock:
+            counters = self._camera_counters[camera_id]
+            return {
+                'offered': counters['offered'],
+                'sent': counters['sent'],
+                'failed': counters['failed'],
+                'dropped': counters['dropped'],
+                'lag_secs': round(self._camera_lag.get(camera_id, 0.0), 3)
+            }
+
+
+class FrameDone(object):
+    '''The done callback FrameDispatcher passes to submit() with each frame.'''
+
+    def __init__(self, dispatcher, camera_id, offered_at):
+        self.dispatcher = dispatcher
+        self.camera_id = camera_id
+        self.offered_at = offered_at
+        self.released = False
+
+    def release(self):
+        '''Free the frame's place in the dispatcher before its outcome is known.'''
+        self.released = True
+        self.dispatcher._release()
+
+    def __call__(self, success):
+        self.dispatcher._done(self.camera_id, self.offered_at, success, self.released)
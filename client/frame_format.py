@@ -0,0 +1,34 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import struct
+
+# Binary frame envelope sent as the Kinesis record data. It must stay in sync
+# with lambda/imageprocessor/frame_format.py, which parses it.
+#
+# Fixed header (big-endian, 28 bytes):
+#   magic (4s) | version (B) | codec (B) | camera id length (H) |
+#   approximate capture time (d) | frame count (Q) | payload length (I)
+# followed by the utf-8 camera id and the encoded image payload.
+FRAME_MAGIC = b'RKVF'
+FRAME_FORMAT_VERSION = 1
+FRAME_HEADER = struct.Struct('>4sBBHdQI')
+
+CODEC_JPEG = 1
+
+
+def pack_frame(img_bytes, capture_ts, frame_count, camera_id='', codec=CODEC_JPEG):
+    '''Pack an encoded image and its metadata into a binary frame envelope.'''
+    camera_id_bytes = camera_id.encode('utf-8')
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC,
+        FRAME_FORMAT_VERSION,
+        codec,
+        len(camera_id_bytes),
+        capture_ts,
+        frame_count,
+        len(img_bytes)
+    )
+    return b''.join((header, camera_id_bytes, img_bytes))
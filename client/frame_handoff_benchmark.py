@@ -0,0 +1,116 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares handing decoded frames to Pool workers by pickling them with handing them
+over through a SharedFrameRing.
+
+usage: frame_handoff_benchmark.py [frames] [workers] [encode]
+
+For 720p, 1080p and 4K BGR frames of random pixels it prints the handoff latency (from
+apply_async until the worker has the frame and its result is back, one frame at
+a time), and the throughput and capture process CPU time per frame with up to
+two frames per worker in flight, each in its own slot. Workers only read
+the frame, so the figures are the cost of the handoff itself; pass "encode" to
+JPEG encode every frame as well.
+'''
+
+import sys
+import threading
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from frame_ring import SharedFrameRing, SharedFrameRef, read_shared_frame, start_resource_tracker
+
+resolutions = [('720p', 1280, 720), ('1080p', 1920, 1080), ('4K', 3840, 2160)]
+
+
+def worker_task(frame, encode):
+    if isinstance(frame, SharedFrameRef):
+        frame = read_shared_frame(frame)
+    if encode:
+        return len(cv2.imencode('.jpg', frame)[1])
+    return int(frame[::64, ::64].sum())
+
+
+def handoff_latency(pool, ring, frame, count, encode):
+    latencies = []
+    for index in range(count):
+        start = time.perf_counter()
+        if ring is None:
+            pool.apply(worker_task, (frame, encode))
+        else:
+            slot = ring.acquire()
+            pool.apply(worker_task, (ring.write(slot, frame), encode))
+            ring.release(slot)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def throughput(pool, ring, frame, count, in_flight, encode):
+    '''Returns frames/sec and capture process CPU secs per frame.'''
+    slots = threading.BoundedSemaphore(in_flight)
+    finished = threading.Event()
+    done = [0]
+    lock = threading.Lock()
+
+    def on_result(result, slot=None):
+        if slot is not None:
+            ring.release(slot)
+        slots.release()
+        with lock:
+            done[0] += 1
+            if done[0] == count:
+                finished.set()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for index in range(count):
+        slots.acquire()
+        if ring is None:
+            pool.apply_async(worker_task, (frame, encode), callback=on_result)
+        else:
+            slot = ring.acquire()
+            pool.apply_async(worker_task, (ring.write(slot, frame), encode),
+                             callback=lambda result, slot=slot: on_result(result, slot))
+    finished.wait()
+    wall_secs = time.perf_counter() - wall_start
+    cpu_secs = time.process_time() - cpu_start
+    return count / wall_secs, cpu_secs / count
+
+
+def main():
+    frame_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    encode = len(sys.argv) > 3 and sys.argv[3] == 'encode'
+
+    start_resource_tracker()
+    pool = Pool(processes=workers)
+    in_flight = workers * 2
+
+    print("{} frames, {} workers, {} frames in flight{}.".format(
+        frame_count, workers, in_flight, ', JPEG encoded' if encode else ''))
+    print("  {:<7}{:<8}{:>12}{:>10}{:>22}".format('', 'handoff', 'latency ms', 'frames/s', 'capture CPU ms/frame'))
+    for name, width, height in resolutions:
+        frame = np.random.RandomState(7).randint(0, 256, (height, width, 3)).astype(np.uint8)
+        for handoff in ['pickle', 'shared']:
+            ring = SharedFrameRing(in_flight, frame.nbytes) if handoff == 'shared' else None
+            #Warm up: workers attach the segment on their first frame
+            throughput(pool, ring, frame, workers * 2, in_flight, encode)
+            latency = handoff_latency(pool, ring, frame, max(10, frame_count // 5), encode)
+            fps, cpu_secs = throughput(pool, ring, frame, frame_count, in_flight, encode)
+            print("  {:<7}{:<8}{:>12.2f}{:>10.0f}{:>22.2f}".format(
+                name, handoff, latency * 1000, fps, cpu_secs * 1000))
+            if ring is not None:
+                ring.close()
+
+    pool.close()
+    pool.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import queue
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# What a Pool worker receives instead of the frame itself. Pickles to a few dozen bytes.
+SharedFrameRef = namedtuple('SharedFrameRef', ['shm_name', 'offset', 'shape', 'dtype'])
+
+# Shared memory segments attached by this (worker) process, by name.
+_attached_segments = {}
+
+
+def start_resource_tracker():
+    '''Start the shared memory resource tracker. Call before creating the Pool.
+
+    Workers then share the capture process's tracker. Otherwise each worker starts
+    its own, which unlinks the segments it attached to when the worker exits.
+    '''
+    resource_tracker.ensure_running()
+
+
+class SharedFrameRing(object):
+    '''Ring of shared-memory slots used to hand decoded frames to Pool workers.
+
+    The capture loop acquires a free slot, copies the frame into it and passes a
+    SharedFrameRef to the worker, which encodes straight from shared memory. The
+    slot is released (in the capture process) once the worker is done with it.
+    acquire() blocks while all slots are busy, which throttles the capture loop.
+    '''
+
+    def __init__(self, slot_count, slot_bytes):
+        self.slot_count = slot_count
+        self.slot_bytes = slot_bytes
+        self._shm = shared_memory.SharedMemory(create=True, size=slot_count * slot_bytes)
+        self._free = queue.Queue()
+        for slot in range(slot_count):
+            self._free.put(slot)
+
+    def fits(self, frame):
+        return frame.nbytes <= self.slot_bytes
+
+    def acquire(self, timeout=None):
+        '''Return a free slot index, or None if none became free within timeout seconds.'''
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def write(self, slot, frame):
+        '''Copy a frame into a slot and return the reference to pass to a worker.'''
+        offset = slot * self.slot_bytes
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._shm.buf, offset=offset)
+        view[...] = frame
+        return SharedFrameRef(self._shm.name, offset, frame.shape, frame.dtype.str)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def read_shared_frame(ref):
+    '''Return a numpy view of a frame in shared memory. Called in Pool workers.'''
+    shm = _attached_segments.get(ref.shm_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=ref.shm_name)
+        _attached_segments[ref.shm_name] = shm
+
+    return np.ndarray(ref.shape, dtype=ref.dtype, buffer=shm.buf, offset=ref.offset)
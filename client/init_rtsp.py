@@ -3,15 +3,21 @@
 #     http://aws.amazon.com/asl/
 # or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
 
-import sys
 import os
-import pickle
 import datetime
 import cv2
 import boto3
-import time
+import threading
 from multiprocessing import Pool
 import pytz
+from frame_format import pack_frame
+from kinesis_sender import KinesisBatchSender, LocalKinesisStub
+from motion_gate import MotionGate
+from adaptive_encoder import AdaptiveJpegEncoder
+from frame_dispatcher import FrameDispatcher
+from frame_ring import SharedFrameRing, SharedFrameRef, read_shared_frame, start_resource_tracker
+from partitioning import FramePartitioner
+from capture_supervisor import CameraStream, CaptureSupervisor, load_cameras
 
 # Set RSTP to use UDP instead of default TCP
 # os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;udp"
@@ -20,41 +26,158 @@ kinesis_client = boto3.client("kinesis")
 rekog_client = boto3.client("rekognition")
 
 camera_index = 0 # 0 is usually the built-in webcam
+camera_id = "camera0" # Identifies this camera in frame records
 default_capture_rate = 30 # Frame capture rate.. every X frames. Positive integer.
 rekog_max_labels = 123
 rekog_min_conf = 50.0
 
-#Send frame to Kinesis stream
-def encode_and_send_frame(frame, frame_count, enable_kinesis=True, enable_rekog=False, write_file=False):
-    try:
-        #convert opencv Mat to jpg image
-        #print "----FRAME---"
+# Capture several cameras at once by listing them in a JSON file, e.g.
+# {"cameras": [{"camera_id": "lobby", "url": "rtsp://...", "capture_rate": 30}]}
+# When empty, ip_cam_url in main() is captured as camera_id.
+camera_list_path = ""
+
+# A stream whose URL contains "://" is reopened after a failure, waiting
+# reconnect_min_backoff_secs at first and doubling up to
+# reconnect_max_backoff_secs. Local video files end at EOF unless the camera
+# entry sets "reconnect": true.
+reconnect_min_backoff_secs = 1.0
+reconnect_max_backoff_secs = 60.0
+
+# "grab" only decodes the frames sampled by capture_rate; "read" decodes every frame.
+capture_mode = "grab"
+
+# Read live streams (URLs containing "://") on a separate thread that keeps only
+# the newest sampled frame, so a stalled capture loop skips ahead to the live
+# picture instead of working through frames buffered by FFMPEG. A camera list
+# entry can override this with "latest_frame_only".
+enable_latest_frame_reader = True
+
+kinesis_stream_name = "FrameStream"
+kinesis_partition_key = "partitionkey"
+
+# How frames are spread over the shards of the Kinesis stream: "single" (every
+# frame uses kinesis_partition_key) or "camera" (keys derived from camera ids).
+# With "camera", each camera is spread over kinesis_sub_shards keys by frame
+# counter; 1 keeps its frames in order. A camera list entry can override this
+# with "kinesis_sub_shards". Set kinesis_shard_count to the stream's shard count
+# (KinesisShardCountParameter) to pin keys to shards evenly rather than by hash.
+kinesis_partition_strategy = "camera"
+kinesis_sub_shards = 1
+kinesis_shard_count = 0
+
+# Batch frames into PutRecords requests instead of one PutRecord per frame.
+# A batch is sent when it reaches the record count or byte limit, or when its
+# oldest frame has waited kinesis_batch_max_age_secs.
+enable_kinesis_batching = True
+kinesis_batch_max_records = 500
+kinesis_batch_max_bytes = 5 * 1024 * 1024
+kinesis_batch_max_age_secs = 1.0
+
+# Send frames to a local stub that records them, instead of to Kinesis.
+use_local_kinesis_stub = False
+
+# Only send sampled frames that differ from the last sent frame in at least
+# motion_area_threshold of their pixels. A frame is still sent every
+# motion_max_silence_secs seconds as a heartbeat.
+enable_motion_gate = False
+motion_area_threshold = 0.01 # Fraction of pixels that must change
+motion_pixel_threshold = 25 # Grayscale difference for a pixel to count as changed
+motion_max_silence_secs = 30.0
+
+# Hand sampled frames to Pool workers through a ring of shared memory slots
+# (one per in-flight frame) instead of pickling each decoded frame across a pipe.
+enable_shared_memory_handoff = True
+
+# At most max_frames_in_flight sampled frames are encoded/sent at a time and
+# max_frames_pending more wait for a worker. When the wait queue is full, a
+# frame is dropped according to frame_drop_policy: "drop-oldest",
+# "drop-newest" or "keep-latest-per-camera".
+max_frames_in_flight = 6
+max_frames_pending = 6
+frame_drop_policy = "drop-oldest"
+stats_interval_secs = 30.0 # How often frame counters are printed
+
+# Encode each frame at the highest JPEG quality that keeps it under
+# jpeg_max_bytes (the Kinesis record limit is 1 MB, including the frame header
+# and partition key), downscaling if even jpeg_min_quality is too large.
+enable_adaptive_jpeg = True
+jpeg_max_bytes = 1000 * 1024
+jpeg_initial_quality = 90
+jpeg_min_quality = 40
+jpeg_allow_downscale = True
+jpeg_stats_every_frames = 100 # How often each encoder worker prints its size/quality distribution
+
+# Adaptive encoder of this Pool worker process. Created on first use.
+adaptive_encoder = None
+
+def get_adaptive_encoder():
+    global adaptive_encoder
+    if adaptive_encoder is None:
+        adaptive_encoder = AdaptiveJpegEncoder(
+            jpeg_max_bytes,
+            initial_quality=jpeg_initial_quality,
+            min_quality=jpeg_min_quality,
+            allow_downscale=jpeg_allow_downscale
+        )
+    return adaptive_encoder
+
+def encode_frame(frame, frame_count, write_file=False, frame_camera_id=None):
+    '''Encode a frame as jpg and return the image bytes and the packed frame record.'''
+    if frame_camera_id is None:
+        frame_camera_id = camera_id
+
+    if isinstance(frame, SharedFrameRef):
+        frame = read_shared_frame(frame)
+
+    #convert opencv Mat to jpg image
+    #print "----FRAME---"
+    if enable_adaptive_jpeg:
+        encoder = get_adaptive_encoder()
+        buff = encoder.encode(frame, frame_camera_id)
+        if encoder.frames_encoded % jpeg_stats_every_frames == 0:
+            print("JPEG encoder (pid {}): {}".format(os.getpid(), encoder.stats()))
+    else:
         retval, buff = cv2.imencode(".jpg", frame)
 
-        img_bytes = bytearray(buff)
+    img_bytes = bytearray(buff)
+
+    utc_dt = pytz.utc.localize(datetime.datetime.now())
+    now_ts_utc = (utc_dt - datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)).total_seconds()
+
+    if write_file:
+        print("Writing file img_{}.jpg".format(frame_count))
+        target = open("img_{}.jpg".format(frame_count), 'wb')
+        target.write(img_bytes)
+        target.close()
 
-        utc_dt = pytz.utc.localize(datetime.datetime.now())
-        now_ts_utc = (utc_dt - datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)).total_seconds()
+    return img_bytes, pack_frame(img_bytes, now_ts_utc, frame_count, frame_camera_id)
 
-        frame_package = {
-            'ApproximateCaptureTime' : now_ts_utc,
-            'FrameCount' : frame_count,
-            'ImageBytes' : img_bytes
-        }
+#Encode frame for batched sending. Runs in a Pool worker; the result is handed to the batch sender in the main process.
+def encode_frame_for_batch(frame, frame_count, write_file=False, frame_camera_id=None):
+    try:
+        img_bytes, frame_data = encode_frame(frame, frame_count, write_file, frame_camera_id)
+        return frame_data
+    except Exception as e:
+        print(e)
+        return None
 
-        if write_file:
-            print("Writing file img_{}.jpg".format(frame_count))
-            target = open("img_{}.jpg".format(frame_count), 'wb')
-            target.write(img_bytes)
-            target.close()
+#Send frame to Kinesis stream. Returns False if the frame could not be sent.
+def encode_and_send_frame(frame, frame_count, enable_kinesis=True, enable_rekog=False, write_file=False,
+                          frame_camera_id=None, partition_key=kinesis_partition_key, explicit_hash_key=None):
+    try:
+        img_bytes, frame_data = encode_frame(frame, frame_count, write_file, frame_camera_id)
 
         #put encoded image in kinesis stream
         if enable_kinesis:
             print("Sending image to Kinesis")
+            record_args = {}
+            if explicit_hash_key is not None:
+                record_args['ExplicitHashKey'] = explicit_hash_key
             response = kinesis_client.put_record(
-                StreamName="FrameStream",
-                Data=pickle.dumps(frame_package),
-                PartitionKey="partitionkey"
+                StreamName=kinesis_stream_name,
+                Data=frame_data,
+                PartitionKey=partition_key,
+                **record_args
             )
             print(response)
 
@@ -68,8 +191,130 @@ def encode_and_send_frame(frame, frame_count, enable_kinesis=True, enable_rekog=
             )
             print(response)
 
+        return True
+
     except Exception as e:
         print(e)
+        return False
+
+
+class FramePipeline(object):
+    '''Encodes and sends sampled frames from any number of cameras.
+
+    One Pool of encoder workers, one batching Kinesis sender and one frame
+    dispatcher are shared by all cameras. offer() may be called from several
+    capture threads at once.
+    '''
+
+    def __init__(self, processes=3, camera_ids=(), camera_sub_shards=None):
+        if enable_shared_memory_handoff:
+            start_resource_tracker()
+        self.pool = Pool(processes=processes)
+
+        self.batch_sender = None
+        if enable_kinesis_batching:
+            self.batch_sender = KinesisBatchSender(
+                LocalKinesisStub(shard_count=kinesis_shard_count or 1) if use_local_kinesis_stub else kinesis_client,
+                kinesis_stream_name,
+                max_records=kinesis_batch_max_records,
+                max_bytes=kinesis_batch_max_bytes,
+                max_age_secs=kinesis_batch_max_age_secs
+            )
+
+        self.partitioner = FramePartitioner(
+            kinesis_partition_strategy,
+            sub_shards=kinesis_sub_shards,
+            shard_count=kinesis_shard_count,
+            camera_ids=camera_ids,
+            camera_sub_shards=camera_sub_shards,
+            fixed_key=kinesis_partition_key
+        )
+
+        self.frame_ring = None
+        self._ring_lock = threading.Lock()
+        self._sender_lock = threading.Lock()
+
+        self.dispatcher = FrameDispatcher(
+            self._submit_frame,
+            max_in_flight=max_frames_in_flight,
+            max_pending=max_frames_pending,
+            drop_policy=frame_drop_policy
+        )
+
+    def offer(self, frame_camera_id, frame, frame_count):
+        self.dispatcher.offer(frame_camera_id, frame, frame_count)
+
+    #Starts encoding (and sending) a frame on the Pool. done() is called from the
+    #Pool's result handler thread in this process once the worker is finished.
+    def _submit_frame(self, frame_camera_id, frame, frame_count, done):
+        task_frame = frame
+        slot = None
+        partition_key, explicit_hash_key = self.partitioner.partition(frame_camera_id)
+
+        if enable_shared_memory_handoff:
+            with self._ring_lock:
+                if self.frame_ring is None:
+                    self.frame_ring = SharedFrameRing(max_frames_in_flight, frame.nbytes)
+
+            #Frames larger than a slot (e.g. a camera with a higher resolution) are pickled as before.
+            #There is one slot per in-flight frame, so a fitting frame always gets one.
+            if self.frame_ring.fits(frame):
+                slot = self.frame_ring.acquire()
+                task_frame = self.frame_ring.write(slot, frame)
+
+        def on_result(result):
+            if slot is not None:
+                self.frame_ring.release(slot)
+            if self.batch_sender is not None and result is not None:
+                #The frame leaves the dispatcher's bound now, and is counted as sent once Kinesis accepts it
+                done.release()
+                with self._sender_lock:
+                    self.batch_sender.put(result, partition_key, explicit_hash_key, on_done=done)
+                return
+            done(result is not None and result is not False)
+
+        def on_error(e):
+            if slot is not None:
+                self.frame_ring.release(slot)
+            print(e)
+            done(False)
+
+        if self.batch_sender is not None:
+            self.pool.apply_async(encode_frame_for_batch, (task_frame, frame_count, False, frame_camera_id,),
+                                  callback=on_result, error_callback=on_error)
+        else:
+            self.pool.apply_async(encode_and_send_frame, (task_frame, frame_count, True, False, False, frame_camera_id,
+                                                          partition_key, explicit_hash_key,),
+                                  callback=on_result, error_callback=on_error)
+            # self.pool.apply_async(encode_and_send_frame, (task_frame, frame_count, True, False, True, frame_camera_id, partition_key, explicit_hash_key,), callback=on_result, error_callback=on_error) # Enable local image capture
+
+    def tick(self):
+        '''Send the pending Kinesis batch if its oldest frame is due. Call regularly.'''
+        if self.batch_sender is not None:
+            with self._sender_lock:
+                self.batch_sender.flush_if_due()
+
+    def camera_stats(self, frame_camera_id):
+        return self.dispatcher.camera_stats(frame_camera_id)
+
+    def close(self):
+        '''Wait for queued frames, then stop the workers and send what is left.'''
+        self.dispatcher.wait_idle()
+        self.pool.close()
+        self.pool.join()
+
+        if self.batch_sender is not None:
+            self.batch_sender.flush()
+            print("Sent {} frames to Kinesis in {} PutRecords requests ({} failed).".format(
+                self.batch_sender.sent_count, self.batch_sender.request_count, self.batch_sender.failed_count))
+
+        print("Frames: {}".format(self.dispatcher.stats()))
+
+        if self.batch_sender is not None and use_local_kinesis_stub:
+            print("Frames per shard: {}".format(self.batch_sender.kinesis_client.shard_counts))
+
+        if self.frame_ring is not None:
+            self.frame_ring.close()
 
 
 def main():
@@ -91,37 +336,57 @@ def main():
     # else:
     #     print("usage: video_cap_ipcam.py <ip-cam-rstp-url> [capture-rate]")
     #     return
-    
-    print("Capturing from '{}' at a rate of 1 every {} frames...".format(ip_cam_url, capture_rate))
-    cap = cv2.VideoCapture(str(ip_cam_url), cv2.CAP_FFMPEG) #Use RSTP URL from sys.argv[1] and FFMPEG
-    pool = Pool(processes=3)
-
-    frame_count = 0
-    while True:
-        # Capture frame-by-frame
-        ret, frame = cap.read()
-        #cv2.resize(frame, (640, 360));
-
-        if ret is False:
-            print("Debug: OpenCV returned 'False' value.")
-            break
-
-        if frame_count % capture_rate == 0:
-            result = pool.apply_async(encode_and_send_frame, (frame, frame_count, True, False, False,))
-            # result = pool.apply_async(encode_and_send_frame, (frame, frame_count, True, False, True,)) # Enable local image capture
-
-        frame_count += 1
-
-        # Display the resulting frame
-        # cv2.imshow('frame', frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    # When everything done, release the capture
-    cap.release()
-    cv2.destroyAllWindows()
+
+    if camera_list_path:
+        cameras = load_cameras(camera_list_path)
+    else:
+        cameras = [{"camera_id": camera_id, "url": ip_cam_url, "capture_rate": capture_rate}]
+
+    pipeline = FramePipeline(
+        processes=3,
+        camera_ids=[camera["camera_id"] for camera in cameras],
+        camera_sub_shards=dict((camera["camera_id"], camera["kinesis_sub_shards"])
+                               for camera in cameras if "kinesis_sub_shards" in camera)
+    )
+
+    streams = []
+    for camera in cameras:
+        motion_gate = None
+        if enable_motion_gate:
+            motion_gate = MotionGate(
+                area_threshold=motion_area_threshold,
+                pixel_threshold=motion_pixel_threshold,
+                max_silence_secs=motion_max_silence_secs
+            )
+
+        streams.append(CameraStream(
+            camera["camera_id"],
+            camera["url"],
+            pipeline,
+            capture_rate=camera.get("capture_rate", default_capture_rate),
+            motion_gate=motion_gate,
+            reconnect=camera.get("reconnect"),
+            min_backoff_secs=reconnect_min_backoff_secs,
+            max_backoff_secs=reconnect_max_backoff_secs,
+            capture_mode=camera.get("capture_mode", capture_mode),
+            latest_frame_only=camera.get("latest_frame_only",
+                                         enable_latest_frame_reader and '://' in camera["url"])
+        ))
+
+    supervisor = CaptureSupervisor(streams, pipeline, stats_interval_secs=stats_interval_secs)
+    supervisor.run()
+
+    # When everything done, stop the workers and send the remaining frames
+    pipeline.close()
+
+    supervisor.print_stats()
+    for stream in streams:
+        if stream.motion_gate is not None:
+            print("Motion gate '{}' forwarded {} of {} sampled frames ({} heartbeats).".format(
+                stream.camera_id, stream.motion_gate.frames_forwarded,
+                stream.motion_gate.frames_checked, stream.motion_gate.heartbeats))
+
     return
 
 if __name__ == '__main__':
     main()
-
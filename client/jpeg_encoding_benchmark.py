@@ -0,0 +1,108 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares fixed-quality JPEG encoding with AdaptiveJpegEncoder on sample frames.
+
+usage: jpeg_encoding_benchmark.py [frames] [video-file]
+
+Without a video file, 1080p and 4K clips are generated: a street scene whose
+sensor noise rises and falls again over the clip, as a scene gets busy and
+calms down. With a video file, its first frames are used. Each clip is encoded
+at OpenCV's default quality, as the client did before, and by an
+AdaptiveJpegEncoder with the client's default budget. It prints frames/sec,
+encodes per frame, mean and largest frame size, the frames over the budget and
+the qualities chosen.
+'''
+
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from adaptive_encoder import AdaptiveJpegEncoder
+
+max_bytes = 1000 * 1024
+
+
+def street_clip(frame_count, width, height):
+    rng = np.random.RandomState(7)
+    scene = np.zeros((height, width, 3), np.uint8)
+    scene[:] = (150, 160, 170)
+    scene[int(height * 0.7):] = (90, 90, 95)
+    for building in range(40):
+        left = rng.randint(0, width)
+        top = rng.randint(int(height * 0.15), int(height * 0.5))
+        color = tuple(int(channel) for channel in rng.randint(60, 200, 3))
+        cv2.rectangle(scene, (left, top), (left + rng.randint(width // 40, width // 8), int(height * 0.7)), color, -1)
+
+    frames = []
+    noise = np.empty(scene.shape, np.int16)
+    for index in range(frame_count):
+        #Noise rises to its peak in the middle of the clip, then falls again
+        sigma = 2 + 28 * (1 - abs(2.0 * index / max(1, frame_count - 1) - 1))
+        cv2.randn(noise, 0, sigma)
+        frames.append(cv2.add(scene, noise, dtype=cv2.CV_8U))
+    return frames
+
+
+def video_clip(path, frame_count):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < frame_count:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def fixed_quality(frames):
+    sizes = []
+    start = time.perf_counter()
+    for frame in frames:
+        retval, buff = cv2.imencode(".jpg", frame)
+        sizes.append(len(buff))
+    elapsed = time.perf_counter() - start
+    return {
+        'frames_per_sec': round(len(frames) / elapsed, 1),
+        'encodes_per_frame': 1.0,
+        'mean_bytes': sum(sizes) // len(sizes),
+        'max_bytes': max(sizes),
+        'over_budget': sum(1 for size in sizes if size > max_bytes)
+    }
+
+
+def adaptive(frames):
+    encoder = AdaptiveJpegEncoder(max_bytes)
+    start = time.perf_counter()
+    for frame in frames:
+        encoder.encode(frame, 'camera0')
+    elapsed = time.perf_counter() - start
+    result = {'frames_per_sec': round(len(frames) / elapsed, 1)}
+    result.update(encoder.stats())
+    result['encodes_per_frame'] = round(result['encodes_per_frame'], 2)
+    del result['frames']
+    return result
+
+
+def main():
+    frame_count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+
+    if len(sys.argv) > 2:
+        clips = [(sys.argv[2], video_clip(sys.argv[2], frame_count))]
+    else:
+        clips = [('1080p', street_clip(frame_count, 1920, 1080)), ('4K', street_clip(frame_count, 3840, 2160))]
+
+    print("Byte budget {} KB.".format(max_bytes // 1024))
+    for name, frames in clips:
+        print("{} ({} frames):".format(name, len(frames)))
+        print("  fixed quality: {}".format(fixed_quality(frames)))
+        print("  adaptive:      {}".format(adaptive(frames)))
+
+
+if __name__ == '__main__':
+    main()
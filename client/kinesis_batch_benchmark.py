@@ -0,0 +1,105 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares one PutRecord call per frame with PutRecords batching, against a local stub Kinesis.
+
+usage: kinesis_batch_benchmark.py [cameras] [frames-per-camera] [failure-rate] [latency-ms]
+
+Every camera sends its frames round-robin with the others, keyed by camera id.
+The stub rejects each entry with probability failure-rate and takes latency-ms
+per request, standing in for the HTTPS round trip. For each mode it prints the
+requests, frames per second, and how many frames were lost, duplicated or
+stored out of their camera's order. Only frames given up on after the retries
+may be lost, and none may be duplicated or stored out of order.
+'''
+
+import contextlib
+import io
+import sys
+import time
+from collections import Counter, defaultdict
+
+from kinesis_sender import KinesisBatchSender, LocalKinesisStub
+
+frame_bytes = 40 * 1024
+
+
+def frames(camera_count, frames_per_camera):
+    padding = b'\0' * frame_bytes
+    for index in range(frames_per_camera):
+        for camera in range(camera_count):
+            yield 'camera{}'.format(camera), '{}:{}:'.format(camera, index).encode('ascii') + padding
+
+
+def put_record_per_frame(stub, camera_count, frames_per_camera, max_retries=3, retry_backoff_secs=0.001):
+    requests = 0
+    given_up = 0
+    for partition_key, data in frames(camera_count, frames_per_camera):
+        for attempt in range(max_retries + 1):
+            if attempt > 0:
+                time.sleep(retry_backoff_secs * (2 ** (attempt - 1)))
+            requests += 1
+            if 'ErrorCode' not in stub.put_record(StreamName='FrameStream', Data=data, PartitionKey=partition_key):
+                break
+        else:
+            given_up += 1
+    return requests, given_up
+
+
+def put_records_batched(stub, camera_count, frames_per_camera):
+    sender = KinesisBatchSender(stub, 'FrameStream', max_age_secs=3600, retry_backoff_secs=0.001)
+    for partition_key, data in frames(camera_count, frames_per_camera):
+        sender.put(data, partition_key)
+    sender.flush()
+    return sender.request_count, sender.failed_count
+
+
+def check_stream(records, camera_count, frames_per_camera):
+    '''Return the frames lost, duplicated and stored before an earlier frame of their camera.'''
+    stored = Counter()
+    last_index = defaultdict(lambda: -1)
+    out_of_order = 0
+    for record in records:
+        camera, index = record['Data'].split(b':')[:2]
+        stored[camera, int(index)] += 1
+        out_of_order += int(index) < last_index[camera]
+        last_index[camera] = max(last_index[camera], int(index))
+
+    expected = camera_count * frames_per_camera
+    lost = expected - len(stored)
+    duplicated = sum(count - 1 for count in stored.values())
+    return lost, duplicated, out_of_order
+
+
+def main():
+    camera_count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    frames_per_camera = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    latency_secs = float(sys.argv[4]) / 1000 if len(sys.argv) > 4 else 0.02
+
+    modes = [
+        ('PutRecord per frame', lambda stub: put_record_per_frame(stub, camera_count, frames_per_camera)),
+        ('PutRecords', lambda stub: put_records_batched(stub, camera_count, frames_per_camera))
+    ]
+
+    print("{} cameras x {} frames of {} KB, {:.0%} of entries rejected, {:.0f} ms per request.".format(
+        camera_count, frames_per_camera, frame_bytes // 1024, failure_rate, latency_secs * 1000))
+    print("  {:<24}{:>10}{:>12}{:>8}{:>12}{:>14}".format(
+        'mode', 'requests', 'frames/s', 'lost', 'duplicated', 'out of order'))
+    for name, send in modes:
+        stub = LocalKinesisStub(failure_rate=failure_rate, latency_secs=latency_secs, seed=7)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            requests, given_up = send(stub)
+        elapsed = time.perf_counter() - start
+        lost, duplicated, out_of_order = check_stream(stub.records, camera_count, frames_per_camera)
+        print("  {:<24}{:>10}{:>12.0f}{:>8}{:>12}{:>14}".format(
+            name, requests, camera_count * frames_per_camera / elapsed, lost, duplicated, out_of_order))
+
+        assert (lost, duplicated, out_of_order) == (given_up, 0, 0), (name, lost, given_up, duplicated, out_of_order)
+
+
+if __name__ == '__main__':
+    main()
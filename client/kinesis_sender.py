@@ -0,0 +1,225 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import random
+import threading
+import time
+
+from partitioning import hash_key_for, shard_for_hash_key
+
+#PutRecords service limits
+max_batch_records = 500
+max_batch_bytes = 5 * 1024 * 1024
+max_record_bytes = 1024 * 1024
+
+
+class KinesisBatchSender(object):
+    '''Accumulates frame records and sends them to Kinesis through PutRecords.
+
+    A batch is flushed as soon as it reaches max_records or max_bytes, or when
+    flush_if_due() is called after its oldest record has waited max_age_secs.
+    Only the entries reported as failed by PutRecords are retried.
+
+    A batch is sent in one request, with each partition key's records in put
+    order, since Kinesis writes the records of a shard in request order. After
+    a partial failure, the rejected records are retried in put order, and
+    later batches are held back until they are accepted or given up on, so a
+    key's later records never overtake its rejected ones. A record accepted in
+    the same request after a rejected one of its key is still stored first.
+    Records are given up on after max_retries retries in a row accept none.
+
+    A record put with on_done has on_done(True) called once Kinesis accepts it,
+    or on_done(False) once it is dropped or given up on.
+    '''
+
+    def __init__(self, kinesis_client, stream_name, max_records=max_batch_records,
+                 max_bytes=max_batch_bytes, max_age_secs=1.0,
+                 max_retries=3, retry_backoff_secs=0.1):
+        self.kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.max_records = min(max_records, max_batch_records)
+        self.max_bytes = min(max_bytes, max_batch_bytes)
+        self.max_age_secs = max_age_secs
+        self.max_retries = max_retries
+        self.retry_backoff_secs = retry_backoff_secs
+
+        self.sent_count = 0
+        self.failed_count = 0
+        self.request_count = 0
+
+        self._records = []
+        self._bytes = 0
+        self._oldest_ts = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def put(self, data, partition_key, explicit_hash_key=None, on_done=None):
+        '''Add a record to the current batch, flushing if a size limit is reached.'''
+        #Kinesis counts the partition key towards the record and request size.
+        record_size = len(data) + len(partition_key.encode('utf-8'))
+        if record_size > max_record_bytes:
+            print("Dropping record of {} bytes. Kinesis records are limited to {} bytes.".format(
+                record_size, max_record_bytes))
+            self.failed_count += 1
+            if on_done is not None:
+                on_done(False)
+            return
+
+        batches = []
+        with self._lock:
+            if self._records and self._bytes + record_size > self.max_bytes:
+                batches.append(self._drain())
+
+            record = {'Data': data, 'PartitionKey': partition_key}
+            if explicit_hash_key is not None:
+                record['ExplicitHashKey'] = explicit_hash_key
+            self._records.append((record, on_done))
+            self._bytes += record_size
+            if self._oldest_ts is None:
+                self._oldest_ts = time.time()
+
+            if len(self._records) >= self.max_records or self._bytes >= self.max_bytes:
+                batches.append(self._drain())
+
+        for batch in batches:
+            self._send(batch)
+
+    def flush_if_due(self):
+        '''Flush the current batch if its oldest record is older than max_age_secs.'''
+        with self._lock:
+            if self._oldest_ts is None \
+                    or time.time() - self._oldest_ts < self.max_age_secs:
+                return
+            batch = self._drain()
+
+        self._send(batch)
+
+    def flush(self):
+        '''Flush the current batch regardless of its size or age.'''
+        with self._lock:
+            batch = self._drain()
+
+        if batch:
+            self._send(batch)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._records)
+
+    def _drain(self):
+        batch = self._records
+        self._records = []
+        self._bytes = 0
+        self._oldest_ts = None
+        return batch
+
+    def _send(self, batch):
+        #Serialize sends so records from one sender reach a shard in put order.
+        with self._send_lock:
+            self._put_records(batch)
+
+    def _put_records(self, entries):
+        pending = entries
+        #Retries only run out while no record is accepted, so a throttled
+        #shard that takes part of every request still gets all of its records.
+        retries = 0
+        while True:
+            self.request_count += 1
+            try:
+                response = self.kinesis_client.put_records(
+                    StreamName=self.stream_name,
+                    Records=[record for record, on_done in pending]
+                )
+            except Exception as e:
+                print(e)
+                failed = pending
+            else:
+                #Rejected entries keep their put order for the retry
+                failed = []
+                for entry, result in zip(pending, response['Records']):
+                    if result.get('ErrorCode'):
+                        failed.append(entry)
+                    elif entry[1] is not None:
+                        entry[1](True)
+                self.sent_count += len(pending) - len(failed)
+
+            if not failed:
+                return
+            if len(failed) < len(pending):
+                retries = 0
+            pending = failed
+            if retries == self.max_retries:
+                break
+            retries += 1
+            time.sleep(self.retry_backoff_secs * (2 ** (retries - 1)))
+
+        print("Giving up on {} records after {} retries.".format(len(pending), self.max_retries))
+        self.failed_count += len(pending)
+        for record, on_done in pending:
+            if on_done is not None:
+                on_done(False)
+
+
+class LocalKinesisStub(object):
+    '''Stand-in for the boto3 Kinesis client. Records calls instead of sending them.
+
+    Each PutRecords entry fails with ProvisionedThroughputExceededException with
+    probability failure_rate, which exercises the partial-failure retry path.
+    The later entries of a rejected entry's partition key in the same request
+    are rejected too, so a key's records are stored in request order.
+    Records are assigned to one of shard_count evenly split shards the way
+    Kinesis would, and counted per shard in shard_counts.
+    '''
+
+    def __init__(self, failure_rate=0.0, latency_secs=0.0, seed=None, shard_count=1):
+        self.failure_rate = failure_rate
+        self.latency_secs = latency_secs
+        self.shard_count = shard_count
+        self.records = []
+        self.shard_counts = [0] * shard_count
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def put_record(self, StreamName, Data, PartitionKey, ExplicitHashKey=None, **kwargs):
+        record = {'Data': Data, 'PartitionKey': PartitionKey}
+        if ExplicitHashKey is not None:
+            record['ExplicitHashKey'] = ExplicitHashKey
+        response = self.put_records(StreamName=StreamName, Records=[record])
+        return response['Records'][0]
+
+    def put_records(self, StreamName, Records):
+        if self.latency_secs:
+            time.sleep(self.latency_secs)
+
+        results = []
+        rejected_keys = set()
+        with self._lock:
+            self.calls += 1
+            for record in Records:
+                hash_key = record.get('ExplicitHashKey') or hash_key_for(record['PartitionKey'])
+                shard = shard_for_hash_key(hash_key, self.shard_count)
+                shard_id = 'shardId-{:012d}'.format(shard)
+
+                if record['PartitionKey'] in rejected_keys or self._random.random() < self.failure_rate:
+                    rejected_keys.add(record['PartitionKey'])
+                    results.append({
+                        'ErrorCode': 'ProvisionedThroughputExceededException',
+                        'ErrorMessage': 'Rate exceeded for shard {}'.format(shard_id)
+                    })
+                    continue
+
+                sequence_number = str(len(self.records))
+                self.records.append(record)
+                self.shard_counts[shard] += 1
+                results.append({
+                    'SequenceNumber': sequence_number,
+                    'ShardId': shard_id
+                })
+
+        return {
+            'FailedRecordCount': sum(1 for result in results if 'ErrorCode' in result),
+            'Records': results
+        }
@@ -0,0 +1,63 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import time
+import cv2
+
+
+class MotionGate(object):
+    '''Decides whether a captured frame shows enough change to be worth sending.
+
+    Frames are compared with the last forwarded frame on a small, blurred grayscale
+    copy. A frame is forwarded if the fraction of changed pixels reaches
+    area_threshold, or as a heartbeat if nothing was forwarded for max_silence_secs.
+    '''
+
+    def __init__(self, area_threshold=0.01, pixel_threshold=25, max_silence_secs=30.0, width=160):
+        self.area_threshold = area_threshold
+        self.pixel_threshold = pixel_threshold
+        self.max_silence_secs = max_silence_secs
+        self.width = width
+
+        self.frames_checked = 0
+        self.frames_forwarded = 0
+        self.frames_suppressed = 0
+        self.heartbeats = 0
+
+        self._reference = None
+        self._last_forwarded_ts = None
+
+    def _prepare(self, frame):
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def should_send(self, frame, now=None):
+        '''Return True if the frame should be forwarded.'''
+        now = time.time() if now is None else now
+        self.frames_checked += 1
+
+        gray = self._prepare(frame)
+
+        if self._reference is None or self._reference.shape != gray.shape:
+            moved = True
+        else:
+            diff = cv2.absdiff(gray, self._reference)
+            _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            moved = cv2.countNonZero(mask) >= self.area_threshold * mask.size
+
+        if not moved and now - self._last_forwarded_ts < self.max_silence_secs:
+            self.frames_suppressed += 1
+            return False
+
+        if not moved:
+            self.heartbeats += 1
+
+        self._reference = gray
+        self._last_forwarded_ts = now
+        self.frames_forwarded += 1
+        return True
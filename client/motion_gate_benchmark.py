@@ -0,0 +1,111 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Measures the motion gate's cost per frame and the frames it suppresses, on a synthetic video.
+
+usage: motion_gate_benchmark.py [seconds] [width] [height] [max-silence-secs]
+
+A video file is written with a static scene and sensor noise, through which a
+car drives twice and whose lighting drifts slowly. Every frame of the file is
+read back and checked by MotionGate, as the capture loop would with a
+capture_rate of 1. Frame times are taken from the video, so heartbeats follow
+its frame rate. It prints the gate's mean and 95th percentile time per frame,
+the frames forwarded, suppressed and sent as heartbeats, and how many of the
+frames with and without the car were forwarded. While the car moves, a frame is
+forwarded once it has moved far enough from the last forwarded frame.
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from motion_gate import MotionGate
+
+fps = 30
+
+
+def car_visible(index, frame_count):
+    '''The car drives through during the second and the fourth fifth of the video.'''
+    fifth = index * 5 // frame_count
+    return fifth in (1, 3)
+
+
+def write_video(path, frame_count, width, height):
+    rng = np.random.RandomState(7)
+    scene = np.zeros((height, width, 3), np.uint8)
+    scene[:] = (150, 160, 170)
+    scene[int(height * 0.7):] = (90, 90, 95)
+    for building in range(10):
+        left = rng.randint(0, width)
+        top = rng.randint(int(height * 0.15), int(height * 0.5))
+        color = tuple(int(channel) for channel in rng.randint(60, 200, 3))
+        cv2.rectangle(scene, (left, top), (left + rng.randint(width // 12, width // 5), int(height * 0.7)), color, -1)
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    #A few noise patterns, cycled, are enough to keep consecutive frames different
+    noise = [cv2.randn(np.empty(scene.shape, np.int16), 0, 6) for pattern in range(7)]
+    segment = frame_count // 5
+    for index in range(frame_count):
+        #Lighting drifts by 10% over the video
+        frame = cv2.convertScaleAbs(scene, alpha=1.0 - 0.1 * index / frame_count)
+        if car_visible(index, frame_count):
+            x = int((index % segment) / float(segment) * (width + width // 4)) - width // 4
+            cv2.rectangle(frame, (x, int(height * 0.78)), (x + width // 4, int(height * 0.9)), (210, 210, 215), -1)
+        frame = cv2.add(frame, noise[index % len(noise)], dtype=cv2.CV_8U)
+        writer.write(frame)
+    writer.release()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 1280
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 720
+    max_silence_secs = float(sys.argv[4]) if len(sys.argv) > 4 else 5.0
+
+    frame_count = int(seconds * fps)
+    work_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(work_dir, 'synthetic.avi')
+        write_video(path, frame_count, width, height)
+
+        gate = MotionGate(max_silence_secs=max_silence_secs)
+        cap = cv2.VideoCapture(path)
+        durations = []
+        forwarded_counts = {True: 0, False: 0}
+        frame_counts = {True: 0, False: 0}
+        index = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            start = time.perf_counter()
+            forwarded = gate.should_send(frame, now=index / float(fps))
+            durations.append(time.perf_counter() - start)
+            car = car_visible(index, frame_count)
+            frame_counts[car] += 1
+            forwarded_counts[car] += forwarded
+            index += 1
+        cap.release()
+    finally:
+        shutil.rmtree(work_dir)
+
+    durations.sort()
+    print("{} frames of {}x{} at {} fps, max_silence_secs {}.".format(index, width, height, fps, max_silence_secs))
+    print("Gate cost per frame: mean {:.3f} ms, p95 {:.3f} ms.".format(
+        sum(durations) * 1000 / len(durations), durations[int(len(durations) * 0.95)] * 1000))
+    print("Forwarded {} ({} heartbeats), suppressed {} ({:.0%}).".format(
+        gate.frames_forwarded, gate.heartbeats, gate.frames_suppressed,
+        gate.frames_suppressed / float(gate.frames_checked)))
+    print("Forwarded {} of {} frames without the car and {} of {} frames with the moving car.".format(
+        forwarded_counts[False], frame_counts[False], forwarded_counts[True], frame_counts[True]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Simulates how frames from N cameras spread over the shards of a Kinesis stream.
+
+usage: partition_simulation.py <cameras> <shards> [sub-shards] [frames-per-camera]
+
+Every camera sends the same number of frames. For each partitioning option it
+prints the frames per shard, the skew (busiest shard / average shard) and how
+many cameras were split across more than one shard (those cameras' frames are
+not processed in order).
+'''
+
+import sys
+from collections import defaultdict
+
+from partitioning import (FramePartitioner, PARTITION_SINGLE, PARTITION_CAMERA,
+                          hash_key_for, shard_for_hash_key)
+
+
+def simulate(camera_ids, shard_count, strategy, sub_shards, pinned, frames_per_camera):
+    partitioner = FramePartitioner(strategy, sub_shards=sub_shards,
+                                   shard_count=shard_count if pinned else None,
+                                   camera_ids=camera_ids)
+
+    shard_frames = [0] * shard_count
+    camera_shards = defaultdict(set)
+    for frame_index in range(frames_per_camera):
+        for camera_id in camera_ids:
+            partition_key, explicit_hash_key = partitioner.partition(camera_id)
+            hash_key = explicit_hash_key or hash_key_for(partition_key)
+            shard = shard_for_hash_key(hash_key, shard_count)
+            shard_frames[shard] += 1
+            camera_shards[camera_id].add(shard)
+
+    mean = float(sum(shard_frames)) / shard_count
+    return {
+        'strategy': '{}{}{}'.format(strategy, ' x{} sub-shards'.format(sub_shards) if sub_shards > 1 else '',
+                                    ' (pinned)' if pinned else ''),
+        'skew': round(max(shard_frames) / mean, 2),
+        'idle_shards': shard_frames.count(0),
+        'split_cameras': sum(1 for shards in camera_shards.values() if len(shards) > 1),
+        'shard_frames': shard_frames
+    }
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("usage: partition_simulation.py <cameras> <shards> [sub-shards] [frames-per-camera]")
+        return
+
+    camera_count = int(sys.argv[1])
+    shard_count = int(sys.argv[2])
+    sub_shards = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    frames_per_camera = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+
+    camera_ids = ['camera{}'.format(index) for index in range(camera_count)]
+
+    for strategy, strategy_sub_shards, pinned in [(PARTITION_SINGLE, 1, False),
+                                                  (PARTITION_CAMERA, 1, False), (PARTITION_CAMERA, sub_shards, False),
+                                                  (PARTITION_CAMERA, 1, True), (PARTITION_CAMERA, sub_shards, True)]:
+        print(simulate(camera_ids, shard_count, strategy, strategy_sub_shards, pinned, frames_per_camera))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import hashlib
+import threading
+from collections import Counter
+
+#Kinesis maps a record to a shard by the MD5 hash of its partition key (or its
+#ExplicitHashKey), a number in [0, 2**128).
+HASH_KEY_SPACE = 2 ** 128
+
+#"single" sends every frame with one fixed key, so everything lands on one shard.
+#"camera" derives the key from the camera id.
+PARTITION_SINGLE = 'single'
+PARTITION_CAMERA = 'camera'
+
+partition_strategies = (PARTITION_SINGLE, PARTITION_CAMERA)
+
+
+def shard_for_hash_key(hash_key, shard_count):
+    '''Return the index of the shard owning a hash key, for a stream with evenly split shards.'''
+    return int(hash_key) * shard_count // HASH_KEY_SPACE
+
+
+def hash_key_for(partition_key):
+    '''Return the hash key Kinesis derives from a partition key.'''
+    return int(hashlib.md5(partition_key.encode('utf-8')).hexdigest(), 16)
+
+
+def shard_hash_key(shard, shard_count):
+    '''Return the ExplicitHashKey in the middle of a shard's hash key range.'''
+    return str((2 * shard + 1) * HASH_KEY_SPACE // (2 * shard_count))
+
+
+class FramePartitioner(object):
+    '''Chooses the Kinesis partition key (and optionally ExplicitHashKey) of each frame.
+
+    With the "camera" strategy, a camera with one sub-shard uses its camera id as
+    the key, so its frames stay in order on one shard. A camera with more
+    sub-shards is spread over that many keys round-robin by a per-camera frame
+    counter, and its frames may be processed out of order. sub_shards applies to every camera not listed in
+    camera_sub_shards.
+
+    Partition keys are hashed, so a handful of cameras can easily land unevenly on
+    a handful of shards. When shard_count is set, each key (a camera, or a camera's
+    sub-shard) is instead pinned to a shard round-robin with an ExplicitHashKey,
+    which spreads the keys of this client evenly. This assumes the stream's shards
+    split the hash key range evenly, which is how CloudFormation creates them and
+    how UpdateShardCount rescales them. Clients do not coordinate, so several
+    clients each start their round-robin at a shard picked from their first camera id.
+    '''
+
+    def __init__(self, strategy=PARTITION_CAMERA, sub_shards=1, shard_count=None,
+                 camera_ids=(), camera_sub_shards=None, fixed_key='partitionkey'):
+        if strategy not in partition_strategies:
+            raise ValueError('Unknown partition strategy "{}". Expected one of {}.'.format(strategy, partition_strategies))
+
+        self.strategy = strategy
+        self.sub_shards = sub_shards
+        self.camera_sub_shards = camera_sub_shards or {}
+        self.shard_count = shard_count
+        self.fixed_key = fixed_key
+
+        self._shard_by_key = {}
+        self._next_shard = None
+        self._frame_counters = Counter()
+        self._lock = threading.Lock()
+        if shard_count:
+            for camera_id in camera_ids:
+                for frame_index in range(self._sub_shards(camera_id)):
+                    self._assign(self._key(camera_id, frame_index))
+
+    def _sub_shards(self, camera_id):
+        return max(1, self.camera_sub_shards.get(camera_id, self.sub_shards))
+
+    def _key(self, camera_id, frame_index):
+        if self.strategy == PARTITION_SINGLE:
+            return self.fixed_key
+
+        sub_shards = self._sub_shards(camera_id)
+        if sub_shards == 1:
+            return camera_id
+        return '{}-{}'.format(camera_id, frame_index % sub_shards)
+
+    def _assign(self, key):
+        with self._lock:
+            if key not in self._shard_by_key:
+                if self._next_shard is None:
+                    self._next_shard = shard_for_hash_key(hash_key_for(key), self.shard_count)
+                self._shard_by_key[key] = self._next_shard
+                self._next_shard = (self._next_shard + 1) % self.shard_count
+            return self._shard_by_key[key]
+
+    def partition(self, camera_id):
+        '''Return (partition_key, explicit_hash_key) for the next frame of a camera.
+
+        explicit_hash_key is None unless shard_count is set.
+        '''
+        with self._lock:
+            frame_index = self._frame_counters[camera_id]
+            self._frame_counters[camera_id] += 1
+
+        key = self._key(camera_id, frame_index)
+        if not self.shard_count:
+            return key, None
+        return key, shard_hash_key(self._assign(key), self.shard_count)
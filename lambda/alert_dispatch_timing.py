@@ -0,0 +1,119 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Times Image Processor batches against a slow SNS, with alerts published inline and
+on dispatch threads.
+
+usage: alert_dispatch_timing.py [sns-latency-secs] [batches] [records-per-batch]
+
+Every frame contains a watched label and the cooldown is off, so every batch sends
+an alert to a phone number and a topic. For each mode it prints the median time
+from the start of a batch until its frames are stored in S3 and DynamoDB, the
+median handler duration, and the dispatcher's counters.
+'''
+
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+from load_simulation import (LatencyRekognition, LatencyS3, LatencySNS, LatencyTable,
+                             synthetic_jpeg, frame_event, base_dir)
+
+import imageprocessor
+
+rekog_latency = 0.05
+s3_latency = 0.02
+ddb_latency = 0.02
+
+
+class TimedTable(LatencyTable):
+    '''Records when the last batch write of the current batch finished.'''
+
+    def batch_write_item(self, RequestItems):
+        response = LatencyTable.batch_write_item(self, RequestItems)
+        self.stored_at = time.time()
+        return response
+
+
+class TimedDynamoDB(object):
+
+    def __init__(self, latency_secs):
+        self.table = TimedTable('EnrichedFrame', latency_secs)
+
+    def Table(self, name):
+        return self.table
+
+
+def time_batches(config, sns_latency, batch_count, record_count, frames):
+    dynamodb = TimedDynamoDB(ddb_latency)
+    runtime = imageprocessor.RuntimeContext(
+        config,
+        rekog_client=LatencyRekognition(rekog_latency),
+        sns_client=LatencySNS(sns_latency),
+        s3_client=LatencyS3(s3_latency),
+        dynamodb=dynamodb
+    )
+    imageprocessor.reset_runtime(runtime)
+
+    persist_secs = []
+    handler_secs = []
+    for batch in range(batch_count):
+        event = frame_event(frames, batch * record_count, record_count, camera_count=4)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.time()
+            imageprocessor.handler(event, None)
+            end = time.time()
+        persist_secs.append(dynamodb.table.stored_at - start)
+        handler_secs.append(end - start)
+
+    dispatcher = runtime.alert_notifier.dispatcher
+    stats = dispatcher.stats() if dispatcher is not None else {}
+    #Let the last alerts go out before the next mode starts.
+    with contextlib.redirect_stdout(io.StringIO()):
+        runtime.alert_notifier.flush(sns_latency * 10)
+    return median(persist_secs), median(handler_secs), stats
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main():
+    sns_latency = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    batch_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    record_count = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    with open(os.path.join(base_dir, '..', 'config', 'imageprocessor-params.json'), 'r') as params_file:
+        config = json.loads(params_file.read())
+    config.update({
+        'label_watch_list': ['Car'],
+        'label_watch_min_conf': 90.0,
+        'label_watch_cooldown_secs': 0,
+        'label_watch_state_table': '',
+        'frame_dedup_enabled': False
+    })
+    frames = [synthetic_jpeg(index, 320, 240) for index in range(8)]
+
+    print("{} batches of {} records, SNS publish latency {} s.".format(batch_count, record_count, sns_latency))
+
+    modes = [
+        ('no alerts', {'label_watch_phone_num': '', 'label_watch_sns_topic_arn': ''}),
+        ('inline', {'label_watch_dispatch_threads': 0}),
+        ('dispatch threads', {'label_watch_dispatch_threads': 2, 'label_watch_flush_timeout_secs': 2 * sns_latency}),
+        ('dispatch, no wait', {'label_watch_dispatch_threads': 2, 'label_watch_flush_timeout_secs': 0})
+    ]
+    for name, overrides in modes:
+        mode_config = dict(config, label_watch_phone_num='+15555550100',
+                           label_watch_sns_topic_arn='arn:aws:sns:us-east-1:000000000000:alerts')
+        mode_config.update(overrides)
+        persist, handler, stats = time_batches(mode_config, sns_latency, batch_count, record_count, frames)
+        print("{:<18} stored after {:.3f} s, handler {:.3f} s {}".format(name + ':', persist, handler, stats or ''))
+
+
+if __name__ == '__main__':
+    main()
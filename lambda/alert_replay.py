@@ -0,0 +1,155 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Replays a sequence of Watch List detections and counts the SNS messages published.
+
+usage: alert_replay.py [fps] [batch-secs]
+
+Frames of every camera arrive at fps and are processed in batches of batch-secs
+seconds. The count from before alert rate limiting (one message per frame with a
+watched label, per alert target) is printed first, then the count for several
+cooldowns, with one Image Processor container and with two concurrent ones.
+Last, SNS fails every publish for the first outage_secs seconds, and the first
+alert must go out as soon as it recovers rather than after the cooldown.
+'''
+
+import contextlib
+import io
+import os
+import sys
+
+import pytz
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'imageprocessor'))
+
+from label_enrichment import WatchListMatcher, enrich_labels
+from watch_list_alerts import AlertDigest, AlertDispatcher, AlertNotifier, InMemoryAlertStore
+
+watch_list = ["Human", "Car", "Dog"]
+min_conf = 80.0
+
+#(camera id, label, confidence, first second, last second)
+detection_sequence = [
+    ('front-door', 'Human', 97.0, 0, 60),    #Someone standing at the door for a minute
+    ('front-door', 'Human', 95.0, 200, 230),
+    ('front-door', 'Human', 92.0, 500, 520),
+    ('driveway', 'Car', 99.0, 30, 330),      #A car parked for five minutes
+    ('driveway', 'Dog', 88.0, 100, 110),
+    ('driveway', 'Human', 70.0, 140, 150),   #Below the threshold
+]
+duration_secs = 600
+cooldowns = [0, 60, 300]
+outage_secs = 20
+
+
+class CountingSNS(object):
+
+    def __init__(self):
+        self.published = 0
+        self.published_at = []
+        #Replay time, set before each batch is notified
+        self.now = 0
+
+    def publish(self, **kwargs):
+        self.published += 1
+        self.published_at.append(self.now)
+        return {'MessageId': str(self.published)}
+
+
+class FlakySNS(CountingSNS):
+    '''Fails every publish before outage_until, in replay time.'''
+
+    def __init__(self, outage_until):
+        CountingSNS.__init__(self)
+        self.outage_until = outage_until
+
+    def publish(self, **kwargs):
+        if self.now < self.outage_until:
+            raise ConnectionError('Injected SNS outage')
+        return CountingSNS.publish(self, **kwargs)
+
+
+def replay_frames(fps):
+    '''Yield (capture time, camera id, DetectLabels labels) for every frame.'''
+    camera_ids = sorted(set(detection[0] for detection in detection_sequence))
+    for frame_index in range(int(duration_secs * fps)):
+        frame_ts = float(frame_index) / fps
+        for camera_id in camera_ids:
+            labels = [{'Name': label, 'Confidence': conf, 'Instances': [], 'Parents': []}
+                      for detection_camera_id, label, conf, first_sec, last_sec in detection_sequence
+                      if detection_camera_id == camera_id and first_sec <= frame_ts <= last_sec]
+            yield frame_ts, camera_id, labels
+
+
+def replay(fps, batch_secs, cooldown_secs, containers, shared_store=True, sns_client=None, dispatch=False):
+    '''Returns the SNS stand-in. Batches are handed to the containers in turn.'''
+    matcher = WatchListMatcher(watch_list, min_conf)
+    sns_client = sns_client or CountingSNS()
+    #A store shared by all containers stands in for the DynamoDB state table.
+    store = InMemoryAlertStore()
+    notifiers = [AlertNotifier(sns_client, store if shared_store else InMemoryAlertStore(), cooldown_secs, pytz.utc,
+                               phone_num='+15555550100', sns_topic_arn='arn:aws:sns:us-east-1:000000000000:alerts',
+                               dispatcher=AlertDispatcher(sns_client, threads=1, max_attempts=1) if dispatch else None)
+                 for container in range(containers)]
+
+    def notify(digest, now):
+        notifier = notifiers[batch_index % containers]
+        sns_client.now = now
+        notifier.notify(digest, now)
+        notifier.flush(5.0)
+
+    batch_index = 0
+    digest = AlertDigest()
+    batch_end = batch_secs
+    for frame_ts, camera_id, labels in replay_frames(fps):
+        if frame_ts >= batch_end:
+            notify(digest, batch_end)
+            batch_index += 1
+            digest = AlertDigest()
+            batch_end += batch_secs
+
+        watched = enrich_labels(labels, matcher)[1]
+        if watched:
+            digest.add(frame_ts, camera_id, watched, frame_ts)
+
+    notify(digest, batch_end)
+    return sns_client
+
+
+def legacy_publishes(fps):
+    '''One message per frame with a watched label, to both the phone number and the topic.'''
+    matcher = WatchListMatcher(watch_list, min_conf)
+    return sum(2 for frame_ts, camera_id, labels in replay_frames(fps) if enrich_labels(labels, matcher)[1])
+
+
+def main():
+    fps = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    batch_secs = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    print("Replaying {} seconds at {} frames/sec per camera, {} second batches, alerting to a phone number and a topic.".format(
+        duration_secs, fps, batch_secs))
+    print("One message per frame: {} published".format(legacy_publishes(fps)))
+
+    for cooldown_secs in cooldowns:
+        with contextlib.redirect_stdout(io.StringIO()):
+            single = replay(fps, batch_secs, cooldown_secs, 1).published
+            separate = replay(fps, batch_secs, cooldown_secs, 2, shared_store=False).published
+            shared = replay(fps, batch_secs, cooldown_secs, 2).published
+        print("Digests, {:>3} s cooldown: {:>4} published, two containers: {:>4} with in-memory history, {:>4} with the state table".format(
+            cooldown_secs, single, separate, shared))
+
+    #Claims of alerts that were not published are released, so the outage does not start a cooldown
+    for dispatch in [False, True]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sns_client = replay(fps, batch_secs, cooldowns[-1], 1, sns_client=FlakySNS(outage_secs), dispatch=dispatch)
+        first_alert = min(sns_client.published_at)
+        print("SNS down for the first {} s, {} s cooldown, alerts {}: first alert at {} s".format(
+            outage_secs, cooldowns[-1], 'on dispatch threads' if dispatch else 'inline', first_alert))
+        assert first_alert < outage_secs + batch_secs, first_alert
+
+
+if __name__ == '__main__':
+    main()
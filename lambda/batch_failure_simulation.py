@@ -0,0 +1,233 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Injects failures into Image Processor batches and checks the batchItemFailures
+it reports to AWS Lambda.
+
+usage: batch_failure_simulation.py [records-per-batch]
+
+Every scenario runs a batch of records through the handler with stand-ins for
+Amazon Rekognition, S3 and DynamoDB, once with records processed one after
+another and once concurrently, with the failure injected at the first, a middle
+and the last record. Failures that cannot succeed on retry (poison records,
+frames Rekognition rejects) must be skipped; other failures must be reported as
+the first failed record, with the items of the records before it stored and
+nothing of the records after it.
+'''
+
+import base64
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from load_simulation import synthetic_jpeg, pack_frame, base_dir
+
+import imageprocessor
+
+
+def client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': 'Injected {}'.format(code)}}, operation)
+
+
+class FaultyRekognition(object):
+    '''Raises the injected error for the frames of the given records.'''
+
+    def __init__(self, frames, failures):
+        self.record_of_frame = {frame: index for index, frame in enumerate(frames)}
+        self.failures = failures
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def detect_labels(self, Image, **kwargs):
+        index = self.record_of_frame[bytes(Image['Bytes'])]
+        with self._lock:
+            self.calls.append(index)
+        if index in self.failures:
+            raise self.failures[index]
+        return {'Labels': [{'Name': 'Car', 'Confidence': 91.5, 'Instances': [], 'Parents': []}]}
+
+
+class FaultyS3(object):
+
+    def __init__(self, frames, failures):
+        self.record_of_frame = {frame: index for index, frame in enumerate(frames)}
+        self.failures = failures
+        self.keys = set()
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        index = self.record_of_frame[bytes(Body)]
+        if index in self.failures:
+            raise self.failures[index]
+        with self._lock:
+            self.keys.add(Key)
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.keys.discard(Key)
+        return {}
+
+
+class FaultyTable(object):
+    '''Leaves the items of the given frames unprocessed, on every attempt or only the first.
+    The first requests_timing_out requests time out instead.'''
+
+    def __init__(self, name, unprocessed_frame_ids, attempts_unprocessed, requests_timing_out=0):
+        self.name = name
+        self.meta = SimpleNamespace(client=self)
+        self.unprocessed_frame_ids = unprocessed_frame_ids
+        self.attempts_unprocessed = attempts_unprocessed
+        self.requests_timing_out = requests_timing_out
+        self.attempts = {}
+        self.items = {}
+
+    def batch_write_item(self, RequestItems):
+        if self.requests_timing_out > 0:
+            self.requests_timing_out -= 1
+            raise ReadTimeoutError(endpoint_url='https://dynamodb.us-east-1.amazonaws.com')
+        unprocessed = []
+        for request in RequestItems[self.name]:
+            item = request['PutRequest']['Item']
+            attempt = self.attempts[item['frame_id']] = self.attempts.get(item['frame_id'], 0) + 1
+            if item['frame_id'] in self.unprocessed_frame_ids and attempt <= self.attempts_unprocessed:
+                unprocessed.append(request)
+            else:
+                self.items[item['frame_id']] = item
+        return {'UnprocessedItems': {self.name: unprocessed} if unprocessed else {}}
+
+
+class FaultyDynamoDB(object):
+
+    def __init__(self, table):
+        self.table = table
+
+    def Table(self, name):
+        return self.table
+
+
+def frame_id(record):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, record['eventID']))
+
+
+def build_event(frames, poison):
+    records = []
+    for index, frame in enumerate(frames):
+        data = b'\x80\x04garbage' if index in poison else pack_frame(frame, time.time(), index, 'camera0')
+        records.append({
+            'eventID': 'shardId-000000000000:{}'.format(1000 + index),
+            'kinesis': {
+                'data': base64.b64encode(data).decode('ascii'),
+                'partitionKey': 'camera0',
+                'sequenceNumber': str(1000 + index)
+            }
+        })
+    return {'Records': records}
+
+
+def run_batch(config, frames, poison=(), rekog_failures=None, s3_failures=None,
+              unprocessed=(), attempts_unprocessed=0, ddb_timeouts=0):
+    event = build_event(frames, poison)
+    records = event['Records']
+    rekognition = FaultyRekognition(frames, rekog_failures or {})
+    s3 = FaultyS3(frames, s3_failures or {})
+    table = FaultyTable(config['ddb_table'], set(frame_id(records[index]) for index in unprocessed),
+                        attempts_unprocessed, ddb_timeouts)
+    imageprocessor.reset_runtime(imageprocessor.RuntimeContext(
+        config, rekog_client=rekognition, sns_client=SimpleNamespace(), s3_client=s3, dynamodb=FaultyDynamoDB(table)))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = imageprocessor.handler(event, None)
+    finally:
+        imageprocessor.reset_runtime()
+
+    stored = sorted(index for index, record in enumerate(records) if frame_id(record) in table.items)
+    return response, stored, rekognition, s3
+
+
+def failures_at(index):
+    return {'batchItemFailures': [{'itemIdentifier': str(1000 + index)}]}
+
+
+def check_scenarios(config, frames, concurrent):
+    count = len(frames)
+    everything = list(range(count))
+    rejected = client_error('InvalidImageFormatException', 'DetectLabels')
+    for k in [0, count // 2, count - 1]:
+        before = list(range(k))
+        without_k = [index for index in everything if index != k]
+
+        #Skipped: the rest of the batch is stored
+        response, stored, rekognition, s3 = run_batch(config, frames, poison={k})
+        assert response == {'batchItemFailures': []}, ('poison', k, response)
+        assert stored == without_k, ('poison', k, stored)
+
+        response, stored, rekognition, s3 = run_batch(config, frames, rekog_failures={k: rejected})
+        assert response == {'batchItemFailures': []}, ('rejected', k, response)
+        assert stored == without_k, ('rejected', k, stored)
+        assert len(s3.keys) == count - 1, ('rejected frame left in S3', k)
+
+        #Retried from the first failed record
+        for name, kwargs in [('throttled', {'rekog_failures': {k: client_error('ThrottlingException', 'DetectLabels')}}),
+                             ('timeout', {'rekog_failures': {k: TimeoutError('Injected timeout')}}),
+                             ('s3', {'s3_failures': {k: client_error('SlowDown', 'PutObject')}}),
+                             ('ddb', {'unprocessed': {k}, 'attempts_unprocessed': 100})]:
+            response, stored, rekognition, s3 = run_batch(config, frames, **kwargs)
+            assert response == failures_at(k), (name, k, response)
+            if name == 'ddb':
+                #Items after k went out in the same BatchWriteItem; the retry overwrites them
+                assert k not in stored and set(before) <= set(stored), (name, k, stored)
+            else:
+                assert stored == before, (name, k, stored)
+            if not concurrent and name != 'ddb':
+                #Records after the failure are not sent to Rekognition before the retry
+                assert max(rekognition.calls) <= k, (name, k, rekognition.calls)
+
+        #Unprocessed on the first attempt only: the retry within the batch succeeds
+        response, stored, rekognition, s3 = run_batch(config, frames, unprocessed={k}, attempts_unprocessed=1)
+        assert response == {'batchItemFailures': []}, ('ddb retried', k, response)
+        assert stored == everything
+
+    #BatchWriteItem requests time out: retried within the batch, then the whole chunk is reported
+    response, stored, rekognition, s3 = run_batch(config, frames, ddb_timeouts=2)
+    assert response == {'batchItemFailures': []}, ('ddb timeout retried', response)
+    assert stored == everything
+    response, stored, rekognition, s3 = run_batch(config, frames, ddb_timeouts=100)
+    assert response == failures_at(0), ('ddb timeouts', response)
+    assert stored == [], ('ddb timeouts', stored)
+
+    #Two failures: the earlier one is reported, wherever the later one is
+    response, stored, rekognition, s3 = run_batch(
+        config, frames, poison={1}, unprocessed={count - 2},
+        rekog_failures={count // 2: client_error('ThrottlingException', 'DetectLabels')}, attempts_unprocessed=100)
+    assert response == failures_at(count // 2), response
+
+
+def main():
+    record_count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+
+    with open(os.path.join(base_dir, '..', 'config', 'imageprocessor-params.json'), 'r') as params_file:
+        config = json.loads(params_file.read())
+    config = dict(config, frame_dedup_enabled=False, label_watch_list=[], ddb_batch_backoff_secs=0.001)
+    frames = [synthetic_jpeg(index, 160, 120) for index in range(record_count)]
+
+    for record_concurrency in [1, record_count]:
+        check_scenarios(dict(config, record_concurrency=record_concurrency), frames, record_concurrency > 1)
+        print("record_concurrency {}: poison records and rejected frames skipped; throttled and timed out "
+              "Rekognition calls, failed S3 uploads, unprocessed DynamoDB items and timed out BatchWriteItem "
+              "requests reported as the first failed record, at the first, middle and last of {} records".format(
+                  record_concurrency, record_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Checks Frame Fetcher's conditional GET (ETag, If-None-Match, 304) and gzip
+responses, and measures how much they reduce the bytes sent.
+
+usage: conditional_get_simulation.py [labels-per-frame] [frames]
+
+Frames with synthetic Amazon Rekognition labels are stored in a stand-in
+DynamoDB table and index (see frame_projection_benchmark.py), and the handler
+is called with API Gateway proxy events.
+'''
+
+import base64
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+from frame_projection_benchmark import FrameDynamoDB, StubPresigner, store_frames
+from frame_query_simulation import StandInIndex, StandInTable
+
+import framefetcher
+
+accept_gzip = 'gzip, deflate, br'
+
+
+class CountingPresigner(StubPresigner):
+    '''Presigns URLs that differ from those of other containers, and counts them.'''
+
+    def __init__(self, container):
+        self.container = container
+        self.calls = 0
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        self.calls += 1
+        url = super(CountingPresigner, self).generate_presigned_url(ClientMethod, Params, ExpiresIn)
+        return '{}&X-Amz-Date={}'.format(url, self.container)
+
+
+def get(query=None, path=None, headers=None):
+    event = {'httpMethod': 'GET', 'queryStringParameters': query, 'pathParameters': path, 'headers': headers}
+    with contextlib.redirect_stdout(io.StringIO()):
+        return framefetcher.handler(event, None)
+
+
+def decoded_body(response):
+    if response.get('isBase64Encoded'):
+        assert response['headers']['Content-Encoding'] == 'gzip'
+        return gzip.decompress(base64.b64decode(response['body'])).decode('utf-8')
+    return response['body']
+
+
+def sent_bytes(response):
+    '''Bytes of the body as sent to the client, after API Gateway decodes base64.'''
+    if response.get('isBase64Encoded'):
+        return len(base64.b64decode(response['body']))
+    return len(response['body'].encode('utf-8'))
+
+
+def check_not_modified(store_more, new_container):
+    first = get({'limit': '3'})
+    assert first['statusCode'] == '200'
+    etag = first['headers']['ETag']
+    assert etag.startswith('W/"')
+
+    #The same tag whatever the header's case, in a list, or compared weakly
+    for headers in [{'If-None-Match': etag},
+                    {'if-none-match': etag},
+                    {'If-None-Match': 'W/"other", ' + etag},
+                    {'If-None-Match': etag[2:]},
+                    {'If-None-Match': '*'}]:
+        response = get({'limit': '3'}, headers=headers)
+        assert response['statusCode'] == '304', headers
+        assert response['body'] == ''
+        assert response['headers']['ETag'] == etag
+        assert response['headers']['Access-Control-Allow-Origin'] == '*'
+        assert 'X-Next-Since' in response['headers']
+
+    #Another container presigns other URLs, but tags the pages the same and presigns none for a 304
+    first_detail = get(path={'frame_ids': json.loads(first['body'])[0]['frame_id']})
+    presigner = new_container()
+    for query, path, response in [({'limit': '3'}, None, first), (None, {'frame_ids': json.loads(first['body'])[0]['frame_id']}, first_detail)]:
+        not_modified = get(query, path, headers={'If-None-Match': response['headers']['ETag']})
+        assert not_modified['statusCode'] == '304', (query, path)
+    assert presigner.calls == 0, 'URLs presigned for a 304'
+    response = get({'limit': '3'})
+    assert response['headers']['ETag'] == etag and response['body'] != first['body']
+    assert presigner.calls == 3
+
+    #Other tags, other pages and errors are answered in full
+    assert get({'limit': '3'}, headers={'If-None-Match': 'W/"other"'})['statusCode'] == '200'
+    assert get({'limit': '4'}, headers={'If-None-Match': etag})['statusCode'] == '200'
+    response = get({'limit': '0'}, headers={'If-None-Match': '*'})
+    assert response['statusCode'] == '400' and 'ETag' not in response['headers']
+
+    #The tag changes once a new frame is stored
+    store_more()
+    response = get({'limit': '3'}, headers={'If-None-Match': etag})
+    assert response['statusCode'] == '200' and response['headers']['ETag'] != etag
+
+    #Compression does not change the tag
+    response = get({'limit': '3'}, headers={'Accept-Encoding': accept_gzip})
+    assert get({'limit': '3'}, headers={'Accept-Encoding': accept_gzip, 'If-None-Match': response['headers']['ETag']})['statusCode'] == '304'
+    print("If-None-Match: 304 with no body for a matching tag, 200 otherwise and after a new frame; "
+          "the same tags in another container, and no URLs presigned for a 304")
+
+
+def check_gzip(gzip_min_bytes):
+    identity = get({'limit': '25'})
+    for accept_encoding in ['gzip', accept_gzip, 'GZIP;q=0.5', '*']:
+        response = get({'limit': '25'}, headers={'Accept-Encoding': accept_encoding})
+        assert response.get('isBase64Encoded'), accept_encoding
+        assert response['headers']['Vary'] == 'Accept-Encoding'
+        assert decoded_body(response) == identity['body']
+    for accept_encoding in [None, 'identity', 'gzip;q=0', 'br']:
+        response = get({'limit': '25'}, headers={'Accept-Encoding': accept_encoding} if accept_encoding else None)
+        assert not response.get('isBase64Encoded'), accept_encoding
+
+    #Small bodies are not worth compressing
+    response = get({'limit': '1', 'since': str(time.time())}, headers={'Accept-Encoding': accept_gzip})
+    assert len(response['body']) < gzip_min_bytes and not response.get('isBase64Encoded')
+    print("gzip: bodies of at least {} bytes compressed when accepted, and decompress to the same JSON".format(gzip_min_bytes))
+
+
+def measure(frames):
+    print("Bytes sent:")
+    cases = [('list, limit 3', {'limit': '3'}, None),
+             ('list, limit 100', {'limit': '100'}, None),
+             ('detail, 1 frame', None, {'frame_ids': frames[0]['frame_id']}),
+             ('detail, 25 frames', None, {'frame_ids': ','.join(frame['frame_id'] for frame in frames[:25])})]
+    for name, query, path in cases:
+        identity = get(query, path)
+        start = time.perf_counter()
+        compressed = get(query, path, {'Accept-Encoding': accept_gzip})
+        compressed_secs = time.perf_counter() - start
+        start = time.perf_counter()
+        get(query, path)
+        identity_secs = time.perf_counter() - start
+        not_modified = get(query, path, {'Accept-Encoding': accept_gzip, 'If-None-Match': identity['headers']['ETag']})
+        assert not_modified['statusCode'] == '304'
+        print("  {:<18} identity {:>7}, gzip {:>6} ({:>4.1f}%, +{:.2f} ms), not modified {}".format(
+            name + ':', sent_bytes(identity), sent_bytes(compressed),
+            100.0 * sent_bytes(compressed) / sent_bytes(identity), (compressed_secs - identity_secs) * 1000,
+            sent_bytes(not_modified)))
+
+
+def main():
+    label_count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    frame_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'framefetcher-params.json')) as conf_file:
+        config = json.loads(conf_file.read())
+    config = dict(config, camera_ids=['camera0'], ddb_bucket_salts=1, ddb_time_bucket='hour',
+                  cursor_signing_key='simulation-key')
+
+    all_index = StandInIndex()
+    include_index = StandInIndex(projection=framefetcher.list_attributes)
+    now_ts = time.time()
+    store_frames(all_index, include_index, frame_count, label_count, now_ts - 60)
+    def new_container(container=0):
+        presigner = CountingPresigner(container)
+        framefetcher.reset_runtime(framefetcher.RuntimeContext(
+            config, s3_client=presigner, dynamodb=FrameDynamoDB(StandInTable(config['ddb_table'], include_index))))
+        return presigner
+
+    new_container()
+    print("{} frames with {} labels each.".format(frame_count, label_count))
+    check_not_modified(lambda: store_frames(StandInIndex(), include_index, 1, label_count, time.time() + 60),
+                       lambda: new_container(1))
+    check_gzip(int(config['gzip_min_bytes']))
+    measure(json.loads(get({'limit': '25'})['body']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares the items/sec Image Processor writes to DynamoDB with one PutItem per
+frame and with BatchWriteItem, for batches of 1 to 500 frames.
+
+usage: ddb_write_benchmark.py [request-latency-ms] [unprocessed-share]
+
+DynamoDB is a stand-in that keeps items in memory, takes request-latency-ms per
+request and leaves each item of a BatchWriteItem request unprocessed with
+probability unprocessed-share, as DynamoDB does when a partition is throttled.
+Every item must be stored once the batch is written.
+'''
+
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'imageprocessor'))
+
+from imageprocessor import batch_write_items
+
+batch_sizes = [1, 10, 25, 100, 250, 500]
+
+
+class StandInTable(object):
+
+    def __init__(self, name, latency_secs, unprocessed_share, seed=7):
+        self.name = name
+        self.meta = SimpleNamespace(client=self)
+        self.latency_secs = latency_secs
+        self.unprocessed_share = unprocessed_share
+        self.items = {}
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def put_item(self, Item):
+        time.sleep(self.latency_secs)
+        with self._lock:
+            self.requests += 1
+            self.items[Item['frame_id']] = Item
+        return {}
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(self.latency_secs)
+        unprocessed = []
+        with self._lock:
+            self.requests += 1
+            for request in RequestItems[self.name]:
+                if self._random.random() < self.unprocessed_share:
+                    unprocessed.append(request)
+                else:
+                    item = request['PutRequest']['Item']
+                    self.items[item['frame_id']] = item
+        return {'UnprocessedItems': {self.name: unprocessed} if unprocessed else {}}
+
+
+def frame_items(count):
+    '''Items shaped like the ones Image Processor writes, with five labels each.'''
+    items = []
+    for index in range(count):
+        frame_id = str(uuid.uuid4())
+        labels = [{'Name': name, 'Confidence': Decimal('91.5'), 'OnWatchList': False, 'Instances': [], 'Parents': []}
+                  for name in ['Car', 'Vehicle', 'Transportation', 'Road', 'Person']]
+        items.append({
+            'frame_id': frame_id,
+            'processed_timestamp': Decimal(repr(time.time())),
+            'approx_capture_timestamp': Decimal(repr(time.time())),
+            'rekog_labels': labels,
+            'label_summary': [label['Name'] for label in labels],
+            'camera_id': 'camera0',
+            'camera_time_bucket': 'camera0#2026101812',
+            's3_bucket': 'frames-bucket',
+            's3_key': 'frames/{}.jpg'.format(frame_id)
+        })
+    return items
+
+
+def put_per_item(table, items):
+    for item in items:
+        table.put_item(Item=item)
+    return set()
+
+
+def main():
+    latency_secs = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 5.0 / 1000
+    unprocessed_share = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    print("{:.0f} ms per request, {:.0%} of batched items left unprocessed per request.".format(
+        latency_secs * 1000, unprocessed_share))
+    print("  {:>6}{:>28}{:>36}".format('frames', 'PutItem items/s (requests)', 'BatchWriteItem items/s (requests)'))
+    for batch_size in batch_sizes:
+        results = []
+        for write in [put_per_item, lambda table, items: batch_write_items(table, items, 8, 0.001)]:
+            table = StandInTable('EnrichedFrame', latency_secs, unprocessed_share)
+            items = frame_items(batch_size)
+            start = time.perf_counter()
+            failed = write(table, items)
+            elapsed = time.perf_counter() - start
+            assert not failed and len(table.items) == batch_size, (batch_size, failed, len(table.items))
+            results.append('{:>10.0f} ({:>4})'.format(batch_size / elapsed, table.requests))
+        print("  {:>6}{:>28}{:>36}".format(batch_size, *results))
+
+
+if __name__ == '__main__':
+    main()
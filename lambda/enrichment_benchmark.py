@@ -0,0 +1,149 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares Image Processor's label enrichment with the per-label loop it replaced.
+
+usage: enrichment_benchmark.py [recorded-responses.json] [repeats]
+
+recorded-responses.json holds a DetectLabels response or a list of them (e.g.
+saved from the Lambda log or `aws rekognition detect-labels`). Without one,
+synthetic responses with 150 labels each are used.
+'''
+
+import copy
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'imageprocessor'))
+
+from label_enrichment import WatchListMatcher, enrich_labels
+
+watch_list = ["Person", "Car", "Dog", "Bicycle", "Truck"]
+min_conf = 80.0
+
+
+def legacy_enrich(labels, label_watch_set, label_watch_min_conf):
+    '''The enrichment loop from before label_enrichment.py, minus the console output.'''
+    labels_on_watch_list = []
+    for label in labels:
+        lbl = label['Name']
+        conf = label['Confidence']
+        label['OnWatchList'] = False
+
+        if (lbl.upper() in label_watch_set
+            and conf >= label_watch_min_conf):
+
+            label['OnWatchList'] = True
+            labels_on_watch_list.append(copy.deepcopy(label))
+
+        label['Confidence'] = Decimal(conf)
+
+        for instance in label['Instances']:
+            instance['BoundingBox']['Width'] = Decimal(instance['BoundingBox']['Width'])
+            instance['BoundingBox']['Height'] = Decimal(instance['BoundingBox']['Height'])
+            instance['BoundingBox']['Left'] = Decimal(instance['BoundingBox']['Left'])
+            instance['BoundingBox']['Top'] = Decimal(instance['BoundingBox']['Top'])
+            instance['Confidence'] = Decimal(instance['Confidence'])
+
+    return labels, labels_on_watch_list
+
+
+def synthetic_response(seed, label_count=150):
+    rng = random.Random(seed)
+    names = watch_list + ['Label{}'.format(index) for index in range(400)]
+    labels = []
+    for index in range(label_count):
+        instances = []
+        for instance in range(rng.choice([0, 0, 1, 3, 8])):
+            instances.append({
+                'BoundingBox': {'Width': rng.random(), 'Height': rng.random(), 'Left': rng.random(), 'Top': rng.random()},
+                'Confidence': rng.uniform(50, 100)
+            })
+        labels.append({
+            'Name': rng.choice(names),
+            'Confidence': rng.uniform(50, 100),
+            'Instances': instances,
+            'Parents': [{'Name': rng.choice(names)} for parent in range(rng.randint(0, 3))]
+        })
+    return {'Labels': labels}
+
+
+def time_runs(responses, repeats, enrichers, rounds=9):
+    '''Best-of-rounds seconds per response of each enricher. Every call gets a fresh
+    copy of the labels, since both modify their input. The enrichers take turns in
+    every round, so that load on the machine affects them alike.'''
+    best = [None] * len(enrichers)
+    for round_index in range(rounds):
+        for position, enrich in enumerate(enrichers):
+            inputs = [[copy.deepcopy(response['Labels']) for response in responses] for repeat in range(repeats)]
+            start = time.perf_counter()
+            for labels_list in inputs:
+                for labels in labels_list:
+                    enrich(labels)
+            secs = (time.perf_counter() - start) / (repeats * len(responses))
+            best[position] = secs if best[position] is None else min(best[position], secs)
+    return best
+
+
+def serializes(labels):
+    try:
+        TypeSerializer().serialize(labels)
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    responses = None
+    repeats = 10
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as responses_file:
+            responses = json.loads(responses_file.read())
+        if isinstance(responses, dict):
+            responses = [responses]
+    if len(sys.argv) > 2:
+        repeats = int(sys.argv[2])
+    if not responses:
+        responses = [synthetic_response(seed) for seed in range(20)]
+
+    label_count = sum(len(response['Labels']) for response in responses)
+    instance_count = sum(len(label['Instances']) for response in responses for label in response['Labels'])
+    print("{} responses, {} labels, {} instances.".format(len(responses), label_count, instance_count))
+
+    label_watch_set = frozenset(label.upper() for label in watch_list)
+    matcher = WatchListMatcher(watch_list, min_conf)
+
+    #Both work in place; the labels of a response are not used after enrichment
+    legacy_secs, enrich_secs = time_runs(responses, repeats, [
+        lambda labels: legacy_enrich(labels, label_watch_set, min_conf),
+        lambda labels: enrich_labels(labels, matcher)
+    ])
+
+    print("legacy loop:   {:.3f} ms per response".format(legacy_secs * 1000))
+    print("enrich_labels: {:.3f} ms per response ({:.2f}x the legacy loop)".format(
+        enrich_secs * 1000, enrich_secs / legacy_secs))
+
+    legacy_labels = legacy_enrich(copy.deepcopy(responses[0]['Labels']), label_watch_set, min_conf)[0]
+    print("DynamoDB serializes legacy labels: {}, enrich_labels labels: {}".format(
+        serializes(legacy_labels), serializes(enrich_labels(copy.deepcopy(responses[0]['Labels']), matcher)[0])))
+
+    #Both must flag the same labels, and watched labels must stay JSON serializable for alerts
+    for response in responses:
+        legacy_labels, legacy_watched = legacy_enrich(copy.deepcopy(response['Labels']), label_watch_set, min_conf)
+        stored_labels, watched = enrich_labels(copy.deepcopy(response['Labels']), matcher)
+        assert [label['OnWatchList'] for label in legacy_labels] == [label['OnWatchList'] for label in stored_labels]
+        assert len(legacy_watched) == len(watched)
+        json.dumps(watched)
+
+
+if __name__ == '__main__':
+    main()
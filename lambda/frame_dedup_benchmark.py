@@ -0,0 +1,163 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Measures how often Image Processor's frame dedup cache reuses labels, and how
+often the reused labels are wrong, on synthetic camera clips.
+
+usage: frame_dedup_benchmark.py [frames-per-clip] [width] [height]
+
+Each clip is a street scene with sensor noise, JPEG encoded like the capture
+client does. Objects (a person walking in, a car that drives in and parks) are
+drawn into some of the frames, and each frame knows which objects it shows.
+A stand-in for Amazon Rekognition returns exactly those labels, so a frame that
+reuses the labels of an earlier frame is a false reuse when its own objects
+differ. Frames go through detect_frame_labels() for every frame_dedup_max_distance.
+'''
+
+import io
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'imageprocessor'))
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+from imageprocessor import detect_frame_labels
+from frame_dedup import dhash, FrameDedupCache
+
+
+class GroundTruthRekognition(object):
+    '''Returns the labels of the objects drawn into each frame.'''
+
+    def __init__(self):
+        self.labels_of_frame = {}
+        self.calls = 0
+
+    def detect_labels(self, Image, **kwargs):
+        self.calls += 1
+        names = self.labels_of_frame[bytes(Image['Bytes'])]
+        return {'Labels': [{'Name': name, 'Confidence': 95.0, 'Instances': [], 'Parents': []} for name in names]}
+
+
+def street_scene(width, height, seed):
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height))
+    draw = ImageDraw.Draw(img)
+    for y in range(height):
+        shade = 150 + int(60 * y / height)
+        draw.line([(0, y), (width, y)], fill=(shade, shade, min(255, shade + 20)))
+    draw.rectangle([0, int(height * 0.7), width, height], fill=(90, 90, 95))
+    for index in range(12):
+        left = rng.randrange(0, width)
+        top = rng.randrange(int(height * 0.15), int(height * 0.5))
+        color = tuple(rng.randrange(60, 200) for channel in range(3))
+        draw.rectangle([left, top, left + rng.randrange(width // 12, width // 5), int(height * 0.7)], fill=color)
+        for window in range(6):
+            x = left + rng.randrange(5, width // 12)
+            y = top + rng.randrange(5, max(6, int(height * 0.7) - top))
+            draw.rectangle([x, y, x + 6, y + 8], fill=(240, 230, 160))
+    return img
+
+
+def draw_person(draw, x, height_px, ground_y):
+    width_px = max(2, height_px // 4)
+    draw.ellipse([x, ground_y - height_px, x + width_px, ground_y - height_px + width_px], fill=(200, 160, 130))
+    draw.rectangle([x, ground_y - height_px + width_px, x + width_px, ground_y], fill=(40, 40, 120))
+
+
+def draw_car(draw, x, width_px, ground_y):
+    height_px = width_px // 3
+    draw.rectangle([x, ground_y - height_px, x + width_px, ground_y], fill=(180, 20, 20))
+    draw.rectangle([x + width_px // 5, ground_y - height_px - height_px // 2, x + width_px * 3 // 4, ground_y - height_px],
+                   fill=(160, 20, 20))
+
+
+def encode(img, noise_sigma, quality=80):
+    noise = Image.effect_noise(img.size, noise_sigma).convert('RGB')
+    noisy = Image.blend(img, noise, 0.08)
+    buf = io.BytesIO()
+    noisy.save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def clip(name, frame_count, width, height, seed):
+    '''Return a list of (JPEG bytes, label names) for a synthetic clip.'''
+    background = street_scene(width, height, seed)
+    ground_y = int(height * 0.9)
+    frames = []
+    for index in range(frame_count):
+        img = background.copy()
+        draw = ImageDraw.Draw(img)
+        names = {'Street', 'Building'}
+        progress = index / float(frame_count)
+
+        if name == 'lighting drift':
+            img = ImageEnhance.Brightness(img).enhance(1.0 - 0.25 * progress)
+        elif name.startswith('person enters'):
+            #Absent for the first third, then walks in from the left edge
+            height_px = int(height * float(name.split()[-1].rstrip('%)').lstrip('(')) / 100)
+            if progress >= 1 / 3.0:
+                x = -height_px // 4 + int((progress - 1 / 3.0) * 1.5 * width * 0.6)
+                draw_person(draw, x, height_px, ground_y)
+                names.add('Person')
+        elif name == 'car parks':
+            #Drives in over the second third, then stays
+            width_px = width // 4
+            if progress >= 1 / 3.0:
+                x = width - int(min(1.0, (progress - 1 / 3.0) * 3) * (width * 0.6))
+                draw_car(draw, x, width_px, ground_y)
+                names.add('Car')
+
+        frames.append((encode(img, noise_sigma=40), sorted(names)))
+    return frames
+
+
+def run(frames, max_distance):
+    rekognition = GroundTruthRekognition()
+    for img_bytes, names in frames:
+        rekognition.labels_of_frame[img_bytes] = names
+    runtime = SimpleNamespace(
+        dedup_cache=FrameDedupCache(max_distance=max_distance, ttl_secs=3600, max_entries=256),
+        rekog_client=rekognition, rekog_max_labels=123, rekog_min_conf=50.0)
+
+    false_reuse = 0
+    for img_bytes, names in frames:
+        labels = sorted(label['Name'] for label in detect_frame_labels(runtime, 'camera0', img_bytes)['Labels'])
+        false_reuse += labels != names
+    hits = len(frames) - rekognition.calls
+    return hits, false_reuse
+
+
+def main():
+    frame_count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 640
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 480
+
+    names = ['static, sensor noise', 'lighting drift', 'person enters (10%)', 'person enters (25%)',
+             'person enters (50%)', 'car parks']
+    clips = [(name, clip(name, frame_count, width, height, seed)) for seed, name in enumerate(names)]
+
+    frames = [img_bytes for name, frames in clips for img_bytes, labels in frames]
+    start = time.perf_counter()
+    for img_bytes in frames:
+        dhash(img_bytes)
+    hash_ms = (time.perf_counter() - start) * 1000 / len(frames)
+
+    distances = [0, 2, 4, 6, 8]
+    print("{} frames per clip, {}x{} JPEG, dHash {:.2f} ms per frame.".format(frame_count, width, height, hash_ms))
+    print("Labels reused / wrong labels, by frame_dedup_max_distance:")
+    print("  {:<22}".format('') + ''.join('{:>12}'.format(distance) for distance in distances))
+    for name, frames in clips:
+        results = [run(frames, distance) for distance in distances]
+        print("  {:<22}".format(name) + ''.join(
+            '{:>6.0%}/{:<5.0%}'.format(hits / float(len(frames)), wrong / float(len(frames))) for hits, wrong in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Checks that Image Processor skips malformed frame records, and compares the
+encode/decode cost and record size of the binary frame envelope with the pickled
+frame packages of older capture clients.
+
+usage: frame_format_benchmark.py [repeats]
+
+Malformed records (garbage, truncated envelopes and pickles, pickles of other
+types or of classes outside the allow list) must raise FrameFormatError, and a
+batch holding them must be handled without reporting a failed record.
+'''
+
+import base64
+import contextlib
+import io
+import json
+import os
+import pickle
+import sys
+import time
+
+from load_simulation import (LatencyRekognition, LatencyS3, LatencySNS,
+                             synthetic_jpeg, pack_frame, base_dir)
+
+import imageprocessor
+from frame_format import parse_frame, FrameFormatError
+
+
+class RecordingTable(object):
+    '''A DynamoDB table stand-in that remembers the items written to it.'''
+
+    def __init__(self, name):
+        self.name = name
+        self.meta = self
+        self.client = self
+        self.items = []
+
+    def batch_write_item(self, RequestItems):
+        for requests in RequestItems.values():
+            self.items.extend(request['PutRequest']['Item'] for request in requests)
+        return {'UnprocessedItems': {}}
+
+
+class RecordingDynamoDB(object):
+
+    def __init__(self):
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, RecordingTable(name))
+
+
+def legacy_record(img_bytes, capture_ts, frame_count, protocol=pickle.HIGHEST_PROTOCOL):
+    '''A frame record as pickled by older capture clients.'''
+    return pickle.dumps({
+        'ApproximateCaptureTime': capture_ts,
+        'FrameCount': frame_count,
+        'ImageBytes': bytearray(img_bytes)
+    }, protocol=protocol)
+
+
+class Exploit(object):
+    def __reduce__(self):
+        return (os.system, ('echo pwned',))
+
+
+def malformed_records(img_bytes):
+    envelope = pack_frame(img_bytes, time.time(), 7, 'camera0')
+    legacy = legacy_record(img_bytes, time.time(), 7)
+    return [
+        ('garbage', b'not a frame record at all'),
+        ('empty', b''),
+        ('truncated envelope', envelope[:len(envelope) // 2]),
+        ('envelope header only', envelope[:20]),
+        ('truncated pickle', legacy[:len(legacy) // 2]),
+        ('pickle header only', legacy[:2]),
+        ('pickled list', pickle.dumps([1, 2, 3])),
+        ('pickle without capture time', pickle.dumps({'FrameCount': 1, 'ImageBytes': bytearray(b'x')})),
+        ('pickled class', pickle.dumps(Exploit()))
+    ]
+
+
+def check_malformed(img_bytes):
+    for name, data in malformed_records(img_bytes):
+        try:
+            parse_frame(data)
+        except FrameFormatError:
+            continue
+        raise AssertionError('{}: parsed without FrameFormatError'.format(name))
+
+    #A batch holding every kind of malformed record among good ones
+    config_path = os.path.join(base_dir, '..', 'config', 'imageprocessor-params.json')
+    with open(config_path, 'r') as params_file:
+        config = json.loads(params_file.read())
+    config['frame_dedup_enabled'] = False
+    dynamodb = RecordingDynamoDB()
+    imageprocessor.reset_runtime(imageprocessor.RuntimeContext(
+        config,
+        rekog_client=LatencyRekognition(0),
+        sns_client=LatencySNS(0),
+        s3_client=LatencyS3(0),
+        dynamodb=dynamodb
+    ))
+
+    records = []
+    datas = [pack_frame(img_bytes, time.time(), 0, 'camera0')]
+    datas += [data for name, data in malformed_records(img_bytes)]
+    datas += [legacy_record(img_bytes, time.time(), 1, protocol=2), pack_frame(img_bytes, time.time(), 2, 'camera1')]
+    for sequence_number, data in enumerate(datas):
+        records.append({
+            'eventID': 'shardId-000000000000:{}'.format(sequence_number),
+            'kinesis': {
+                'data': base64.b64encode(data).decode('ascii'),
+                'partitionKey': 'camera0',
+                'sequenceNumber': str(sequence_number)
+            }
+        })
+    #Not even base64
+    records.insert(1, {'eventID': 'shardId-000000000000:x', 'kinesis': {'data': '!!!', 'partitionKey': 'camera0',
+                                                                         'sequenceNumber': 'x'}})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = imageprocessor.handler({'Records': records}, None)
+    imageprocessor.reset_runtime()
+
+    assert response == {'batchItemFailures': []}, response
+    assert len(dynamodb.Table(config['ddb_table']).items) == 3
+    print("{} malformed records: FrameFormatError from parse_frame, skipped by the handler "
+          "(batchItemFailures empty, 3 good frames stored)".format(len(malformed_records(img_bytes)) + 1))
+
+
+def best_time(function, repeats, rounds=5):
+    best = None
+    for round_index in range(rounds):
+        start = time.perf_counter()
+        for repeat in range(repeats):
+            function()
+        elapsed = (time.perf_counter() - start) / repeats
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def legacy_decode(data):
+    '''The decode path before the envelope: unpickle, then copy the image into bytes.'''
+    frame_package = pickle.loads(data)
+    return bytes(frame_package['ImageBytes'])
+
+
+def envelope_decode(data):
+    #The payload is materialized once for botocore, as process_record does
+    return parse_frame(data)['ImageBytes'].tobytes()
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    check_malformed(synthetic_jpeg(0, 320, 240))
+
+    print("Best of 5 rounds of {} repeats, per frame:".format(repeats))
+    for width, height in [(640, 480), (1280, 720), (1920, 1080)]:
+        img_bytes = synthetic_jpeg(1, width, height)
+        capture_ts = time.time()
+        legacy = legacy_record(img_bytes, capture_ts, 42)
+        envelope = pack_frame(img_bytes, capture_ts, 42, 'camera0')
+
+        legacy_encode_secs = best_time(lambda: legacy_record(img_bytes, capture_ts, 42), repeats)
+        envelope_encode_secs = best_time(lambda: pack_frame(img_bytes, capture_ts, 42, 'camera0'), repeats)
+        legacy_decode_secs = best_time(lambda: legacy_decode(legacy), repeats)
+        envelope_decode_secs = best_time(lambda: envelope_decode(envelope), repeats)
+
+        print("  {}x{} JPEG ({} bytes): pickle {} bytes, encode {:.1f} us, decode {:.1f} us; "
+              "envelope {} bytes, encode {:.1f} us, decode {:.1f} us".format(
+                  width, height, len(img_bytes),
+                  len(legacy), legacy_encode_secs * 1e6, legacy_decode_secs * 1e6,
+                  len(envelope), envelope_encode_secs * 1e6, envelope_decode_secs * 1e6))
+
+
+if __name__ == '__main__':
+    main()
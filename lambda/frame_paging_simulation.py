@@ -0,0 +1,249 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Pages through a large stand-in frame index with Frame Fetcher's since, before and
+limit parameters and checks that no frame is returned twice or skipped.
+
+usage: frame_paging_simulation.py [cameras] [hours] [frame-interval-secs] [limit]
+
+Frames from several cameras are indexed the way Image Processor writes them,
+with two salts per bucket and some frames of different cameras at the same
+timestamp. The GET handler is called with API Gateway proxy events:
+
+ * newest first, following X-Next-Before cursors back to the fetch horizon;
+ * oldest first from a timestamp, following X-Next-Since cursors;
+ * polling with X-Next-Since cursors while new frames are stored, some of them
+   committed late, with a processed_timestamp up to since_overlap_secs behind
+   frames already returned;
+ * with tampered cursors and out of range limits, which must be rejected.
+
+Every walk is compared with the frames of the window found by brute force.
+'''
+
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+from frame_query_simulation import StandInIndex, StandInTable, camera_time_bucket
+
+import framefetcher
+
+
+class FrameDynamoDB(object):
+
+    def __init__(self, table):
+        self.table = table
+
+    def Table(self, name):
+        return self.table
+
+
+class StubPresigner(object):
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        return 'https://{}.s3.amazonaws.com/{}?X-Amz-Expires={}'.format(Params['Bucket'], Params['Key'], ExpiresIn)
+
+
+class FrameStore(object):
+    '''Stores frames in a stand-in index and remembers them in page order.'''
+
+    def __init__(self, index, salts):
+        self.index = index
+        self.salts = salts
+        self.items = []
+        self.frame_count = 0
+
+    def store(self, camera_id, ts):
+        frame_id = str(uuid.uuid5(uuid.NAMESPACE_URL, '{}:{}'.format(camera_id, self.frame_count)))
+        self.frame_count += 1
+        item = {
+            'frame_id': frame_id,
+            'camera_id': camera_id,
+            'processed_timestamp': Decimal(repr(ts)),
+            'camera_time_bucket': camera_time_bucket(camera_id, ts, 'hour', self.salts, frame_id),
+            's3_bucket': 'frames-bucket',
+            's3_key': 'frames/{}.jpg'.format(frame_id)
+        }
+        self.index.put(item)
+        self.items.append(item)
+
+    def window(self, start_ts, end_ts):
+        '''Frame ids processed from start_ts to end_ts, newest first.'''
+        items = [item for item in self.items
+                 if Decimal(repr(start_ts)) <= item['processed_timestamp'] <= Decimal(repr(end_ts))]
+        items.sort(key=lambda item: (item['processed_timestamp'], item['frame_id']), reverse=True)
+        return [item['frame_id'] for item in items]
+
+
+def get(params):
+    event = {'httpMethod': 'GET', 'queryStringParameters': {key: str(value) for key, value in params.items()} or None}
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = framefetcher.handler(event, None)
+    frames = json.loads(response['body']) if response['statusCode'] == '200' else None
+    return response, frames
+
+
+def check_unique(name, frame_ids):
+    assert len(frame_ids) == len(set(frame_ids)), '{}: frames returned twice'.format(name)
+
+
+def page_back(limit, store, horizon_secs):
+    '''Follows X-Next-Before from the newest frames to the fetch horizon.'''
+    frame_ids = []
+    params = {'limit': limit}
+    requests = 0
+    while True:
+        response, frames = get(params)
+        requests += 1
+        assert frames is not None, response['body']
+        assert len(frames) <= limit
+        frame_ids.extend(frame['frame_id'] for frame in frames)
+        if 'X-Next-Before' not in response['headers']:
+            break
+        params = {'limit': limit, 'before': response['headers']['X-Next-Before']}
+
+    #The horizon moves while paging; the frames inside it at the end must all be there
+    end_ts = time.time()
+    expected = store.window(end_ts - horizon_secs, end_ts)
+    check_unique('before', frame_ids)
+    assert frame_ids[:len(expected)] == expected, 'before: frames skipped or out of order'
+    print("newest first, limit {}: {} frames in {} requests, no duplicates or gaps".format(limit, len(frame_ids), requests))
+
+
+def page_forward(limit, store, since_ts):
+    '''Follows X-Next-Since from a timestamp until caught up.'''
+    frame_ids = []
+    params = {'limit': limit, 'since': since_ts}
+    requests = 0
+    while True:
+        response, frames = get(params)
+        requests += 1
+        assert frames is not None, response['body']
+        #Each page is newest first; pages go forward in time
+        frame_ids.extend(reversed([frame['frame_id'] for frame in frames]))
+        if len(frames) < limit:
+            break
+        params = {'limit': limit, 'since': response['headers']['X-Next-Since']}
+
+    expected = list(reversed(store.window(since_ts, time.time())))
+    #A frame exactly at since_ts is not after it
+    expected = [frame_id for frame_id in expected
+                if next(item for item in store.items if item['frame_id'] == frame_id)['processed_timestamp'] != Decimal(repr(since_ts))]
+    check_unique('since', frame_ids)
+    assert frame_ids == expected, 'since: frames skipped or out of order'
+    print("oldest first from a timestamp, limit {}: {} frames in {} requests, no duplicates or gaps".format(
+        limit, len(frame_ids), requests))
+    return response['headers']['X-Next-Since']
+
+
+def poll(limit, store, camera_ids, cursor, polls, overlap_secs):
+    '''Stores a few frames between polls, some committed late, and checks every poll returns exactly the new ones.'''
+    received = 0
+    late = 0
+    cursor_bytes = 0
+    for poll_index in range(polls):
+        new_items = []
+        for frame_index in range(poll_index % (limit + 2)):
+            camera_id = camera_ids[frame_index % len(camera_ids)]
+            #Every third frame was processed a while ago, but only committed now
+            lag_secs = overlap_secs * (poll_index % 4) / 4 if frame_index % 3 == 2 else 0.001
+            late += lag_secs > 0.001
+            store.store(camera_id, time.time() - lag_secs)
+            new_items.append(store.items[-1])
+        new_items.sort(key=lambda item: (item['processed_timestamp'], item['frame_id']))
+        new_ids = [item['frame_id'] for item in new_items]
+
+        frame_ids = []
+        while True:
+            response, frames = get({'limit': limit, 'since': cursor})
+            assert frames is not None, response['body']
+            frame_ids.extend(reversed([frame['frame_id'] for frame in frames]))
+            cursor = response['headers']['X-Next-Since']
+            if len(frames) < limit:
+                break
+        assert frame_ids == new_ids, 'poll {}: expected {} new frames, got {}'.format(poll_index, len(new_ids), len(frame_ids))
+        received += len(frame_ids)
+        cursor_bytes = max(cursor_bytes, len(cursor))
+    print("polling since the last cursor: {} polls, {} new frames ({} committed late), each returned exactly once; "
+          "cursors up to {} bytes".format(polls, received, late, cursor_bytes))
+
+
+def poll_after_newest(limit, store, camera_ids, overlap_secs):
+    '''Checks that polls from a newest-first page return frames committed late behind it, and nothing older.'''
+    response, frames = get({'limit': limit})
+    newest_ts = Decimal(repr(frames[0]['processed_timestamp']))
+    oldest_ts = Decimal(repr(frames[-1]['processed_timestamp']))
+    store.store(camera_ids[0], float(newest_ts) - 0.0005)
+    store.store(camera_ids[-1], float(oldest_ts) - 0.0005)
+    late_id = store.items[-2]['frame_id']
+
+    response, frames = get({'limit': limit, 'since': response['headers']['X-Next-Since']})
+    assert [frame['frame_id'] for frame in frames] == [late_id], 'newest page: late frame not returned once'
+    response, frames = get({'limit': limit, 'since': response['headers']['X-Next-Since']})
+    assert frames == [], 'newest page: frames returned twice'
+    print("polling after a newest-first page: a frame committed late inside the page is returned once, "
+          "frames older than the page are left to before cursors")
+
+
+def check_rejected(cursor):
+    payload, signature = cursor.split('.')
+    tampered_payload = payload[:-2] + ('AA' if payload[-2:] != 'AA' else 'BB')
+    for params in [{'since': tampered_payload + '.' + signature},
+                   {'before': cursor[:-1]},
+                   {'since': 'not-a-cursor'},
+                   {'since': 'nan'},
+                   {'limit': 0},
+                   {'limit': 101},
+                   {'limit': 'ten'}]:
+        response, frames = get(params)
+        assert response['statusCode'] == '400', params
+    print("tampered cursors and invalid limits: rejected with 400")
+
+
+def main():
+    camera_count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    interval_secs = float(sys.argv[3]) if len(sys.argv) > 3 else 15
+    limit = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+
+    camera_ids = ['camera{}'.format(index) for index in range(camera_count)]
+    salts = 2
+    store = FrameStore(StandInIndex(), salts)
+    now_ts = time.time()
+    span_start = now_ts - hours * 3600
+    for camera_index, camera_id in enumerate(camera_ids):
+        #Every other camera shares timestamps with the one before it
+        ts = span_start + (camera_index // 2) * 3.5
+        while ts < now_ts - 60:
+            store.store(camera_id, ts)
+            ts += interval_secs
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'framefetcher-params.json')) as conf_file:
+        config = json.loads(conf_file.read())
+    config = dict(config, camera_ids=camera_ids, ddb_bucket_salts=salts, ddb_time_bucket='hour',
+                  cursor_signing_key='simulation-key')
+    horizon_secs = float(config['fetch_horizon_hrs']) * 3600
+    framefetcher.reset_runtime(framefetcher.RuntimeContext(
+        config, s3_client=StubPresigner(), dynamodb=FrameDynamoDB(StandInTable(config['ddb_table'], store.index))))
+
+    print("{} frames from {} cameras over {} hours, {} salts per hour bucket.".format(
+        len(store.items), camera_count, hours, salts))
+    page_back(limit, store, horizon_secs)
+    page_back(7, store, horizon_secs)
+    #Start at a timestamp that frames of two cameras share
+    cursor = page_forward(limit, store, float(store.items[len(store.items) // 3]['processed_timestamp']))
+    overlap_secs = float(config.get('since_overlap_secs', 60))
+    poll(3, store, camera_ids, cursor, 30, overlap_secs)
+    poll_after_newest(limit, store, camera_ids, overlap_secs)
+    check_rejected(cursor)
+
+
+if __name__ == '__main__':
+    main()
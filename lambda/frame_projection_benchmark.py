@@ -0,0 +1,141 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares response bytes and consumed read capacity of Frame Fetcher list requests
+with full items from an ALL-projected index and with label summaries from an
+INCLUDE-projected index, and of detail requests for full items.
+
+usage: frame_projection_benchmark.py [labels-per-frame] [frames]
+
+Frames are stored the way Image Processor writes them, with synthetic Amazon
+Rekognition labels. DynamoDB is a stand-in that charges read capacity like
+DynamoDB: eventually consistent reads, 0.5 units per started 4 KB, with a query
+rounded up once over all index entries it reads and BatchGetItem rounded up per
+item.
+'''
+
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+from enrichment_benchmark import synthetic_response
+from frame_query_simulation import StandInIndex, StandInTable, camera_time_bucket
+from label_enrichment import WatchListMatcher, enrich_labels, summarize_labels
+
+import framefetcher
+from frame_query import FrameQuery
+
+
+class FrameDynamoDB(object):
+
+    def __init__(self, table):
+        self.table = table
+
+    def Table(self, name):
+        return self.table
+
+
+class StubPresigner(object):
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        #About as long as a real presigned URL with temporary credentials, and as incompressible
+        digests = [hashlib.sha256('{}:{}'.format(Params['Key'], index).encode('utf-8')).digest() for index in range(13)]
+        token = base64.urlsafe_b64encode(b''.join(digests))[:560].decode('ascii')
+        return 'https://{}.s3.amazonaws.com/{}?X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Credential={}&X-Amz-Signature={}'.format(
+            Params['Bucket'], Params['Key'], token, digests[0].hex())
+
+
+def store_frames(all_index, include_index, frame_count, label_count, now_ts):
+    '''Stores frames as they were written before label summaries in all_index, and as they are now in include_index.'''
+    matcher = WatchListMatcher(["Person", "Car", "Dog"], 80.0)
+    for index in range(frame_count):
+        frame_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'frame:{}'.format(index)))
+        ts = now_ts - 60 - (frame_count - index) * 2.0
+        stored_labels, watched = enrich_labels(synthetic_response(index, label_count)['Labels'], matcher)
+        item = {
+            'frame_id': frame_id,
+            'processed_timestamp': Decimal(repr(ts)),
+            'approx_capture_timestamp': Decimal(repr(ts - 0.5)),
+            'rekog_labels': stored_labels,
+            'label_summary': summarize_labels(stored_labels, 5),
+            'rekog_orientation_correction': 'ROTATE_0',
+            'camera_id': 'camera0',
+            'camera_time_bucket': camera_time_bucket('camera0', ts, 'hour', 1, frame_id),
+            's3_bucket': 'amazon-rekognition-video-analyzer-frame-s3',
+            's3_key': 'frames/2017/07/31/18/{}.jpg'.format(frame_id)
+        }
+        include_index.put(item)
+        all_index.put({name: value for name, value in item.items() if name != 'label_summary'})
+
+
+def run_handler(event):
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = framefetcher.handler(event, None)
+    assert response['statusCode'] == '200', response['body']
+    return response
+
+
+def full_item_list(runtime, table, limit):
+    '''The list request as it was before: full items of the newest frames from the ALL-projected index.'''
+    frame_query = FrameQuery(table, runtime.ddb_gsi_name, ['camera0'])
+    now_ts = time.time()
+    items = frame_query.newest(now_ts - runtime.fetch_horizon_hrs * 3600, now_ts, limit)
+    for item in items:
+        item['s3_presigned_url'] = runtime.presigned_urls.get(item["s3_bucket"], item["s3_key"])
+    return framefetcher.respond(None, items), frame_query.consumed_capacity
+
+
+def main():
+    label_count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    frame_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'framefetcher-params.json')) as conf_file:
+        config = json.loads(conf_file.read())
+    config = dict(config, camera_ids=['camera0'], ddb_bucket_salts=1, ddb_time_bucket='hour',
+                  cursor_signing_key='benchmark-key')
+
+    all_index = StandInIndex()
+    include_index = StandInIndex(projection=framefetcher.list_attributes)
+    store_frames(all_index, include_index, frame_count, label_count, time.time())
+    all_table = StandInTable(config['ddb_table'], all_index)
+    include_table = StandInTable(config['ddb_table'], include_index)
+
+    runtime = framefetcher.RuntimeContext(config, s3_client=StubPresigner(), dynamodb=FrameDynamoDB(include_table))
+    framefetcher.reset_runtime(runtime)
+
+    print("{} frames with {} labels each (up to 8 instances per label), camera0, one hour bucket.".format(
+        frame_count, label_count))
+    for limit in [3, 25, 100]:
+        response, before_capacity = full_item_list(runtime, all_table, limit)
+        before_bytes = len(response['body'])
+
+        capacity = runtime.frame_query.consumed_capacity
+        response = run_handler({'httpMethod': 'GET', 'queryStringParameters': {'limit': str(limit)}})
+        after_bytes = len(response['body'])
+        after_capacity = runtime.frame_query.consumed_capacity - capacity
+
+        print("list, limit {:>3}: full items {:>7} bytes, {:>5.1f} RCU -> summaries {:>6} bytes, {:>4.1f} RCU".format(
+            limit, before_bytes, before_capacity, after_bytes, after_capacity))
+
+    frames = json.loads(response['body'])
+    for count in [1, 3, 25]:
+        capacity = runtime.frame_details.consumed_capacity
+        response = run_handler({'httpMethod': 'GET', 'pathParameters': {
+            'frame_ids': ','.join(frame['frame_id'] for frame in frames[:count])}})
+        items = json.loads(response['body'])
+        assert [item['frame_id'] for item in items] == [frame['frame_id'] for frame in frames[:count]]
+        print("detail, {:>2} frame(s): {:>7} bytes, {:>5.1f} RCU".format(
+            count, len(response['body']), runtime.frame_details.consumed_capacity - capacity))
+
+
+if __name__ == '__main__':
+    main()
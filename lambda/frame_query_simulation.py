@@ -0,0 +1,268 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Checks Frame Fetcher's camera/time bucket queries against a stand-in DynamoDB index
+and measures their fan-out latency.
+
+usage: frame_query_simulation.py [query-latency-ms]
+
+Frames from several cameras are indexed the way Image Processor writes them, over
+a span that crosses a day and a month boundary. For every bucket setting, time
+window and limit, the frames Frame Fetcher returns are compared with the newest
+frames of the window found by brute force. The old single year-month partition
+is checked the same way. Then the latency of a 24 hour query is measured with
+sequential and parallel queries, with every stand-in query taking
+query-latency-ms.
+'''
+
+import bisect
+import calendar
+import datetime
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from types import SimpleNamespace
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'framefetcher'))
+sys.path.append(os.path.join(base_dir, 'imageprocessor'))
+
+from frame_query import FrameQuery
+from imageprocessor import camera_time_bucket
+
+hash_key_name = 'camera_time_bucket'
+range_key_name = 'processed_timestamp'
+
+
+def key_condition(condition):
+    '''Return (hash key value, sort key predicate) of a boto3 key condition.'''
+    expression = condition.get_expression()
+    operator = expression['operator']
+    values = expression['values']
+
+    if operator == 'AND':
+        left_hash, left_match = key_condition(values[0])
+        right_hash, right_match = key_condition(values[1])
+        return left_hash or right_hash, lambda value: left_match(value) and right_match(value)
+    if operator == '=' and values[0].name == hash_key_name:
+        return values[1], lambda value: True
+
+    comparisons = {
+        '=': lambda value: value == values[1],
+        '<': lambda value: value < values[1],
+        '<=': lambda value: value <= values[1],
+        '>': lambda value: value > values[1],
+        '>=': lambda value: value >= values[1],
+        'BETWEEN': lambda value: values[1] <= value <= values[2]
+    }
+    return None, comparisons[operator]
+
+
+def attribute_size(value):
+    '''Approximate DynamoDB size of an attribute value, in bytes.'''
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        return len(str(value).lstrip('-').replace('.', '')) // 2 + 2
+    if isinstance(value, dict):
+        return 3 + sum(len(name.encode('utf-8')) + attribute_size(item) for name, item in value.items())
+    return 3 + sum(attribute_size(item) + 1 for item in value)
+
+def item_size(item):
+    return sum(len(name.encode('utf-8')) + attribute_size(value) for name, value in item.items())
+
+def read_capacity(size_bytes):
+    '''Eventually consistent read capacity units for reading size_bytes at once.'''
+    return 0.5 * max(1, math.ceil(size_bytes / 4096.0))
+
+def project(item, projection_expression, attribute_names):
+    names = [attribute_names.get(name.strip(), name.strip()) for name in projection_expression.split(',')]
+    return {name: item[name] for name in names if name in item}
+
+
+class StandInIndex(object):
+    '''A DynamoDB table keyed by frame_id, with a GSI keyed by camera_time_bucket and
+    processed_timestamp. Answers Query on the index like DynamoDB does (Limit,
+    ScanIndexForward, LastEvaluatedKey, ProjectionExpression, ConsumedCapacity),
+    and GetItem and BatchGetItem on the table.
+
+    projection lists the non-key attributes of an INCLUDE projection; None projects
+    all attributes.
+    '''
+
+    def __init__(self, latency_secs=0.0, projection=None):
+        self.latency_secs = latency_secs
+        self.projection = projection
+        self.queries = 0
+        #hash key -> index entries sorted by (processed_timestamp, frame_id)
+        self._partitions = defaultdict(list)
+        self._sort_keys = defaultdict(list)
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        self._items[item['frame_id']] = item
+        if self.projection is not None:
+            item = {name: value for name, value in item.items()
+                    if name in ('frame_id', hash_key_name, range_key_name) or name in self.projection}
+
+        sort_key = (item[range_key_name], item['frame_id'])
+        position = bisect.bisect(self._sort_keys[item[hash_key_name]], sort_key)
+        self._sort_keys[item[hash_key_name]].insert(position, sort_key)
+        self._partitions[item[hash_key_name]].insert(position, item)
+
+    def get_item(self, TableName, Key, ReturnConsumedCapacity=None, **kwargs):
+        item = self._items.get(Key['frame_id'])
+        response = {'ConsumedCapacity': {'TableName': TableName,
+                                         'CapacityUnits': read_capacity(item_size(item) if item else 0)}}
+        if item is not None:
+            response['Item'] = dict(item)
+        return response
+
+    def batch_get_item(self, RequestItems, ReturnConsumedCapacity=None, **kwargs):
+        (table_name, request), = RequestItems.items()
+        items = [dict(self._items[key['frame_id']]) for key in request['Keys'] if key['frame_id'] in self._items]
+        #Every item read is rounded up to 4 KB on its own
+        capacity = sum(read_capacity(item_size(item)) for item in items)
+        return {'Responses': {table_name: items}, 'UnprocessedKeys': {},
+                'ConsumedCapacity': [{'TableName': table_name, 'CapacityUnits': capacity}]}
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None, ExclusiveStartKey=None,
+              ProjectionExpression=None, ExpressionAttributeNames=None, TableName=None, **kwargs):
+        with self._lock:
+            self.queries += 1
+        if self.latency_secs:
+            time.sleep(self.latency_secs)
+
+        hash_value, matches = key_condition(KeyConditionExpression)
+        items = [item for item in self._partitions.get(hash_value, []) if matches(item[range_key_name])]
+        if not ScanIndexForward:
+            items.reverse()
+
+        if ExclusiveStartKey is not None:
+            start_key = (ExclusiveStartKey[range_key_name], ExclusiveStartKey['frame_id'])
+            if ScanIndexForward:
+                items = [item for item in items if (item[range_key_name], item['frame_id']) > start_key]
+            else:
+                items = [item for item in items if (item[range_key_name], item['frame_id']) < start_key]
+
+        #Capacity is charged for the index entries read, whatever the projection expression
+        read = items[:Limit]
+        response = {'ConsumedCapacity': {'TableName': TableName,
+                                         'CapacityUnits': read_capacity(sum(item_size(item) for item in read))}}
+        if ProjectionExpression is not None:
+            response['Items'] = [project(item, ProjectionExpression, ExpressionAttributeNames or {}) for item in read]
+        else:
+            response['Items'] = [dict(item) for item in read]
+        response['Count'] = len(response['Items'])
+        if Limit is not None and len(items) >= Limit and response['Items']:
+            last = read[-1]
+            response['LastEvaluatedKey'] = {'frame_id': last['frame_id'], hash_key_name: last[hash_key_name],
+                                            range_key_name: last[range_key_name]}
+        return response
+
+
+class StandInTable(object):
+
+    def __init__(self, name, index):
+        self.name = name
+        self.meta = SimpleNamespace(client=index)
+
+
+def utc_ts(*args):
+    return calendar.timegm(datetime.datetime(*args).timetuple())
+
+
+def index_frames(camera_ids, start_ts, end_ts, interval_secs, time_bucket, salts):
+    '''Index frames every interval_secs per camera, the way Image Processor writes them. Returns (index, items).'''
+    index = StandInIndex()
+    items = []
+    for camera_index, camera_id in enumerate(camera_ids):
+        ts = start_ts + camera_index * 7.25
+        frame_index = 0
+        while ts < end_ts:
+            frame_id = str(uuid.uuid5(uuid.NAMESPACE_URL, '{}:{}'.format(camera_id, frame_index)))
+            item = {
+                'frame_id': frame_id,
+                'camera_id': camera_id,
+                range_key_name: Decimal(repr(ts)),
+                hash_key_name: camera_time_bucket(camera_id, ts, time_bucket, salts, frame_id),
+                'processed_year_month': datetime.datetime.utcfromtimestamp(ts).strftime('%Y%m')
+            }
+            index.put(item)
+            items.append(item)
+            ts += interval_secs
+            frame_index += 1
+    items.sort(key=lambda item: (item[range_key_name], item['frame_id']), reverse=True)
+    return index, items
+
+
+def check_correctness(camera_ids, span_start, span_end):
+    windows = 0
+    year_month_misses = 0
+    for time_bucket, salts in [('hour', 1), ('hour', 4), ('day', 1), ('day', 3)]:
+        index, items = index_frames(camera_ids, span_start, span_end, 37.0, time_bucket, salts)
+        frame_query = FrameQuery(StandInTable('EnrichedFrame', index), 'index', camera_ids,
+                                 time_bucket=time_bucket, salts=salts, max_parallel_queries=16)
+
+        for now_ts in range(int(span_start) + 1800, int(span_end), 1700):
+            for horizon_hrs in [0.5, 6, 24]:
+                for limit in [1, 3, 50, 2000]:
+                    start_ts = now_ts - horizon_hrs * 3600
+                    expected = [item['frame_id'] for item in items
+                                if Decimal(repr(float(start_ts))) <= item[range_key_name] <= Decimal(repr(float(now_ts)))][:limit]
+                    found = [item['frame_id'] for item in frame_query.newest(float(start_ts), float(now_ts), limit)]
+                    assert found == expected, (time_bucket, salts, now_ts, horizon_hrs, limit)
+                    windows += 1
+
+                    #The old query only looked at the current month's partition
+                    now_month = datetime.datetime.utcfromtimestamp(now_ts).strftime('%Y%m')
+                    old = [item['frame_id'] for item in items
+                           if item['processed_year_month'] == now_month
+                           and Decimal(repr(float(start_ts))) < item[range_key_name] <= Decimal(repr(float(now_ts)))][:limit]
+                    if old != expected:
+                        year_month_misses += 1
+
+    print("Checked {} windows: all match. The year-month partition query returned wrong results for {}.".format(
+        windows, year_month_misses))
+
+
+def measure_fan_out(camera_ids, latency_secs):
+    now_ts = utc_ts(2017, 8, 1, 6)
+    start_ts = now_ts - 24 * 3600
+    index, items = index_frames(camera_ids, start_ts - 3600, now_ts, 37.0, 'hour', 1)
+    index.latency_secs = latency_secs
+    table = StandInTable('EnrichedFrame', index)
+
+    print("24 hour window, {} cameras, hour buckets, {} ms per query:".format(len(camera_ids), latency_secs * 1000))
+    for limit in [3, 5000]:
+        for max_parallel_queries in [1, 16, 64]:
+            frame_query = FrameQuery(table, 'index', camera_ids, time_bucket='hour', max_parallel_queries=max_parallel_queries)
+            index.queries = 0
+            start = time.perf_counter()
+            found = frame_query.newest(float(start_ts), float(now_ts), limit)
+            elapsed = time.perf_counter() - start
+            print("  limit {:>4}, max_parallel_queries {:>2}: {:>4} frames in {:7.1f} ms, {:>3} queries".format(
+                limit, max_parallel_queries, len(found), elapsed * 1000, index.queries))
+
+
+def main():
+    latency_secs = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.01
+    camera_ids = ['lobby', 'dock', 'gate', 'camera0']
+
+    #18:00 on July 31st to 06:00 on August 1st, UTC
+    check_correctness(camera_ids, utc_ts(2017, 7, 31, 18), utc_ts(2017, 8, 1, 6))
+    measure_fan_out(camera_ids, latency_secs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import base64
+import hashlib
+import hmac
+import json
+import struct
+from decimal import Decimal, InvalidOperation
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def frame_digest(frame_id):
+    '''A short digest of a frame id, by which since cursors remember the frames a client already has.'''
+    return hashlib.sha256(frame_id.encode('utf-8')).digest()[:6]
+
+
+class FrameCursorCodec(object):
+    '''Encodes the position of a frame, (processed_timestamp, frame_id), as an opaque signed cursor.
+
+    A cursor is "<payload>.<signature>", both URL-safe base64. The signature is a
+    truncated HMAC-SHA256 of the payload, so clients cannot forge or alter the
+    position that Frame Fetcher turns into an ExclusiveStartKey.
+
+    Since cursors also carry a floor position and the frames the client already
+    has between the floor and the position, as frame_digest() digests with their
+    processed_timestamp in milliseconds behind the position. Frames committed
+    late, behind the position, are found by querying from the floor.
+    '''
+
+    signature_bytes = 16
+    seen_format = '>6sI'
+
+    def __init__(self, key):
+        self.key = key.encode('utf-8') if isinstance(key, str) else key
+
+    def _sign(self, payload):
+        return hmac.new(self.key, payload, hashlib.sha256).digest()[:self.signature_bytes]
+
+    def _encode_payload(self, fields):
+        payload = json.dumps(fields, separators=(',', ':')).encode('utf-8')
+        return '{}.{}'.format(_b64encode(payload), _b64encode(self._sign(payload)))
+
+    def encode(self, item):
+        return self._encode_payload([str(item['processed_timestamp']), item['frame_id']])
+
+    def encode_since(self, position, floor, seen):
+        '''Encode a since cursor: a position, a floor position and a {digest: processed_timestamp} of seen frames.'''
+        packed = b''.join(
+            struct.pack(self.seen_format, digest, min(max(int((position[0] - ts) * 1000), 0), 0xffffffff))
+            for digest, ts in sorted(seen.items()))
+        return self._encode_payload([str(position[0]), position[1], str(floor[0]), floor[1], _b64encode(packed)])
+
+    def decode(self, cursor):
+        '''Return the (processed_timestamp, frame_id) position of a cursor. Raises InvalidCursor.'''
+        return self.decode_since(cursor)[0]
+
+    def decode_since(self, cursor):
+        '''Return the position, floor and seen frames of a cursor. Raises InvalidCursor.
+
+        A cursor encoded by encode() is its own floor, with no seen frames. The
+        timestamps of seen frames are rounded up to the millisecond.
+        '''
+        try:
+            payload_text, signature_text = cursor.split('.')
+            payload = _b64decode(payload_text)
+            signature = _b64decode(signature_text)
+        except (ValueError, TypeError):
+            raise InvalidCursor('Malformed cursor')
+
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidCursor('Cursor signature does not match')
+
+        try:
+            fields = json.loads(payload.decode('utf-8'))
+            position = (Decimal(fields[0]), str(fields[1]))
+            if len(fields) == 2:
+                return position, position, {}
+            floor = (Decimal(fields[2]), None if fields[3] is None else str(fields[3]))
+            packed = _b64decode(fields[4])
+            seen = {}
+            for digest, offset_ms in struct.iter_unpack(self.seen_format, packed):
+                seen[digest] = position[0] - Decimal(offset_ms) / 1000
+            return position, floor, seen
+        except (ValueError, TypeError, IndexError, InvalidOperation, struct.error):
+            raise InvalidCursor('Malformed cursor')
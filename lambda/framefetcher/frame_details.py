@@ -0,0 +1,59 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import time
+
+#DynamoDB BatchGetItem accepts at most 100 keys per request
+ddb_batch_get_max_keys = 100
+
+
+class FrameDetails(object):
+    '''Reads the full items of frames by frame_id from the table.
+
+    One frame is read with GetItem and several with BatchGetItem. Keys that
+    DynamoDB leaves unprocessed are retried with exponential backoff, up to
+    max_attempts in total. The read capacity consumed is added up in
+    consumed_capacity.
+    '''
+
+    def __init__(self, table, max_attempts=5, backoff_secs=0.05):
+        #The low-level client is thread safe, unlike the Table resource
+        self.client = table.meta.client
+        self.table_name = table.name
+        self.max_attempts = max_attempts
+        self.backoff_secs = backoff_secs
+
+        self.consumed_capacity = 0.0
+
+    def get(self, frame_ids):
+        '''Return the items of frame_ids, in the order asked for. Frames that do not exist are left out.'''
+        frame_ids = list(dict.fromkeys(frame_ids))
+        if len(frame_ids) == 1:
+            response = self.client.get_item(TableName=self.table_name, Key={'frame_id': frame_ids[0]},
+                                            ReturnConsumedCapacity='TOTAL')
+            self.consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+            return [response['Item']] if 'Item' in response else []
+
+        items = {}
+        for start in range(0, len(frame_ids), ddb_batch_get_max_keys):
+            keys = [{'frame_id': frame_id} for frame_id in frame_ids[start:start + ddb_batch_get_max_keys]]
+            for attempt in range(self.max_attempts):
+                if attempt > 0:
+                    time.sleep(self.backoff_secs * (2 ** (attempt - 1)))
+
+                response = self.client.batch_get_item(RequestItems={self.table_name: {'Keys': keys}},
+                                                      ReturnConsumedCapacity='TOTAL')
+                for capacity in response.get('ConsumedCapacity', []):
+                    self.consumed_capacity += capacity.get('CapacityUnits', 0.0)
+                for item in response['Responses'].get(self.table_name, []):
+                    items[item['frame_id']] = item
+
+                keys = response.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys', [])
+                if not keys:
+                    break
+            else:
+                raise RuntimeError('{} frames could not be read after {} attempts'.format(len(keys), self.max_attempts))
+
+        return [items[frame_id] for frame_id in frame_ids if frame_id in items]
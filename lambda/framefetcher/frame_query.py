@@ -0,0 +1,176 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import datetime
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key
+
+#Image Processor indexes every frame under "<camera id>#<UTC time bucket>[#<salt>]"
+time_bucket_formats = {
+    'hour': '%Y%m%d%H',
+    'day': '%Y%m%d'
+}
+time_bucket_steps = {
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1)
+}
+
+
+def time_buckets(start_ts, end_ts, time_bucket):
+    '''Return the UTC time buckets overlapping [start_ts, end_ts], newest first.'''
+    bucket_format = time_bucket_formats[time_bucket]
+    start = datetime.datetime.utcfromtimestamp(start_ts)
+    bucket = datetime.datetime.strptime(datetime.datetime.utcfromtimestamp(end_ts).strftime(bucket_format), bucket_format)
+
+    buckets = []
+    while True:
+        buckets.append(bucket.strftime(bucket_format))
+        if bucket <= start:
+            return buckets
+        bucket -= time_bucket_steps[time_bucket]
+
+
+def bucket_keys(camera_ids, bucket, salts):
+    '''Return the GSI hash keys of a time bucket, for every camera and salt.'''
+    if salts > 1:
+        return ['{}#{}#{}'.format(camera_id, bucket, salt) for camera_id in camera_ids for salt in range(salts)]
+    return ['{}#{}'.format(camera_id, bucket) for camera_id in camera_ids]
+
+
+class FrameQuery(object):
+    '''Pages through the frames of a time window by querying every camera and time bucket of the window.
+
+    Frames are ordered by (processed_timestamp, frame_id). A page starts after
+    an exclusive position: the (processed_timestamp, frame_id) of the last frame
+    of the previous page, which is passed to every query as ExclusiveStartKey, or
+    (timestamp, None) for a plain timestamp.
+
+    Buckets are queried from the page's starting position outwards, in waves of
+    parallel queries. The first wave queries only the bucket at the starting
+    position, and each further wave twice as many buckets as the one before, up
+    to max_parallel_queries queries. Once a wave brings the number of frames
+    found to limit, the remaining buckets cannot hold frames closer to the
+    starting position and are not queried. A poll for the newest few frames thus
+    usually costs one query per camera and salt.
+
+    If attributes is given, only those attributes (plus the keys) are read. The
+    read capacity consumed by all queries is added up in consumed_capacity.
+    '''
+
+    def __init__(self, table, index_name, camera_ids, time_bucket='hour', salts=1, max_parallel_queries=16,
+                 attributes=None):
+        #The low-level client is thread safe, unlike the Table resource
+        self.client = table.meta.client
+        self.table_name = table.name
+        self.index_name = index_name
+        self.camera_ids = list(camera_ids)
+        self.time_bucket = time_bucket
+        self.salts = max(1, salts)
+        self.max_parallel_queries = max(1, max_parallel_queries)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_parallel_queries)
+
+        self.projection = None
+        if attributes is not None:
+            names = ['frame_id', 'camera_time_bucket', 'processed_timestamp']
+            names += [name for name in attributes if name not in names]
+            self.projection = {
+                'ProjectionExpression': ', '.join('#a{}'.format(index) for index in range(len(names))),
+                'ExpressionAttributeNames': {'#a{}'.format(index): name for index, name in enumerate(names)}
+            }
+
+        self.queries = 0
+        self.consumed_capacity = 0.0
+
+    def newest(self, start_ts, end_ts, limit, before=None):
+        '''Return up to limit frames processed from start_ts to end_ts and before the position before, newest first.'''
+        start = Decimal(repr(start_ts))
+        end = Decimal(repr(end_ts))
+        if before is not None:
+            if before[0] < start:
+                return []
+            end = min(end, before[0])
+        return self._page(start, end, limit, before, newest_first=True)
+
+    def oldest(self, start_ts, end_ts, limit, after=None):
+        '''Return up to limit frames processed from start_ts to end_ts and after the position after, oldest first.'''
+        start = Decimal(repr(start_ts))
+        end = Decimal(repr(end_ts))
+        if after is not None:
+            if after[0] > end:
+                return []
+            start = max(start, after[0])
+        return self._page(start, end, limit, after, newest_first=False)
+
+    def _page(self, start, end, limit, position, newest_first):
+        keys_per_bucket = len(self.camera_ids) * self.salts
+        max_buckets_per_wave = max(1, self.max_parallel_queries // max(1, keys_per_bucket))
+        buckets = time_buckets(float(start), float(end), self.time_bucket)
+        if not newest_first:
+            buckets.reverse()
+
+        results = []
+        found = 0
+        wave_start = 0
+        buckets_per_wave = 1
+        while wave_start < len(buckets):
+            wave = buckets[wave_start:wave_start + buckets_per_wave]
+            wave_start += len(wave)
+            buckets_per_wave = min(buckets_per_wave * 2, max_buckets_per_wave)
+            keys = [key for bucket in wave for key in bucket_keys(self.camera_ids, bucket, self.salts)]
+            query_key = lambda key: self._query_key(key, start, end, limit, position, newest_first)
+            if len(keys) > 1:
+                wave_results = list(self.executor.map(query_key, keys))
+            else:
+                wave_results = [query_key(key) for key in keys]
+
+            results.extend(items for items, capacity in wave_results)
+            found += sum(len(items) for items, capacity in wave_results)
+            self.consumed_capacity += sum(capacity for items, capacity in wave_results)
+            if found >= limit:
+                break
+
+        #Every key's frames are already in page order, so a merge is enough
+        merged = heapq.merge(*results, key=lambda item: (item['processed_timestamp'], item['frame_id']),
+                             reverse=newest_first)
+        return [item for index, item in zip(range(limit), merged)]
+
+    def _query_key(self, key, start, end, limit, position, newest_first):
+        items = []
+        query_args = {
+            'TableName': self.table_name,
+            'IndexName': self.index_name,
+            'KeyConditionExpression': Key('camera_time_bucket').eq(key) & Key('processed_timestamp').between(start, end),
+            'ScanIndexForward': not newest_first,
+            'Limit': limit,
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        query_args.update(self.projection or {})
+        capacity = 0.0
+
+        #A plain timestamp is exclusive too, but is not an index key; frames at it are dropped
+        at_timestamp = None
+        if position is not None:
+            if position[1] is not None:
+                query_args['ExclusiveStartKey'] = {
+                    'frame_id': position[1],
+                    'camera_time_bucket': key,
+                    'processed_timestamp': position[0]
+                }
+            else:
+                at_timestamp = position[0]
+
+        while len(items) < limit:
+            self.queries += 1
+            response = self.client.query(**query_args)
+            capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+            items.extend(item for item in response['Items'] if item['processed_timestamp'] != at_timestamp)
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            query_args['Limit'] = limit - len(items)
+        return items[:limit], capacity
@@ -6,12 +6,19 @@
 from __future__ import print_function
 
 import boto3
-from boto3.dynamodb.conditions import Key, Attr
-import datetime
 import time
 import json
 import decimal
-from datetime import timedelta
+import math
+import os
+from presigned_url_cache import PresignedUrlCache
+from frame_query import FrameQuery
+from frame_cursor import FrameCursorCodec, InvalidCursor, frame_digest
+from frame_details import FrameDetails
+from response_encoding import encode_response, page_etag, not_modified
+
+#Attributes of the list view. They must be projected into the GSI.
+list_attributes = ['approx_capture_timestamp', 'camera_id', 'label_summary', 's3_bucket', 's3_key']
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -29,75 +36,257 @@ def load_config():
         conf_json = conf_file.read()
         return json.loads(conf_json)
 
-def respond(err, res=None):
+def respond(err, res=None, headers=None, err_status='400'):
+    response_headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': "*",
+        'Access-Control-Expose-Headers': "X-Next-Since,X-Next-Before,ETag"
+    }
+    response_headers.update(headers or {})
+    return {
+        'statusCode': err_status if err else '200',
+        'body': str(err) if err else json.dumps(res, cls=DecimalEncoder),
+        'headers': response_headers,
+    }
+
+def respond_not_modified(headers):
+    response = respond(None, headers=headers)
+    response.update(statusCode='304', body='')
+    return response
+
+def frame_positions(items):
+    return [(item['processed_timestamp'], item['frame_id']) for item in items]
+
+
+class RuntimeContext(object):
+    '''Clients, configuration and presigned URLs, kept by a Lambda container across invocations.'''
+
+    def __init__(self, config, s3_client=None, dynamodb=None):
+        self.config = config
+
+        self.s3_client = s3_client or boto3.client('s3')
+        dynamodb = dynamodb or boto3.resource('dynamodb')
+
+        self.ddb_table = dynamodb.Table(config['ddb_table'])
+        self.ddb_gsi_name = config['ddb_gsi_name']
+        self.fetch_horizon_hrs = float(config['fetch_horizon_hrs'])
+        self.fetch_limit = config['fetch_limit']
+        self.max_fetch_limit = int(config.get('max_fetch_limit', 100))
+        #How long after its processed_timestamp a frame may still become visible in the GSI
+        self.since_overlap = decimal.Decimal(repr(float(config.get('since_overlap_secs', 60))))
+        self.gzip_min_bytes = int(config.get('gzip_min_bytes', 1024)) if config.get('gzip_enabled', True) else None
+
+        #Cursors must verify in every container, so the key is shared through the
+        #packaged config. A per-container key is only good for local runs.
+        cursor_signing_key = config.get('cursor_signing_key', '')
+        if not cursor_signing_key:
+            print('No cursor_signing_key configured; cursors are only valid in this container.')
+            cursor_signing_key = os.urandom(32)
+        self.cursors = FrameCursorCodec(cursor_signing_key)
+
+        #Frames are indexed by camera and time bucket, so every bucket of the fetch
+        #horizon is queried for every camera.
+        self.frame_query = FrameQuery(
+            self.ddb_table,
+            self.ddb_gsi_name,
+            config.get('camera_ids', ['camera0']),
+            time_bucket=config.get('ddb_time_bucket', 'hour'),
+            salts=int(config.get('ddb_bucket_salts', 1)),
+            max_parallel_queries=int(config.get('max_parallel_queries', 16)),
+            attributes=list_attributes
+        )
+        self.frame_details = FrameDetails(
+            self.ddb_table,
+            max_attempts=int(config.get('ddb_batch_max_attempts', 5)),
+            backoff_secs=float(config.get('ddb_batch_backoff_secs', 0.05))
+        )
+
+        # Note the following. 
+        # (1) even if the url expires in days or weeks, the presigned 
+        # url is usable only if the temporary IAM credentials that generated 
+        # it haven't expired. These are the credentials assumed by this lambda function.
+        # (2) Your bucket policy needs to allow "read" access to "authenticated AWS users"
+        # (3) Ensure this Lambda function's role has S3FullAccess policy attached to it. 
+        self.presigned_urls = PresignedUrlCache(
+            self.s3_client,
+            int(config["s3_pre_signed_url_expiry"]),
+            margin_secs=int(config.get("s3_pre_signed_url_cache_margin_secs", 300)),
+            max_entries=int(config.get("s3_pre_signed_url_cache_max_entries", 1024))
+        )
+
+
+_runtime = None
+
+def get_runtime():
+    '''Return the runtime context, creating it on the first (cold) invocation.'''
+    global _runtime
+    if _runtime is None:
+        _runtime = RuntimeContext(load_config())
+    return _runtime
+
+def reset_runtime(runtime=None):
+    '''Discard the cached runtime context, or replace it with the given one (e.g. built with stub clients).'''
+    global _runtime
+    _runtime = runtime
+
+
+def parse_position(value, runtime):
+    '''Return the (processed_timestamp, frame_id) position of a since/before parameter: a timestamp or a cursor.'''
+    try:
+        ts = float(value)
+    except ValueError:
+        return runtime.cursors.decode(value)
+    if not math.isfinite(ts):
+        raise ValueError('Timestamps must be finite')
+    return decimal.Decimal(repr(ts)), None
+
+def parse_since(value, runtime):
+    '''Return the position, floor and seen frames of a since parameter: a timestamp or a cursor.'''
+    try:
+        float(value)
+    except ValueError:
+        return runtime.cursors.decode_since(value)
+    position = parse_position(value, runtime)
+    return position, position, {}
+
+def later_position(a, b):
+    '''Return the later of two exclusive positions. (timestamp, None) is after every frame at the timestamp.'''
+    return max(a, b, key=lambda position: (position[0], position[1] is None, position[1] or ''))
+
+def next_since(runtime, position, floor, seen, items):
+    '''Return the since cursor for a client that has the seen frames and items.
+
+    The floor trails the newest position by since_overlap_secs, so the next poll
+    also finds frames committed late behind it, and skips the ones the client has.
+    '''
+    for item in items:
+        position = later_position(position, (item['processed_timestamp'], item['frame_id']))
+    floor = later_position(floor, (position[0] - runtime.since_overlap, None))
+    seen = dict(seen)
+    seen.update((frame_digest(item['frame_id']), item['processed_timestamp']) for item in items)
+    seen = {digest: ts for digest, ts in seen.items() if ts >= floor[0]}
+    return runtime.cursors.encode_since(position, floor, seen)
+
+def parse_limit(value, runtime):
+    if value is None:
+        return runtime.fetch_limit
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= runtime.max_fetch_limit:
+        raise ValueError('limit must be between 1 and {}'.format(runtime.max_fetch_limit))
+    return limit
+
+def list_view(item, runtime):
+    '''Return the summary of a frame returned by list requests.'''
     return {
-        'statusCode': '400' if err else '200',
-        'body': err.message if err else json.dumps(res, cls=DecimalEncoder),
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': "*"
-        },
+        'frame_id': item['frame_id'],
+        'processed_timestamp': item['processed_timestamp'],
+        'approx_capture_timestamp': item.get('approx_capture_timestamp'),
+        'camera_id': item.get('camera_id'),
+        #Frames stored before label summaries were written have none
+        'label_summary': item.get('label_summary', []),
+        's3_presigned_url': runtime.presigned_urls.get(item["s3_bucket"], item["s3_key"])
     }
 
 
+def fetch_frame_details(event, frame_ids, runtime):
+
+    frame_ids = [frame_id for frame_id in frame_ids.split(',') if frame_id]
+    if not 1 <= len(frame_ids) <= runtime.max_fetch_limit:
+        return respond(ValueError('Between 1 and {} frame ids are required'.format(runtime.max_fetch_limit)))
+
+    capacity_before = runtime.frame_details.consumed_capacity
+    try:
+        items = runtime.frame_details.get(frame_ids)
+    except RuntimeError as err:
+        return respond(err, err_status='503')
+    if not items:
+        return respond(ValueError('No such frame'), err_status='404')
+
+    #Checked before presigning: a client that has these frames needs no new URLs
+    headers = {'ETag': page_etag('detail', frame_ids, frame_positions(items))}
+    if not_modified(event, headers):
+        return respond_not_modified(headers)
+
+    for item in items:
+        item['s3_presigned_url'] = runtime.presigned_urls.get(item["s3_bucket"], item["s3_key"])
+
+    print (items)
+    print ('Consumed read capacity: {}'.format(runtime.frame_details.consumed_capacity - capacity_before))
+
+    return respond(None, items, headers)
+
+
 def fetch_frames(event, context):
 
-    #Initialize clients
-    dynamodb = boto3.resource('dynamodb')
-    s3_client = boto3.client('s3')
-    
-    #Load config
-    config = load_config()
+    runtime = get_runtime()
 
-    ddb_table = dynamodb.Table(config['ddb_table'])
-    ddb_gsi_name = config['ddb_gsi_name']
-    fetch_horizon_hrs = float(config['fetch_horizon_hrs'])
-    fetch_limit = config['fetch_limit']
+    #Process "GET" request for the full items of frames
+    path_params = event.get('pathParameters') or {}
+    if event['httpMethod'] == "GET" and path_params.get('frame_ids'):
+        return fetch_frame_details(event, path_params['frame_ids'], runtime)
 
     #Process "GET" request
     if event['httpMethod'] == "GET":
-        now = datetime.datetime.now()
-        year = now.strftime("%Y")
-        mon = now.strftime("%m")
-
-        ts_at_fetch_horizon = time.time() - (fetch_horizon_hrs * 60 * 60)
-
-        ddb_resp = ddb_table.query(
-            IndexName=ddb_gsi_name,
-            
-            KeyConditionExpression=Key('processed_year_month').eq(year + mon) 
-            & Key('processed_timestamp').gt(decimal.Decimal(ts_at_fetch_horizon)),
-            Limit=fetch_limit,
-            ScanIndexForward=False #Sort descendingly -- show most recent captured frames first.
-        )
+        params = event.get('queryStringParameters') or {}
+        try:
+            limit = parse_limit(params.get('limit'), runtime)
+            since = parse_since(params['since'], runtime) if params.get('since') else None
+            before = parse_position(params['before'], runtime) if params.get('before') else None
+        except (ValueError, InvalidCursor) as err:
+            return respond(err)
+
+        capacity_before = runtime.frame_query.consumed_capacity
+        now_ts = time.time()
+        ts_at_fetch_horizon = now_ts - (runtime.fetch_horizon_hrs * 60 * 60)
+        if before is not None:
+            now_ts = min(now_ts, float(before[0]))
+
+        headers = {}
+        if since is not None:
+            #Only frames the client does not have: the oldest of them first, so
+            #polls continue without gaps, then returned newest first like any page.
+            #Frames are queried from the floor, behind the position, to find the
+            #ones committed late, and the frames the client has are dropped.
+            position, floor, seen = since
+            items = runtime.frame_query.oldest(ts_at_fetch_horizon, now_ts, limit + len(seen), after=floor)
+            items = [item for item in items if frame_digest(item['frame_id']) not in seen]
+            if before is not None:
+                items = [item for item in items
+                         if (item['processed_timestamp'], item['frame_id']) < (before[0], before[1] or '')]
+            items = items[:limit]
+            #A full page means more new frames are waiting for the next poll
+            headers['X-Next-Since'] = next_since(runtime, position, floor, seen, items) if items else params['since']
+            items.reverse()
+        else:
+            #Most recent captured frames first
+            items = runtime.frame_query.newest(ts_at_fetch_horizon, now_ts, limit, before=before)
+            if items:
+                #The client has every frame from the oldest of a full page, or from the fetch horizon
+                floor = ((items[-1]['processed_timestamp'], items[-1]['frame_id']) if len(items) == limit
+                         else (decimal.Decimal(repr(ts_at_fetch_horizon)), None))
+                headers['X-Next-Since'] = next_since(runtime, floor, floor, {}, items)
+            #A full page may have older frames after it
+            if len(items) == limit:
+                headers['X-Next-Before'] = runtime.cursors.encode(items[-1])
+
+        #Checked before presigning: a client that has this page needs no new URLs
+        headers['ETag'] = page_etag('list', limit, params.get('since'), params.get('before'), frame_positions(items))
+        if not_modified(event, headers):
+            print ('Not modified. Consumed read capacity: {}'.format(runtime.frame_query.consumed_capacity - capacity_before))
+            return respond_not_modified(headers)
 
-        for item in ddb_resp["Items"]:
-
-            s3_key = item["s3_key"]
-            s3_bucket = item["s3_bucket"]
-            # Note the following. 
-            # (1) even if the url expires in days or weeks, the presigned 
-            # url is usable only if the temporary IAM credentials that generated 
-            # it haven't expired. These are the credentials assumed by this lambda function.
-            # (2) Your bucket policy needs to allow "read" access to "authenticated AWS users"
-            # (3) Ensure this Lambda function's role has S3FullAccess policy attached to it. 
-            s3_presigned_url_expiry = config["s3_pre_signed_url_expiry"]
-
-            s3_presigned_url = s3_client.generate_presigned_url(
-                ClientMethod='get_object',
-                Params={
-                    'Bucket' : s3_bucket,
-                    'Key' : s3_key
-                },
-                ExpiresIn=s3_presigned_url_expiry
-            )
-
-            item['s3_presigned_url'] = s3_presigned_url
+        items = [list_view(item, runtime) for item in items]
         
-        print (ddb_resp)
+        print (items)
+        print ('Presigned URL cache: {}'.format(runtime.presigned_urls.stats()))
+        print ('Consumed read capacity: {}'.format(runtime.frame_query.consumed_capacity - capacity_before))
 
-        return respond(None, ddb_resp["Items"])
+        return respond(None, items, headers)
 
 def handler(event, context):
-    return fetch_frames(event, context)
+    response = fetch_frames(event, context)
+    return encode_response(event, response, get_runtime().gzip_min_bytes)
     
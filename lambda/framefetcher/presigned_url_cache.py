@@ -0,0 +1,66 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class PresignedUrlCache(object):
+    '''Hands out presigned S3 GET URLs, reusing a URL until it is about to expire.
+
+    A URL is generated with expiry_secs and reused until less than margin_secs of
+    it remain. The least recently used URLs are evicted beyond max_entries. URLs
+    are signed with the credentials of the Lambda container, the same as freshly
+    generated ones, so a cached URL does not outlive them any more than a new one would.
+    '''
+
+    def __init__(self, s3_client, expiry_secs, margin_secs=300, max_entries=1024):
+        self.s3_client = s3_client
+        self.expiry_secs = expiry_secs
+        self.margin_secs = min(margin_secs, expiry_secs)
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        #(bucket, key) -> (reuse until, url)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, bucket, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((bucket, key))
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end((bucket, key))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        url = self.s3_client.generate_presigned_url(
+            ClientMethod='get_object',
+            Params={
+                'Bucket' : bucket,
+                'Key' : key
+            },
+            ExpiresIn=self.expiry_secs
+        )
+
+        with self._lock:
+            self._entries[(bucket, key)] = (now + self.expiry_secs - self.margin_secs, url)
+            self._entries.move_to_end((bucket, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return url
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries)
+            }
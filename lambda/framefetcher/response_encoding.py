@@ -0,0 +1,89 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import base64
+import gzip
+import hashlib
+import json
+
+
+def request_header(event, name):
+    '''Return a header of an API Gateway proxy event, whatever its case, or None.'''
+    name = name.lower()
+    for header, value in (event.get('headers') or {}).items():
+        if header.lower() == name:
+            return value
+    return None
+
+def page_etag(*parts):
+    '''A weak entity tag of a response, from the parts that determine it: its request and the positions of its frames.
+
+    Unlike a digest of the body, it does not depend on the pre-signed URLs, so
+    it is the same in every container and can be checked before presigning.
+    It is weak: the same for every Content-Encoding of the body.
+    '''
+    text = json.dumps(parts, default=str, separators=(',', ':'))
+    return 'W/"{}"'.format(hashlib.sha256(text.encode('utf-8')).hexdigest()[:32])
+
+def etag_matches(if_none_match, etag):
+    '''Weak comparison of an If-None-Match header with an entity tag.'''
+    if if_none_match is None:
+        return False
+    opaque_tag = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == opaque_tag:
+            return True
+    return False
+
+def accepts_gzip(accept_encoding):
+    '''Whether an Accept-Encoding header allows gzip.'''
+    if not accept_encoding:
+        return False
+    for coding in accept_encoding.split(','):
+        params = [param.strip() for param in coding.split(';')]
+        if params[0].lower() not in ('gzip', '*'):
+            continue
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def not_modified(event, headers):
+    '''Whether the If-None-Match header of a request matches the ETag in headers.'''
+    return etag_matches(request_header(event, 'If-None-Match'), headers['ETag'])
+
+
+def encode_response(event, response, gzip_min_bytes=None, compress_level=6):
+    '''Add caching headers to a 200 or 304 response and compress a 200 body if the client accepts gzip.
+
+    Bodies of at least gzip_min_bytes are gzipped and base64 encoded, which
+    API Gateway decodes back to binary since the API has binary media types.
+    gzip_min_bytes of None disables compression.
+    '''
+    if not response or response['statusCode'] not in ('200', '304'):
+        return response
+
+    headers = response['headers']
+    #Clients may keep the body, but must ask whether it changed before using it
+    headers['Cache-Control'] = 'no-cache'
+    headers['Vary'] = 'Accept-Encoding'
+    if response['statusCode'] == '304':
+        return response
+
+    body = response['body'].encode('utf-8')
+    if (gzip_min_bytes is not None and len(body) >= gzip_min_bytes
+            and accepts_gzip(request_header(event, 'Accept-Encoding'))):
+        response['body'] = base64.b64encode(gzip.compress(body, compress_level)).decode('ascii')
+        response['isBase64Encoded'] = True
+        headers['Content-Encoding'] = 'gzip'
+
+    return response
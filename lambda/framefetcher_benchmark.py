@@ -0,0 +1,169 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Replays Web UI polling against Frame Fetcher and reports per-request latency and
+presign calls.
+
+usage: framefetcher_benchmark.py [browsers] [minutes] [frames-per-sec]
+
+Every browser polls every 3 seconds while frames are stored at frames-per-sec.
+DynamoDB is a stand-in that answers from memory. S3 URLs are presigned by a real
+boto3 client with dummy credentials (presigning makes no network calls). The
+handler as it was before clients and presigned URLs were reused, which creates
+its clients and reads its config on every request, is timed first.
+'''
+
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIAEXAMPLEEXAMPLE00')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'example-secret-access-key')
+os.environ.setdefault('AWS_EC2_METADATA_DISABLED', 'true')
+
+import boto3
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'framefetcher'))
+
+import framefetcher
+from frame_query_simulation import StandInIndex, StandInTable, camera_time_bucket
+
+poll_interval_secs = 3
+config_path = os.path.join(base_dir, '..', 'config', 'framefetcher-params.json')
+
+
+class FrameTable(StandInTable):
+    '''Frames stored at fps, up to the current poll, indexed the way Image Processor writes them.'''
+
+    def __init__(self, name, fps, start_ts):
+        StandInTable.__init__(self, name, StandInIndex())
+        self.fps = fps
+        self.start_ts = start_ts
+        self.items = []
+
+    def store_frames(self, frame_count):
+        while len(self.items) < frame_count:
+            index = len(self.items)
+            ts = self.start_ts + index / self.fps
+            frame_id = 'frame-{:08x}'.format(index)
+            item = {
+                'frame_id': frame_id,
+                'processed_timestamp': Decimal(repr(ts)),
+                'approx_capture_timestamp': Decimal(repr(ts - 0.25)),
+                'rekog_labels': [{'Name': 'Person', 'Confidence': Decimal('97.5'), 'OnWatchList': False,
+                                  'Instances': [], 'Parents': []}],
+                'rekog_orientation_correction': 'ROTATE_0',
+                'camera_id': 'camera0',
+                'camera_time_bucket': camera_time_bucket('camera0', ts, 'hour', 1, frame_id),
+                's3_bucket': 'frames-bucket',
+                's3_key': 'frames/{}.jpg'.format(frame_id)
+            }
+            self.meta.client.put(item)
+            self.items.append(item)
+
+    def newest(self, limit):
+        return [dict(item) for item in self.items[:-limit - 1:-1]]
+
+
+class FrameDynamoDB(object):
+
+    def __init__(self, table):
+        self.table = table
+
+    def Table(self, name):
+        return self.table
+
+
+class CountingPresigner(object):
+    '''Counts presign calls made through a real S3 client.'''
+
+    presign_calls = 0
+
+    def __init__(self):
+        self.s3_client = boto3.client('s3')
+
+    def generate_presigned_url(self, **kwargs):
+        CountingPresigner.presign_calls += 1
+        return self.s3_client.generate_presigned_url(**kwargs)
+
+
+def legacy_fetch_frames(event, table):
+    '''The GET handler before clients and presigned URLs were reused, querying table.'''
+    dynamodb = boto3.resource('dynamodb')
+    s3_client = boto3.client('s3')
+
+    with open(config_path, 'r') as conf_file:
+        config = json.loads(conf_file.read())
+
+    dynamodb.Table(config['ddb_table'])
+    ddb_resp = {'Items': table.newest(config['fetch_limit'])}
+    for item in ddb_resp["Items"]:
+        item['s3_presigned_url'] = s3_client.generate_presigned_url(
+            ClientMethod='get_object',
+            Params={
+                'Bucket' : item["s3_bucket"],
+                'Key' : item["s3_key"]
+            },
+            ExpiresIn=config["s3_pre_signed_url_expiry"]
+        )
+        CountingPresigner.presign_calls += 1
+    print(ddb_resp)
+    return framefetcher.respond(None, ddb_resp["Items"])
+
+
+def replay(handle, table, browsers, minutes, fps):
+    '''Returns the mean and 95th percentile request latency, in seconds.'''
+    latencies = []
+    for poll in range(int(minutes * 60 / poll_interval_secs)):
+        table.store_frames(int(poll * poll_interval_secs * fps) + 1)
+        for browser in range(browsers):
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                handle({'httpMethod': 'GET'})
+                latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return sum(latencies) / len(latencies), latencies[int(len(latencies) * 0.95)], len(latencies)
+
+
+def main():
+    browsers = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    minutes = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    fps = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+
+    with open(config_path, 'r') as conf_file:
+        config = json.loads(conf_file.read())
+
+    print("{} browsers polling every {} s for {} minutes, {} frames/sec stored, fetch_limit {}.".format(
+        browsers, poll_interval_secs, minutes, fps, config['fetch_limit']))
+
+    modes = [
+        ('per-request clients', None),
+        ('warm, no URL cache', dict(config, s3_pre_signed_url_cache_max_entries=0)),
+        ('warm, URL cache', config)
+    ]
+    for name, mode_config in modes:
+        #Frames are stored during the run; the run is replayed faster than real time
+        table = FrameTable(config['ddb_table'], fps, time.time() - minutes * 60)
+        CountingPresigner.presign_calls = 0
+        if mode_config is None:
+            handle = lambda event: legacy_fetch_frames(event, table)
+        else:
+            framefetcher.reset_runtime(framefetcher.RuntimeContext(
+                mode_config, s3_client=CountingPresigner(), dynamodb=FrameDynamoDB(table)))
+            handle = lambda event: framefetcher.handler(event, None)
+
+        mean, p95, requests = replay(handle, table, browsers, minutes, fps)
+        print("{:<20} mean {:.2f} ms, p95 {:.2f} ms, {} presign calls for {} requests".format(
+            name + ':', mean * 1000, p95 * 1000, CountingPresigner.presign_calls, requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import io
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+from PIL import Image
+
+#dHash compares each pixel of a (HASH_SIZE + 1) x HASH_SIZE grayscale thumbnail with its right neighbour.
+HASH_SIZE = 8
+#Brightness steps at or below this count as flat, so sensor noise in flat areas does not flip bits.
+DHASH_MIN_GRADIENT = 2
+
+
+def dhash(img_bytes):
+    '''Compute a 64-bit difference hash of a JPEG image.'''
+    img = Image.open(io.BytesIO(img_bytes))
+    #Let the JPEG decoder downscale and drop chroma while decoding. Much cheaper than a full decode.
+    img.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    pixels = list(img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] - pixels[offset + col + 1] > DHASH_MIN_GRADIENT)
+    return value
+
+
+def hamming_distance(hash1, hash2):
+    return bin(hash1 ^ hash2).count('1')
+
+
+class FrameDedupCache(object):
+    '''Remembers recent Rekognition responses by perceptual hash of the frame, per camera.
+
+    A frame whose hash is within max_distance bits of a cached frame from the same
+    camera, cached less than ttl_secs ago, reuses that frame's response. The least
+    recently used entries are evicted beyond max_entries.
+    '''
+
+    def __init__(self, max_distance=4, ttl_secs=60.0, max_entries=256, entries_per_camera=4):
+        self.max_distance = max_distance
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self.entries_per_camera = entries_per_camera
+
+        self.hits = 0
+        self.misses = 0
+
+        #(camera id, frame hash) -> (cached at, rekognition response)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, camera_id, frame_hash):
+        '''Return a copy of the cached response for a near-duplicate frame, or None.'''
+        now = time.time()
+        with self._lock:
+            for key in list(self._entries):
+                cached_at, response = self._entries[key]
+                if now - cached_at > self.ttl_secs:
+                    del self._entries[key]
+                    continue
+
+                if key[0] == camera_id and hamming_distance(key[1], frame_hash) <= self.max_distance:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return deepcopy(response)
+
+            self.misses += 1
+            return None
+
+    def put(self, camera_id, frame_hash, response):
+        with self._lock:
+            self._entries[(camera_id, frame_hash)] = (time.time(), deepcopy(response))
+            self._entries.move_to_end((camera_id, frame_hash))
+
+            camera_keys = [key for key in self._entries if key[0] == camera_id]
+            for key in camera_keys[:-self.entries_per_camera]:
+                del self._entries[key]
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+                'entries': len(self._entries)
+            }
@@ -0,0 +1,111 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import codecs
+import io
+import pickle
+import struct
+
+# Binary frame envelope produced by client/frame_format.py. See that module
+# for the layout; the two definitions must stay in sync.
+FRAME_MAGIC = b'RKVF'
+FRAME_FORMAT_VERSION = 1
+FRAME_HEADER = struct.Struct('>4sBBHdQI')
+
+CODECS = {
+    1: 'jpeg'
+}
+
+
+class FrameFormatError(ValueError):
+    pass
+
+
+class _LegacyFrameUnpickler(pickle.Unpickler):
+    '''Unpickler for records from older capture clients. Refuses to load anything but plain data.'''
+
+    safe_classes = {
+        ('builtins', 'bytearray'): bytearray,
+        ('__builtin__', 'bytearray'): bytearray,
+        ('_codecs', 'encode'): codecs.encode #Used by pickle protocols < 3 to rebuild bytes
+    }
+
+    def find_class(self, module, name):
+        if (module, name) in self.safe_classes:
+            return self.safe_classes[(module, name)]
+        raise FrameFormatError('Refusing to unpickle {}.{} from a frame record.'.format(module, name))
+
+
+def parse_frame(data):
+    '''Parse a decoded Kinesis record into a frame package dict.
+
+    ImageBytes is a memoryview over data, so the image payload is not copied.
+    Pickled records sent by older capture clients are still accepted.
+    '''
+    buf = memoryview(data)
+
+    if bytes(buf[:len(FRAME_MAGIC)]) != FRAME_MAGIC:
+        return parse_legacy_frame(data)
+
+    if len(buf) < FRAME_HEADER.size:
+        raise FrameFormatError('Frame record is shorter than the frame header.')
+
+    magic, version, codec, camera_id_len, capture_ts, frame_count, payload_len = \
+        FRAME_HEADER.unpack_from(buf)
+
+    if version != FRAME_FORMAT_VERSION:
+        raise FrameFormatError('Unsupported frame format version {}.'.format(version))
+
+    if codec not in CODECS:
+        raise FrameFormatError('Unsupported frame codec {}.'.format(codec))
+
+    payload_offset = FRAME_HEADER.size + camera_id_len
+    if len(buf) != payload_offset + payload_len:
+        raise FrameFormatError('Frame record length does not match its header.')
+
+    try:
+        camera_id = bytes(buf[FRAME_HEADER.size:payload_offset]).decode('utf-8')
+    except UnicodeDecodeError:
+        raise FrameFormatError('Frame record camera id is not utf-8.')
+
+    return {
+        'ApproximateCaptureTime': capture_ts,
+        'FrameCount': frame_count,
+        'CameraId': camera_id,
+        'Codec': CODECS[codec],
+        'ImageBytes': buf[payload_offset:]
+    }
+
+
+def parse_legacy_frame(data):
+    '''Parse a pickled frame package dict, as sent by older capture clients.
+
+    Any record that is not a well-formed frame package raises FrameFormatError,
+    so a truncated or garbage record is skipped instead of failing the batch.
+    '''
+    try:
+        frame_package = _LegacyFrameUnpickler(io.BytesIO(data)).load()
+    except FrameFormatError:
+        raise
+    except Exception as e:
+        #pickle raises UnpicklingError, EOFError, and also ValueError, TypeError,
+        #IndexError, KeyError and others for truncated or garbage data.
+        raise FrameFormatError('Record is neither a frame envelope nor a legacy frame package: {!r}'.format(e))
+
+    if not isinstance(frame_package, dict):
+        raise FrameFormatError('Legacy frame record is not a frame package.')
+
+    if not isinstance(frame_package.get('ImageBytes'), (bytes, bytearray)):
+        raise FrameFormatError('Legacy frame package has no image bytes.')
+    if not isinstance(frame_package.get('ApproximateCaptureTime'), (int, float)):
+        raise FrameFormatError('Legacy frame package has no capture time.')
+    if not isinstance(frame_package.get('FrameCount'), int):
+        raise FrameFormatError('Legacy frame package has no frame count.')
+
+    frame_package.setdefault('CameraId', '')
+    frame_package.setdefault('Codec', 'jpeg')
+    if not isinstance(frame_package['CameraId'], str):
+        raise FrameFormatError('Legacy frame package has an invalid camera id.')
+    return frame_package
@@ -0,0 +1,69 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import io
+
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+
+#JPEG end-of-image marker. Allow a little trailing padding after it.
+JPEG_EOI = b'\xff\xd9'
+JPEG_EOI_SEARCH_BYTES = 1024
+
+#Quality steps tried when a re-encoded frame is still over the byte budget.
+min_jpeg_quality = 40
+jpeg_quality_step = 15
+
+
+class InvalidFrameError(ValueError):
+    pass
+
+
+def read_jpeg_header(img_bytes):
+    '''Parse a JPEG's headers (up to the start of scan) without decoding any image data.'''
+    if not img_bytes.startswith(b'\xff\xd8'):
+        raise InvalidFrameError('Frame is not a JPEG image.')
+
+    if img_bytes.rfind(JPEG_EOI, max(0, len(img_bytes) - JPEG_EOI_SEARCH_BYTES)) == -1:
+        raise InvalidFrameError('JPEG frame is truncated.')
+
+    try:
+        return JpegImageFile(io.BytesIO(img_bytes))
+    except (SyntaxError, OSError, ValueError) as e:
+        raise InvalidFrameError('Invalid JPEG frame: {}'.format(e))
+
+
+def preflight_frame(img_bytes, max_width, max_height, max_bytes, quality=85):
+    '''Validate a JPEG frame and shrink it if it exceeds the size or byte budget.
+
+    Returns the original bytes when the frame is within budget. Otherwise the frame
+    is decoded with draft(), which lets the JPEG decoder scale it down by 1/2, 1/4
+    or 1/8 in the DCT domain, resized the rest of the way and re-encoded.
+    Raises InvalidFrameError for frames that are not valid JPEG images.
+    '''
+    img = read_jpeg_header(img_bytes)
+    width, height = img.size
+
+    if width <= max_width and height <= max_height and len(img_bytes) <= max_bytes:
+        return img_bytes
+
+    img.draft('RGB', (max_width, max_height))
+    try:
+        img.load()
+    except (SyntaxError, OSError) as e:
+        raise InvalidFrameError('Invalid JPEG frame: {}'.format(e))
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    #draft() only scales by powers of two, so finish off with a regular resize.
+    img.thumbnail((max_width, max_height), Image.BILINEAR)
+
+    while True:
+        out = io.BytesIO()
+        img.save(out, 'JPEG', quality=quality)
+        if out.tell() <= max_bytes or quality <= min_jpeg_quality:
+            return out.getvalue()
+        quality = max(min_jpeg_quality, quality - jpeg_quality_step)
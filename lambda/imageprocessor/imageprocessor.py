@@ -7,14 +7,31 @@ from __future__ import print_function
 import base64
 import datetime
 import time
-from decimal import Decimal
 import uuid
 import json
-import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import boto3
 import pytz
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from pytz import timezone
-from copy import deepcopy
+from frame_format import parse_frame, FrameFormatError
+from frame_dedup import dhash, FrameDedupCache
+from frame_preflight import preflight_frame, InvalidFrameError
+from label_enrichment import WatchListMatcher, enrich_labels, summarize_labels, to_decimal
+from watch_list_alerts import AlertDigest, AlertDispatcher, AlertNotifier, InMemoryAlertStore, DynamoDBAlertStore
+
+#BatchWriteItem service limit
+ddb_batch_write_max_items = 25
+
+#Rekognition errors caused by the frame itself. Retrying such a frame cannot succeed.
+permanent_rekog_errors = frozenset([
+    'InvalidImageFormatException',
+    'ImageTooLargeException',
+    'InvalidParameterException'
+])
 
 def load_config():
     '''Load configuration from file.'''
@@ -22,10 +39,23 @@ def load_config():
         conf_json = conf_file.read()
         return json.loads(conf_json)
 
-def convert_ts(ts, config):
-    '''Converts a timestamp to the configured timezone. Returns a localized datetime object.'''
+#Frames are indexed by camera and UTC time bucket, so writes spread over many GSI partitions
+time_bucket_formats = {
+    'hour': '%Y%m%d%H',
+    'day': '%Y%m%d'
+}
+
+def camera_time_bucket(camera_id, ts, time_bucket, salts, frame_id):
+    '''Return the GSI hash key of a frame: "<camera id>#<UTC time bucket>", plus "#<salt>" with more than one salt.'''
+    key = '{}#{}'.format(camera_id, datetime.datetime.utcfromtimestamp(ts).strftime(time_bucket_formats[time_bucket]))
+    if salts > 1:
+        #Frame ids are UUIDs, so their leading hex digits are evenly spread
+        key += '#{}'.format(int(frame_id[:8], 16) % salts)
+    return key
+
+def convert_ts(ts, tz):
+    '''Converts a timestamp to the given timezone. Returns a localized datetime object.'''
     #lambda_tz = timezone('US/Pacific')
-    tz = timezone(config['timezone'])
     utc = pytz.utc
     
     utc_dt = utc.localize(datetime.datetime.utcfromtimestamp(ts))
@@ -35,152 +65,466 @@ def convert_ts(ts, config):
     return localized_dt
 
 
-def process_image(event, context):
+class StageTimings(object):
+    '''Time spent in each stage of processing a batch, over all of its records.'''
+
+    def __init__(self):
+        #stage -> [count, total secs, max secs]
+        self._stages = {}
+        self._lock = threading.Lock()
 
-    #Initialize clients
-    rekog_client = boto3.client('rekognition')
-    sns_client = boto3.client('sns')
-    s3_client = boto3.client('s3')
-    dynamodb = boto3.resource('dynamodb')
-
-    #Load config
-    config = load_config()
-
-    s3_bucket = config["s3_bucket"]
-    s3_key_frames_root = config["s3_key_frames_root"]
-
-    ddb_table = dynamodb.Table(config["ddb_table"])
-      
-    rekog_max_labels = config["rekog_max_labels"]
-    rekog_min_conf = float(config["rekog_min_conf"])
-
-    label_watch_list = config["label_watch_list"]
-    label_watch_min_conf = float(config["label_watch_min_conf"])
-    label_watch_phone_num = config.get("label_watch_phone_num", "")
-    label_watch_sns_topic_arn = config.get("label_watch_sns_topic_arn", "")
-
-    #Iterate on frames fetched from Kinesis
-    for record in event['Records']:
-
-        frame_package_b64 = record['kinesis']['data']
-        frame_package = pickle.loads(base64.b64decode(frame_package_b64))
-
-        img_bytes = frame_package["ImageBytes"]
-        approx_capture_ts = frame_package["ApproximateCaptureTime"]
-        frame_count = frame_package["FrameCount"]
-        
-        now_ts = time.time()
-
-        frame_id = str(uuid.uuid4())
-        processed_timestamp = Decimal(now_ts)
-        approx_capture_timestamp = Decimal(approx_capture_ts)
-        
-        now = convert_ts(now_ts, config)
-        year = now.strftime("%Y")
-        mon = now.strftime("%m")
-        day = now.strftime("%d")
-        hour = now.strftime("%H")
+    def add(self, stage, secs):
+        with self._lock:
+            timing = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += secs
+            timing[2] = max(timing[2], secs)
 
+    @contextmanager
+    def stage(self, stage):
+        start = time.time()
         try:
-            rekog_response = rekog_client.detect_labels(
-                Image={
-                    'Bytes': img_bytes
-                },
-                MaxLabels=rekog_max_labels,
-                MinConfidence=rekog_min_conf
+            yield
+        finally:
+            self.add(stage, time.time() - start)
+
+    def summary(self):
+        '''Return the count, mean and max duration (in ms) of every stage.'''
+        with self._lock:
+            return dict((stage, {'count': count, 'mean_ms': round(total / count * 1000, 1), 'max_ms': round(max_secs * 1000, 1)})
+                        for stage, (count, total, max_secs) in self._stages.items())
+
+
+class RuntimeContext(object):
+    '''Clients and parsed configuration, built once per Lambda container and reused by warm invocations.'''
+
+    def __init__(self, config, rekog_client=None, sns_client=None, s3_client=None, dynamodb=None):
+        self.config = config
+
+        client_config = Config(
+            max_pool_connections=int(config.get("boto_max_pool_connections", 10)),
+            retries={'max_attempts': int(config.get("boto_max_attempts", 3))}
+        )
+
+        self.rekog_client = rekog_client or boto3.client('rekognition', config=client_config)
+        self.sns_client = sns_client or boto3.client('sns', config=client_config)
+        self.s3_client = s3_client or boto3.client('s3', config=client_config)
+
+        #boto3 resources are not thread safe, so each worker thread gets its own DynamoDB Table.
+        if dynamodb is not None:
+            self._dynamodb_factory = lambda: dynamodb
+        else:
+            self._dynamodb_factory = lambda: boto3.session.Session().resource('dynamodb', config=client_config)
+        self._thread_local = threading.local()
+
+        self.s3_bucket = config["s3_bucket"]
+        self.s3_key_frames_root = config["s3_key_frames_root"]
+
+        self.ddb_table_name = config["ddb_table"]
+        self.ddb_batch_max_attempts = int(config.get("ddb_batch_max_attempts", 5))
+        self.ddb_batch_backoff_secs = float(config.get("ddb_batch_backoff_secs", 0.05))
+        self.ddb_time_bucket = config.get("ddb_time_bucket", "hour")
+        self.ddb_bucket_salts = int(config.get("ddb_bucket_salts", 1))
+        #Frames from clients that do not send a camera id
+        self.default_camera_id = config.get("default_camera_id", "camera0")
+        #Labels copied to the slim label_summary attribute projected into the GSI
+        self.ddb_summary_labels = int(config.get("ddb_summary_labels", 5))
+
+        self.rekog_max_labels = config["rekog_max_labels"]
+        self.rekog_min_conf = float(config["rekog_min_conf"])
+
+        self.label_watch_list = config["label_watch_list"]
+        self.label_watch_min_conf = float(config["label_watch_min_conf"])
+        self.watch_list_matcher = WatchListMatcher(
+            self.label_watch_list,
+            self.label_watch_min_conf,
+            label_thresholds=config.get("label_watch_thresholds"),
+            aliases=config.get("label_watch_aliases"),
+            match_parents=config.get("label_watch_match_parents", False)
+        )
+        self.label_watch_phone_num = config.get("label_watch_phone_num", "")
+        self.label_watch_sns_topic_arn = config.get("label_watch_sns_topic_arn", "")
+
+        self.tz = timezone(config['timezone'])
+
+        #Alerts are rate limited per camera+label. Without a state table, each Lambda
+        #container keeps its own alert history.
+        label_watch_state_table = config.get("label_watch_state_table", "")
+        if label_watch_state_table:
+            alert_store = DynamoDBAlertStore(self._dynamodb_factory().Table(label_watch_state_table))
+        else:
+            alert_store = InMemoryAlertStore()
+
+        #Alert messages are published on background threads, so a slow SNS does not hold
+        #up the batch. Without dispatch threads, they are published before the handler returns.
+        alert_dispatcher = None
+        alert_dispatch_threads = int(config.get("label_watch_dispatch_threads", 0))
+        if alert_dispatch_threads > 0:
+            alert_dispatcher = AlertDispatcher(
+                self.sns_client,
+                threads=alert_dispatch_threads,
+                max_queued=int(config.get("label_watch_max_queued", 100)),
+                max_attempts=int(config.get("label_watch_publish_attempts", 3)),
+                backoff_secs=float(config.get("label_watch_publish_backoff_secs", 0.2))
             )
+        self.label_watch_flush_timeout_secs = float(config.get("label_watch_flush_timeout_secs", 1.0))
+
+        self.alert_notifier = AlertNotifier(
+            self.sns_client,
+            alert_store,
+            float(config.get("label_watch_cooldown_secs", 0)),
+            self.tz,
+            phone_num=self.label_watch_phone_num,
+            sns_topic_arn=self.label_watch_sns_topic_arn,
+            dispatcher=alert_dispatcher
+        )
+
+        self.preflight_enabled = config.get("preflight_enabled", False)
+        self.preflight_max_width = int(config.get("preflight_max_width", 1920))
+        self.preflight_max_height = int(config.get("preflight_max_height", 1080))
+        self.preflight_max_bytes = int(config.get("preflight_max_bytes", 5242880))
+        self.preflight_jpeg_quality = int(config.get("preflight_jpeg_quality", 85))
+
+        self.dedup_cache = None
+        if config.get("frame_dedup_enabled", False):
+            self.dedup_cache = FrameDedupCache(
+                max_distance=int(config.get("frame_dedup_max_distance", 4)),
+                ttl_secs=float(config.get("frame_dedup_ttl_secs", 60)),
+                max_entries=int(config.get("frame_dedup_max_entries", 256))
+            )
+
+        #Records of a batch are processed on up to record_concurrency threads.
+        record_concurrency = int(config.get("record_concurrency", 1))
+        self.executor = ThreadPoolExecutor(max_workers=record_concurrency) if record_concurrency > 1 else None
+
+        #Frames are uploaded to S3 on up to s3_upload_concurrency threads while Rekognition
+        #analyzes them. Without upload threads, a frame is uploaded once it is analyzed.
+        s3_upload_concurrency = int(config.get("s3_upload_concurrency", 0))
+        self.upload_executor = ThreadPoolExecutor(max_workers=s3_upload_concurrency) if s3_upload_concurrency > 0 else None
+
+    @property
+    def ddb_table(self):
+        table = getattr(self._thread_local, 'ddb_table', None)
+        if table is None:
+            table = self._dynamodb_factory().Table(self.ddb_table_name)
+            self._thread_local.ddb_table = table
+        return table
+
+
+_runtime = None
+
+def get_runtime():
+    '''Return the runtime context, creating it on the first (cold) invocation.'''
+    global _runtime
+    if _runtime is None:
+        _runtime = RuntimeContext(load_config())
+    return _runtime
+
+def reset_runtime(runtime=None):
+    '''Discard the cached runtime context, or replace it with the given one (e.g. built with stub clients).'''
+    global _runtime
+    _runtime = runtime
+
+
+def detect_frame_labels(runtime, camera_id, img_bytes):
+    '''Return the Rekognition labels of a frame, or None if Rekognition cannot analyze it.'''
+
+    #Near-duplicate frames from the same camera reuse the labels of an earlier frame
+    dedup_cache = runtime.dedup_cache
+    frame_hash = None
+
+    if dedup_cache is not None:
+        try:
+            frame_hash = dhash(img_bytes)
         except Exception as e:
-            #Log error and ignore frame. You might want to add that frame to a dead-letter queue.
+            #Leave frames PIL cannot decode to Rekognition
             print(e)
-            return
-
-        #Iterate on rekognition labels. Enrich and prep them for storage in DynamoDB
-        labels_on_watch_list = []
-        for label in rekog_response['Labels']:
-            
-            lbl = label['Name']
-            conf = label['Confidence']
-            label['OnWatchList'] = False
-
-            #Print labels and confidence to lambda console
-            print('{} .. conf %{:.2f}'.format(lbl, conf))
-
-            #Check label watch list and trigger action
-            if (lbl.upper() in (label.upper() for label in label_watch_list)
-                and conf >= label_watch_min_conf):
-
-                label['OnWatchList'] = True
-                labels_on_watch_list.append(deepcopy(label))
-
-            #Convert from float to decimal for DynamoDB
-            label['Confidence'] = Decimal(conf)
-
-            for instance in label['Instances']:
-                instance['BoundingBox']['Width'] = Decimal(instance['BoundingBox']['Width'])
-                instance['BoundingBox']['Height'] = Decimal(instance['BoundingBox']['Height'])
-                instance['BoundingBox']['Left'] = Decimal(instance['BoundingBox']['Left'])
-                instance['BoundingBox']['Top'] = Decimal(instance['BoundingBox']['Top'])
-                instance['Confidence'] = Decimal(instance['Confidence'])
-
-        #Send out notification(s), if needed
-        if len(labels_on_watch_list) > 0 \
-                and (label_watch_phone_num or label_watch_sns_topic_arn):
-
-            notification_txt = 'On {}...\n'.format(now.strftime('%x, %-I:%M %p %Z'))
-
-            for label in labels_on_watch_list:
-
-                notification_txt += '- "{}" was detected with {}% confidence.\n'.format(
-                    label['Name'],
-                    round(label['Confidence'], 2))
-
-            print(notification_txt)
-
-            if label_watch_phone_num:
-                sns_client.publish(PhoneNumber=label_watch_phone_num, Message=notification_txt)
-
-            if label_watch_sns_topic_arn:
-                resp = sns_client.publish(
-                    TopicArn=label_watch_sns_topic_arn,
-                    Message=json.dumps(
-                        {
-                            "message": notification_txt,
-                            "labels": labels_on_watch_list
-                        }
-                    )
-                )
-
-                if resp.get("MessageId", ""):
-                    print("Successfully published alert message to SNS.")
-
-        #Store frame image in S3
-        s3_key = (s3_key_frames_root + '{}/{}/{}/{}/{}.jpg').format(year, mon, day, hour, frame_id)
-        
-        s3_client.put_object(
-            Bucket=s3_bucket,
+
+        if frame_hash is not None:
+            rekog_response = dedup_cache.get(camera_id, frame_hash)
+            if rekog_response is not None:
+                return rekog_response
+
+    try:
+        rekog_response = runtime.rekog_client.detect_labels(
+            Image={
+                'Bytes': img_bytes
+            },
+            MaxLabels=runtime.rekog_max_labels,
+            MinConfidence=runtime.rekog_min_conf
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] not in permanent_rekog_errors:
+            raise
+        #Log error and ignore frame. You might want to add that frame to a dead-letter queue.
+        print(e)
+        return None
+
+    if frame_hash is not None:
+        dedup_cache.put(camera_id, frame_hash, rekog_response)
+
+    return rekog_response
+
+
+def upload_frame(runtime, s3_key, img_bytes, timings):
+    with timings.stage('s3_upload'):
+        runtime.s3_client.put_object(
+            Bucket=runtime.s3_bucket,
             Key=s3_key,
             Body=img_bytes
         )
-        
-        #Persist frame data in dynamodb
-
-        item = {
-            'frame_id': frame_id,
-            'processed_timestamp' : processed_timestamp,
-            'approx_capture_timestamp' : approx_capture_timestamp,
-            'rekog_labels' : rekog_response['Labels'],
-            'rekog_orientation_correction' : 
-                rekog_response['OrientationCorrection'] 
-                if 'OrientationCorrection' in rekog_response else 'ROTATE_0',
-            'processed_year_month' : year + mon, #To be used as a Hash Key for DynamoDB GSI
-            's3_bucket' : s3_bucket,
-            's3_key' : s3_key
-        }
-
-        ddb_table.put_item(Item=item)
-
-    print('Successfully processed {} records.'.format(len(event['Records'])))
-    return
+
+
+def discard_upload(runtime, upload, s3_key):
+    '''Delete a frame uploaded while it was analyzed, once it turns out it will not be stored.'''
+    if upload is None:
+        return
+    try:
+        upload.result()
+        runtime.s3_client.delete_object(Bucket=runtime.s3_bucket, Key=s3_key)
+    except Exception as e:
+        print(e)
+
+
+def process_record(record, runtime, alert_digest=None, timings=None):
+    '''Analyze and store one Kinesis record, adding its Watch List detections to alert_digest.
+
+    Returns the frame's DynamoDB item, to be written with the rest of the batch,
+    or False if the frame was skipped. The item is only returned once the frame
+    is stored in S3.
+    '''
+
+    if timings is None:
+        timings = StageTimings()
+
+    s3_key_frames_root = runtime.s3_key_frames_root
+
+    frame_package_b64 = record['kinesis']['data']
+    try:
+        frame_package = parse_frame(base64.b64decode(frame_package_b64))
+    except (FrameFormatError, ValueError) as e:
+        #Malformed records would fail on every retry. Log and skip them.
+        print(e)
+        return False
+
+    #ImageBytes is a view into the decoded record. botocore only accepts bytes,
+    #bytearray or file-like blobs, so it is materialized once here.
+    img_bytes = frame_package["ImageBytes"]
+    if isinstance(img_bytes, memoryview):
+        img_bytes = img_bytes.tobytes()
+    approx_capture_ts = frame_package["ApproximateCaptureTime"]
+    frame_count = frame_package["FrameCount"]
+    
+    now_ts = time.time()
+
+    #Derive the frame id from the Kinesis record, so a retried record overwrites its
+    #earlier item instead of adding a duplicate.
+    frame_id = str(uuid.uuid5(uuid.NAMESPACE_URL, record.get('eventID') or record['kinesis']['sequenceNumber']))
+    processed_timestamp = to_decimal(now_ts)
+    approx_capture_timestamp = to_decimal(approx_capture_ts)
+    
+    now = convert_ts(now_ts, runtime.tz)
+    year = now.strftime("%Y")
+    mon = now.strftime("%m")
+    day = now.strftime("%d")
+    hour = now.strftime("%H")
+
+    #Reject corrupt frames cheaply and shrink oversized ones before they are sent to
+    #Rekognition. The original image is still the one stored in S3.
+    rekog_img_bytes = img_bytes
+    if runtime.preflight_enabled:
+        try:
+            rekog_img_bytes = preflight_frame(
+                img_bytes,
+                runtime.preflight_max_width,
+                runtime.preflight_max_height,
+                runtime.preflight_max_bytes,
+                runtime.preflight_jpeg_quality
+            )
+        except InvalidFrameError as e:
+            print(e)
+            return False
+
+    camera_id = frame_package.get("CameraId", "")
+    s3_key = (s3_key_frames_root + '{}/{}/{}/{}/{}.jpg').format(year, mon, day, hour, frame_id)
+
+    #Store frame image in S3. With upload threads, the upload runs while the frame is analyzed.
+    upload = None
+    if runtime.upload_executor is not None:
+        upload = runtime.upload_executor.submit(upload_frame, runtime, s3_key, img_bytes, timings)
+
+    try:
+        with timings.stage('rekognition'):
+            rekog_response = detect_frame_labels(runtime, camera_id, rekog_img_bytes)
+    except Exception:
+        discard_upload(runtime, upload, s3_key)
+        raise
+
+    if rekog_response is None:
+        discard_upload(runtime, upload, s3_key)
+        return False
+
+    #Print labels and confidence to lambda console
+    print('\n'.join('{} .. conf %{:.2f}'.format(label['Name'], label['Confidence'])
+                    for label in rekog_response['Labels']))
+
+    #Check labels against the watch list and prep them for storage in DynamoDB. The
+    #labels are converted in place: the dedup cache keeps and hands out its own copies.
+    stored_labels, labels_on_watch_list = enrich_labels(rekog_response['Labels'], runtime.watch_list_matcher)
+
+    #Alerts for the whole batch are sent by process_image, once its frames are stored
+    if labels_on_watch_list and alert_digest is not None:
+        alert_digest.add(record['kinesis']['sequenceNumber'], camera_id, labels_on_watch_list, now_ts)
+
+    #No item may point at a frame that is not in S3, so a failed upload fails the record
+    if upload is None:
+        upload_frame(runtime, s3_key, img_bytes, timings)
+    else:
+        with timings.stage('s3_wait'):
+            upload.result()
+
+    #Frame data is persisted in dynamodb by process_image, in batches
+    item = {
+        'frame_id': frame_id,
+        'processed_timestamp' : processed_timestamp,
+        'approx_capture_timestamp' : approx_capture_timestamp,
+        'rekog_labels' : stored_labels,
+        'label_summary' : summarize_labels(stored_labels, runtime.ddb_summary_labels),
+        'rekog_orientation_correction' : 
+            rekog_response['OrientationCorrection'] 
+            if 'OrientationCorrection' in rekog_response else 'ROTATE_0',
+        'camera_id' : camera_id or runtime.default_camera_id,
+        'camera_time_bucket' : camera_time_bucket(camera_id or runtime.default_camera_id, now_ts,
+                                                  runtime.ddb_time_bucket, runtime.ddb_bucket_salts, frame_id), #To be used as a Hash Key for DynamoDB GSI
+        's3_bucket' : runtime.s3_bucket,
+        's3_key' : s3_key
+    }
+
+    return item
+
+
+def batch_write_items(table, items, max_attempts, backoff_secs):
+    '''Write items to a DynamoDB table with BatchWriteItem.
+
+    Unprocessed items, and requests that fail (throttling, connection errors,
+    timeouts), are retried with exponential backoff. Returns the positions (in
+    items) of the items that could not be written.
+    '''
+    failed = set()
+    client = table.meta.client
+
+    for start in range(0, len(items), ddb_batch_write_max_items):
+        end = min(start + ddb_batch_write_max_items, len(items))
+        positions = {items[pos]['frame_id']: pos for pos in range(start, end)}
+        request_items = [{'PutRequest': {'Item': items[pos]}} for pos in positions.values()]
+
+        for attempt in range(max_attempts):
+            if attempt > 0:
+                time.sleep(backoff_secs * (2 ** (attempt - 1)))
+
+            try:
+                response = client.batch_write_item(RequestItems={table.name: request_items})
+            except (ClientError, BotoCoreError) as e:
+                print('BatchWriteItem of items {} to {} failed on attempt {} of {}: {}'.format(
+                    start, end - 1, attempt + 1, max_attempts, e))
+                continue
+
+            request_items = response.get('UnprocessedItems', {}).get(table.name, [])
+            if not request_items:
+                break
+
+        for request in request_items:
+            failed.add(positions[request['PutRequest']['Item']['frame_id']])
+
+    return failed
+
+
+def process_image(event, context):
+
+    runtime = get_runtime()
+    records = event['Records']
+
+    #Records of a shard are checkpointed in order, so a failed record and every record
+    #after it are retried. Once a record fails, later records that have not started yet
+    #are left for the retry instead of being sent to Rekognition twice.
+    batch_state = {'first_failed_index': len(records)}
+    batch_state_lock = threading.Lock()
+    alert_digest = AlertDigest() if runtime.alert_notifier.enabled else None
+    timings = StageTimings()
+
+    def run_record(index, record):
+        with batch_state_lock:
+            if index > batch_state['first_failed_index']:
+                return None
+        try:
+            with timings.stage('record'):
+                return process_record(record, runtime, alert_digest, timings)
+        except Exception as e:
+            with batch_state_lock:
+                batch_state['first_failed_index'] = min(batch_state['first_failed_index'], index)
+            return e
+
+    if runtime.executor is not None and len(records) > 1:
+        futures = [runtime.executor.submit(run_record, index, record) for index, record in enumerate(records)]
+        outcomes = [future.result() for future in futures]
+    else:
+        outcomes = [run_record(index, record) for index, record in enumerate(records)]
+
+    first_failed_index = batch_state['first_failed_index']
+
+    for record, outcome in zip(records, outcomes):
+        if isinstance(outcome, Exception):
+            print('Failed to process record {}: {}'.format(record['kinesis']['sequenceNumber'], outcome))
+
+    #Persist frame data in dynamodb. Items of records after the first failure are not
+    #written, since those records will be processed again.
+    item_indexes = [index for index in range(first_failed_index) if isinstance(outcomes[index], dict)]
+    with timings.stage('ddb_batch_write'):
+        failed_positions = batch_write_items(
+            runtime.ddb_table,
+            [outcomes[index] for index in item_indexes],
+            runtime.ddb_batch_max_attempts,
+            runtime.ddb_batch_backoff_secs
+        )
+
+    if failed_positions:
+        first_failed_index = min(item_indexes[pos] for pos in failed_positions)
+        print('Failed to write {} items to DynamoDB.'.format(len(failed_positions)))
+
+    processed = sum(1 for outcome in outcomes[:first_failed_index] if isinstance(outcome, dict))
+    skipped = sum(1 for outcome in outcomes[:first_failed_index] if outcome is False)
+
+    print('Successfully processed {} records ({} skipped, {} left for retry).'.format(
+        processed, skipped, len(records) - first_failed_index))
+
+    #Alert on the frames that were stored. Frames left for retry are alerted on when
+    #they are processed again.
+    if alert_digest is not None:
+        stored_record_ids = set(record['kinesis']['sequenceNumber'] for record in records[:first_failed_index])
+        try:
+            runtime.alert_notifier.notify(alert_digest, time.time(), stored_record_ids)
+        except Exception as e:
+            #The frames are stored, so a failed alert does not fail the batch.
+            print('Failed to send Watch List alert: {}'.format(e))
+
+        #Lambda freezes the container once the handler returns. Give queued alerts a
+        #bounded time to go out; the rest are sent when the container is invoked again.
+        runtime.alert_notifier.flush(runtime.label_watch_flush_timeout_secs)
+        print('Watch List alerts: {}'.format(runtime.alert_notifier.stats()))
+
+    print('Stage timings: {}'.format(timings.summary()))
+
+    if runtime.dedup_cache is not None:
+        print('Frame dedup cache: {}'.format(runtime.dedup_cache.stats()))
+
+    #Report the first failed record. Lambda retries the batch from that record onwards.
+    batch_item_failures = []
+    if first_failed_index < len(records):
+        batch_item_failures.append({
+            'itemIdentifier': records[first_failed_index]['kinesis']['sequenceNumber']
+        })
+
+    return {'batchItemFailures': batch_item_failures}
 
 def handler(event, context):
     return process_image(event, context)
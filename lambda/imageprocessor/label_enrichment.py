@@ -0,0 +1,129 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+from copy import deepcopy
+from decimal import Decimal
+
+
+def to_decimal(value):
+    '''Convert a float to a Decimal DynamoDB can store.
+
+    Decimal(float) keeps the float's full binary expansion (50+ digits for e.g.
+    0.452), which boto3 rejects as Inexact. The shortest repr round-trips instead.
+    '''
+    return Decimal(repr(value))
+
+
+def floats_to_decimals(obj):
+    '''Convert every float in a JSON-like structure (dicts and lists) to a Decimal, in place. Returns obj.
+
+    A DetectLabels response holds thousands of floats. Converting them where
+    they are, with leaves handled inline, costs little more than the Decimals
+    themselves; building a converted copy cost about as much again.
+    '''
+    if type(obj) is dict:
+        entries = obj.items()
+    elif type(obj) is list:
+        entries = enumerate(obj)
+    else:
+        return obj
+
+    for key, value in entries:
+        value_type = type(value)
+        if value_type is float:
+            obj[key] = Decimal(repr(value))
+        elif value_type is dict or value_type is list:
+            floats_to_decimals(value)
+    return obj
+
+
+class WatchListMatcher(object):
+    '''Precompiled label watch list.
+
+    Labels are matched case-insensitively against the watch list and its aliases
+    (alias -> watched label). A label must reach the watched label's threshold in
+    label_thresholds, or min_conf if it has none. With match_parents, a label also
+    matches when one of its Parents (e.g. "Person" for "Man") is watched.
+    '''
+
+    def __init__(self, watch_list, min_conf, label_thresholds=None, aliases=None, match_parents=False):
+        self.match_parents = match_parents
+
+        #Case-folded name -> (watched label, threshold)
+        self._watched = {}
+        thresholds = dict((name.casefold(), float(conf)) for name, conf in (label_thresholds or {}).items())
+        for name in watch_list:
+            self._watched[name.casefold()] = (name, thresholds.get(name.casefold(), float(min_conf)))
+
+        for alias, name in (aliases or {}).items():
+            if name.casefold() in self._watched:
+                self._watched[alias.casefold()] = self._watched[name.casefold()]
+
+        #Label name as Rekognition spells it -> (watched label, threshold) or None. Filled
+        #as names are seen, so each name of Rekognition's vocabulary is case-folded once
+        #per container.
+        self._by_name = {}
+
+    def _lookup(self, name):
+        try:
+            return self._by_name[name]
+        except KeyError:
+            watched = self._by_name[name] = self._watched.get(name.casefold())
+            return watched
+
+    def __bool__(self):
+        return bool(self._watched)
+
+    def match(self, label):
+        '''Return the watched label a Rekognition label matches, or None.'''
+        if not self._watched:
+            return None
+
+        conf = label['Confidence']
+        watched = self._lookup(label['Name'])
+        if watched is not None and conf >= watched[1]:
+            return watched[0]
+
+        if self.match_parents:
+            for parent in label.get('Parents', ()):
+                watched = self._lookup(parent['Name'])
+                if watched is not None and conf >= watched[1]:
+                    return watched[0]
+
+        return None
+
+
+def enrich_labels(labels, matcher):
+    '''Flag watched labels and convert labels for storage in DynamoDB, in place.
+
+    Returns (stored_labels, watched_labels). stored_labels is labels, converted,
+    with an OnWatchList flag on every label. watched_labels holds float-valued
+    copies of the watched labels (for alert messages), each with the watched
+    label it matched as WatchListLabel.
+    '''
+    watched_labels = []
+    for label in labels:
+        watched_name = matcher.match(label)
+        if watched_name is not None:
+            #Few labels are watched; alert messages are JSON, so they keep floats
+            watched_label = deepcopy(label)
+            watched_label['OnWatchList'] = True
+            watched_label['WatchListLabel'] = watched_name
+            watched_labels.append(watched_label)
+
+        floats_to_decimals(label)
+        label['OnWatchList'] = watched_name is not None
+
+    return labels, watched_labels
+
+
+def summarize_labels(stored_labels, count):
+    '''Return the count most confident stored labels with only Name, Confidence and OnWatchList.
+
+    Watched labels come first, so a list view shows why a frame raised an alert.
+    '''
+    ranked = sorted(stored_labels, key=lambda label: (not label['OnWatchList'], -label['Confidence']))
+    return [{'Name': label['Name'], 'Confidence': label['Confidence'], 'OnWatchList': label['OnWatchList']}
+            for label in ranked[:count]]
@@ -0,0 +1,357 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+import datetime
+import json
+import queue
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from label_enrichment import to_decimal
+
+
+def alert_key(camera_id, watched_label):
+    return '{}#{}'.format(camera_id, watched_label)
+
+
+class InMemoryAlertStore(object):
+    '''Remembers when each camera+label was last alerted on, in this Lambda container only.'''
+
+    def __init__(self):
+        self._alerted_at = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key, now, cooldown_secs):
+        '''Record an alert for key at now. Returns False if key was alerted on less than cooldown_secs ago.'''
+        with self._lock:
+            alerted_at = self._alerted_at.get(key)
+            if alerted_at is not None and now - alerted_at < cooldown_secs:
+                return False
+            self._alerted_at[key] = now
+            return True
+
+    def release(self, key, claimed_at):
+        '''Undo the claim of key made at claimed_at, unless the key has been claimed again since.'''
+        with self._lock:
+            if self._alerted_at.get(key) == claimed_at:
+                del self._alerted_at[key]
+
+
+class DynamoDBAlertStore(object):
+    '''Remembers when each camera+label was last alerted on, in a DynamoDB table shared by all
+    Image Processor invocations.
+
+    A conditional put claims a key, so concurrent invocations cannot both alert on the
+    same camera+label. Items expire through the table's TTL attribute (expires_at).
+    '''
+
+    def __init__(self, table):
+        self.table = table
+
+    def claim(self, key, now, cooldown_secs):
+        try:
+            self.table.put_item(
+                Item={
+                    'alert_key': key,
+                    'alerted_at': to_decimal(now),
+                    'expires_at': int(now + cooldown_secs) + 1
+                },
+                ConditionExpression='attribute_not_exists(alert_key) OR alerted_at <= :cutoff',
+                ExpressionAttributeValues={':cutoff': to_decimal(now - cooldown_secs)}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def release(self, key, claimed_at):
+        try:
+            self.table.delete_item(
+                Key={'alert_key': key},
+                ConditionExpression='alerted_at = :claimed_at',
+                ExpressionAttributeValues={':claimed_at': to_decimal(claimed_at)}
+            )
+        except ClientError as e:
+            #Claimed again since; otherwise the key stays in its cooldown
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print('Failed to release alert cooldown of {}: {}'.format(key, e))
+
+
+class AlertDigest(object):
+    '''Watch List detections of one batch of records, grouped by camera and watched label.'''
+
+    def __init__(self):
+        #(camera id, watched label) -> detection summary
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def add(self, record_id, camera_id, watched_labels, detected_at):
+        with self._lock:
+            for label in watched_labels:
+                key = (camera_id, label['WatchListLabel'])
+                group = self._groups.get(key)
+                if group is None:
+                    group = self._groups[key] = {
+                        'camera_id': camera_id,
+                        'watched_label': label['WatchListLabel'],
+                        'detections': []
+                    }
+                group['detections'].append((record_id, detected_at, label))
+
+    def groups(self, record_ids=None):
+        '''Return the detection groups by camera and label, counting only the records in record_ids if given.'''
+        groups = []
+        with self._lock:
+            for key, group in sorted(self._groups.items()):
+                detections = [detection for detection in group['detections']
+                              if record_ids is None or detection[0] in record_ids]
+                if detections:
+                    groups.append(dict(group, detections=detections))
+        return groups
+
+
+class AlertDispatcher(object):
+    '''Publishes alert messages to SNS on background threads.
+
+    At most max_queued messages wait to be published; further messages are dropped.
+    A failed publish is retried up to max_attempts times with exponential backoff.
+    The on_failed callback of a message is called if it is dropped or never published.
+    '''
+
+    def __init__(self, sns_client, threads=2, max_queued=100, max_attempts=3, backoff_secs=0.2):
+        self.sns_client = sns_client
+        self.max_attempts = max_attempts
+        self.backoff_secs = backoff_secs
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._pending = 0
+        self._condition = threading.Condition()
+
+        for index in range(threads):
+            thread = threading.Thread(target=self._run, name='alert-dispatcher-{}'.format(index))
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, on_failed=None, **publish_args):
+        '''Queue an SNS publish. Returns False if the message was dropped.'''
+        with self._condition:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((publish_args, on_failed))
+            return True
+        except queue.Full:
+            print('Alert queue is full, dropping alert message.')
+            with self._condition:
+                self._pending -= 1
+                self.dropped += 1
+                self._condition.notify_all()
+            if on_failed is not None:
+                on_failed()
+            return False
+
+    def flush(self, timeout_secs):
+        '''Wait up to timeout_secs for queued messages to be published. Returns True if none are left.'''
+        deadline = time.time() + timeout_secs
+        with self._condition:
+            while self._pending > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def _run(self):
+        while True:
+            publish_args, on_failed = self._queue.get()
+            sent = self._publish(publish_args)
+            if not sent and on_failed is not None:
+                try:
+                    on_failed()
+                except Exception as e:
+                    print('Failed to handle unpublished alert message: {}'.format(e))
+            with self._condition:
+                self._pending -= 1
+                if sent:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                self._condition.notify_all()
+
+    def _publish(self, publish_args):
+        for attempt in range(self.max_attempts):
+            if attempt > 0:
+                time.sleep(self.backoff_secs * (2 ** (attempt - 1)))
+
+            try:
+                resp = self.sns_client.publish(**publish_args)
+            except Exception as e:
+                print('Failed to publish alert message: {}'.format(e))
+                continue
+
+            if resp.get("MessageId", ""):
+                print("Successfully published alert message to SNS.")
+            return True
+
+        return False
+
+    def stats(self):
+        with self._condition:
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'queued': self._pending
+            }
+
+
+class AlertNotifier(object):
+    '''Publishes Watch List alerts for a batch of records as one digest message.
+
+    A camera+label is alerted on at most once per cooldown_secs. Detections of a
+    camera+label still in its cooldown are left out of the digest. With a dispatcher,
+    messages are queued for publishing instead of being published before notify returns.
+
+    A camera+label is claimed in the store before its alert is published, so that
+    concurrent invocations do not both alert on it. If no message of the alert is
+    published (failed or dropped), the claims are released again.
+    '''
+
+    def __init__(self, sns_client, store, cooldown_secs, tz, phone_num="", sns_topic_arn="", dispatcher=None):
+        self.sns_client = sns_client
+        self.dispatcher = dispatcher
+        self.store = store
+        self.cooldown_secs = cooldown_secs
+        self.tz = tz
+        self.phone_num = phone_num
+        self.sns_topic_arn = sns_topic_arn
+
+        self.published = 0
+        self.alerted = 0
+        self.suppressed = 0
+
+    @property
+    def enabled(self):
+        return bool(self.phone_num or self.sns_topic_arn)
+
+    def notify(self, digest, now, record_ids=None):
+        '''Alert on the detections in digest (of the records in record_ids, if given).
+
+        Returns the number of SNS messages published (or queued).
+        '''
+        alert_groups = []
+        claimed_keys = []
+        for group in digest.groups(record_ids):
+            key = alert_key(group['camera_id'], group['watched_label'])
+            if self.store.claim(key, now, self.cooldown_secs):
+                alert_groups.append(group)
+                claimed_keys.append(key)
+            else:
+                self.suppressed += len(group['detections'])
+
+        if not alert_groups:
+            return 0
+        self.alerted += len(alert_groups)
+
+        notification_txt, labels = self.format_digest(alert_groups)
+        print(notification_txt)
+
+        on_failed = self._release_when_all_fail(claimed_keys, now, bool(self.phone_num) + bool(self.sns_topic_arn))
+        published = 0
+        if self.phone_num:
+            published += self._publish(on_failed, PhoneNumber=self.phone_num, Message=notification_txt)
+
+        if self.sns_topic_arn:
+            published += self._publish(
+                on_failed,
+                TopicArn=self.sns_topic_arn,
+                Message=json.dumps(
+                    {
+                        "message": notification_txt,
+                        "labels": labels
+                    }
+                )
+            )
+
+        self.published += published
+        return published
+
+    def _release_when_all_fail(self, keys, claimed_at, message_count):
+        '''Return the on_failed callback of an alert's messages, which releases keys once every message failed.'''
+        failures = []
+        lock = threading.Lock()
+
+        def on_failed():
+            with lock:
+                failures.append(True)
+                if len(failures) < message_count:
+                    return
+            for key in keys:
+                self.store.release(key, claimed_at)
+
+        return on_failed
+
+    def _publish(self, on_failed, **publish_args):
+        '''Publish (or queue) a message. Returns 1 if it was published or queued, else 0.'''
+        if self.dispatcher is not None:
+            return int(self.dispatcher.submit(on_failed=on_failed, **publish_args))
+
+        try:
+            resp = self.sns_client.publish(**publish_args)
+        except Exception as e:
+            print('Failed to publish alert message: {}'.format(e))
+            on_failed()
+            return 0
+        if resp.get("MessageId", ""):
+            print("Successfully published alert message to SNS.")
+        return 1
+
+    def flush(self, timeout_secs):
+        '''Wait up to timeout_secs for queued messages to be published. Returns True if none are left.'''
+        if self.dispatcher is None:
+            return True
+        return self.dispatcher.flush(timeout_secs)
+
+    def format_digest(self, alert_groups):
+        '''Return the alert text and, per group, its most confident label.'''
+        last_detected_at = max(detection[1] for group in alert_groups for detection in group['detections'])
+        notification_txt = 'On {}...\n'.format(
+            datetime.datetime.fromtimestamp(last_detected_at, self.tz).strftime('%x, %-I:%M %p %Z'))
+
+        labels = []
+        for group in alert_groups:
+            label = max((detection[2] for detection in group['detections']), key=lambda label: label['Confidence'])
+            frame_count = len(group['detections'])
+
+            name = label['Name']
+            if name.casefold() != group['watched_label'].casefold():
+                name = '{} ({})'.format(name, group['watched_label'])
+
+            notification_txt += '- "{}" was detected{}{} with {}{}% confidence.\n'.format(
+                name,
+                ' on camera {}'.format(group['camera_id']) if group['camera_id'] else '',
+                ' in {} frames'.format(frame_count) if frame_count > 1 else '',
+                'up to ' if frame_count > 1 else '',
+                round(label['Confidence'], 2))
+
+            labels.append(dict(label, CameraId=group['camera_id'], FrameCount=frame_count))
+
+        return notification_txt, labels
+
+    def stats(self):
+        stats = {
+            'published': self.published,
+            'alerted': self.alerted,
+            'suppressed': self.suppressed
+        }
+        if self.dispatcher is not None:
+            stats.update(self.dispatcher.stats())
+        return stats
@@ -0,0 +1,335 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Replays a synthetic Kinesis frame stream through the Image Processor handler to
+tune the stack's EventSourceMapping parameters for a target frame rate.
+
+The handler is run locally with stand-ins for Amazon Rekognition, S3, SNS and
+DynamoDB that only add latency, to measure how long an invocation takes for a
+given number of records. The event source is then simulated, in virtual time,
+for every combination of batch size, batching window and parallelization factor:
+
+- cameras send frames round-robin at the target frames/sec, keyed by camera id
+  and pinned to shards round-robin (kinesis_shard_count set in the client)
+- each shard is split into parallelization-factor lanes by partition key; a
+  lane runs one invocation at a time, in order
+- an idle lane polls its shard every poll-interval seconds; a busy lane reads
+  again as soon as its invocation finishes
+- a batch is sent once it reaches the batch size or 6 MB, or when the batching
+  window has passed since the lane started gathering records
+
+End-to-end latency is from a frame arriving in the stream to its invocation
+finishing. A configuration "keeps up" if latency does not grow over the run.
+The configuration with the lowest 95th percentile latency that keeps up (and
+the fewest concurrent invocations among near ties) is printed as cfn-params.json
+values.
+'''
+
+import argparse
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'imageprocessor'))
+
+import imageprocessor
+from frame_format import FRAME_MAGIC, FRAME_FORMAT_VERSION, FRAME_HEADER
+from PIL import Image, ImageDraw
+
+#Lambda limits for Kinesis event sources
+max_invocation_payload_bytes = 6 * 1024 * 1024
+max_batch_size = 10000
+max_parallelization_factor = 10
+
+
+class LatencyRekognition(object):
+
+    def __init__(self, latency_secs):
+        self.latency_secs = latency_secs
+
+    def detect_labels(self, Image, **kwargs):
+        time.sleep(self.latency_secs)
+        return {'Labels': [{'Name': 'Car', 'Confidence': 91.5, 'Instances': [], 'Parents': [{'Name': 'Vehicle'}]}]}
+
+
+class LatencyS3(object):
+
+    def __init__(self, latency_secs):
+        self.latency_secs = latency_secs
+
+    def put_object(self, **kwargs):
+        time.sleep(self.latency_secs)
+        return {}
+
+
+class LatencySNS(object):
+
+    def __init__(self, latency_secs):
+        self.latency_secs = latency_secs
+
+    def publish(self, **kwargs):
+        time.sleep(self.latency_secs)
+        return {'MessageId': '0'}
+
+
+class LatencyTable(object):
+
+    def __init__(self, name, latency_secs):
+        self.name = name
+        self.latency_secs = latency_secs
+        self.meta = SimpleNamespace(client=self)
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(self.latency_secs)
+        return {'UnprocessedItems': {}}
+
+
+class LatencyDynamoDB(object):
+
+    def __init__(self, latency_secs):
+        self.latency_secs = latency_secs
+
+    def Table(self, name):
+        return LatencyTable(name, self.latency_secs)
+
+
+def synthetic_jpeg(index, width, height, quality=80):
+    '''Return a distinct JPEG frame, so every frame is sent to Rekognition.'''
+    rng = random.Random(index)
+    img = Image.new('RGB', (width, height), (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    draw = ImageDraw.Draw(img)
+    for shape in range(12):
+        x, y = rng.randint(0, width), rng.randint(0, height)
+        draw.rectangle([x, y, x + rng.randint(10, width // 3), y + rng.randint(10, height // 3)],
+                       fill=(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def pack_frame(img_bytes, capture_ts, frame_count, camera_id):
+    '''Build a frame record the way client/frame_format.py does.'''
+    camera_id_bytes = camera_id.encode('utf-8')
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_FORMAT_VERSION, 1, len(camera_id_bytes),
+                               capture_ts, frame_count, len(img_bytes))
+    return header + camera_id_bytes + img_bytes
+
+
+def frame_event(frames, first_sequence_number, record_count, camera_count=8):
+    '''Build a Kinesis event with record_count frame records, cycling through frames and cameras.'''
+    records = []
+    for sequence_number in range(first_sequence_number, first_sequence_number + record_count):
+        camera_id = 'camera{}'.format(sequence_number % camera_count)
+        data = pack_frame(frames[sequence_number % len(frames)], time.time(), sequence_number, camera_id)
+        records.append({
+            'eventID': 'shardId-000000000000:{}'.format(sequence_number),
+            'kinesis': {
+                'data': base64.b64encode(data).decode('ascii'),
+                'partitionKey': camera_id,
+                'sequenceNumber': str(sequence_number)
+            }
+        })
+    return {'Records': records}
+
+
+class HandlerTimer(object):
+    '''Measures the handler's duration for a batch of n records.
+
+    Durations are measured for powers of two and interpolated in between.
+    '''
+
+    def __init__(self, config, frames, rekog_latency, s3_latency, sns_latency, ddb_latency, repeats=3):
+        self.frames = frames
+        self.repeats = repeats
+        self.runtime = imageprocessor.RuntimeContext(
+            config,
+            rekog_client=LatencyRekognition(rekog_latency),
+            sns_client=LatencySNS(sns_latency),
+            s3_client=LatencyS3(s3_latency),
+            dynamodb=LatencyDynamoDB(ddb_latency)
+        )
+        self._durations = {}
+        self._sequence_number = 0
+
+    def _event(self, record_count):
+        event = frame_event(self.frames, self._sequence_number + 1, record_count)
+        self._sequence_number += record_count
+        return event
+
+    def _measure(self, record_count):
+        if record_count not in self._durations:
+            imageprocessor.reset_runtime(self.runtime)
+            durations = []
+            for repeat in range(self.repeats):
+                event = self._event(record_count)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.time()
+                    imageprocessor.handler(event, None)
+                    durations.append(time.time() - start)
+            self._durations[record_count] = sorted(durations)[len(durations) // 2]
+        return self._durations[record_count]
+
+    def duration(self, record_count):
+        lower = 2 ** (record_count.bit_length() - 1)
+        if lower == record_count:
+            return self._measure(record_count)
+        upper = lower * 2
+        fraction = float(record_count - lower) / (upper - lower)
+        return self._measure(lower) + fraction * (self._measure(upper) - self._measure(lower))
+
+
+def simulate_lane(arrivals, batch_size, window_secs, poll_secs, invoke_overhead_secs, max_batch_records, timer):
+    '''Simulate one lane of a shard. Returns the end-to-end latency of every frame.'''
+    latencies = []
+    lane_free_at = 0.0
+    last_poll_at = 0.0
+    next_index = 0
+    batch_limit = min(batch_size, max_batch_records)
+
+    while next_index < len(arrivals):
+        #An idle lane polls every poll_secs. A lane with records waiting reads them as soon as it is free.
+        now = lane_free_at
+        if arrivals[next_index] > now:
+            polls = math.ceil((arrivals[next_index] - last_poll_at) / poll_secs)
+            now = max(now, last_poll_at + polls * poll_secs)
+        last_poll_at = now
+
+        #Gather records until the batch is full or the batching window has passed.
+        full_index = next_index + batch_limit - 1
+        invoke_at = now + window_secs
+        if full_index < len(arrivals):
+            invoke_at = min(invoke_at, max(now, arrivals[full_index]))
+
+        end_index = next_index
+        while end_index < len(arrivals) and end_index - next_index < batch_limit \
+                and arrivals[end_index] <= invoke_at:
+            end_index += 1
+
+        done_at = invoke_at + invoke_overhead_secs + timer.duration(end_index - next_index)
+        latencies.extend(done_at - arrivals[index] for index in range(next_index, end_index))
+
+        next_index = end_index
+        lane_free_at = done_at
+        last_poll_at = done_at
+
+    return latencies
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def simulate(args, timer, batch_size, window_secs, parallelization_factor):
+    max_batch_records = max(1, max_invocation_payload_bytes // args.frame_bytes)
+    frame_interval = 1.0 / args.fps
+
+    lanes = {}
+    for frame_index in range(int(args.duration * args.fps)):
+        camera = frame_index % args.cameras
+        shard = camera % args.shards
+        lane = int(hashlib.md5('camera{}'.format(camera).encode('utf-8')).hexdigest(), 16) % parallelization_factor
+        lanes.setdefault((shard, lane), []).append(frame_index * frame_interval)
+
+    latencies = []
+    growth = 0.0
+    for arrivals in lanes.values():
+        lane_latencies = simulate_lane(arrivals, batch_size, window_secs, args.poll_interval,
+                                       args.invoke_overhead, max_batch_records, timer)
+        latencies.extend(lane_latencies)
+
+        #Compare the start and end of the run to tell a backlog that keeps growing.
+        tenth = max(1, len(lane_latencies) // 10)
+        growth = max(growth, sum(lane_latencies[-tenth:]) / tenth - sum(lane_latencies[:tenth]) / tenth)
+
+    latencies.sort()
+    return {
+        'BatchSize': batch_size,
+        'MaximumBatchingWindowInSeconds': window_secs,
+        'ParallelizationFactor': parallelization_factor,
+        'concurrency': len(lanes),
+        'p50': round(percentile(latencies, 0.5), 2),
+        'p95': round(percentile(latencies, 0.95), 2),
+        'max': round(latencies[-1], 2),
+        'keeps_up': growth < args.max_growth
+    }
+
+
+def parse_list(value, convert):
+    return [convert(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--fps', type=float, default=10.0, help='Target frames/sec over all cameras.')
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--shards', type=int, default=1, help='KinesisShardCountParameter')
+    parser.add_argument('--duration', type=float, default=120.0, help='Simulated seconds of traffic.')
+    parser.add_argument('--batch-sizes', default='1,5,10,25,50,100')
+    parser.add_argument('--windows', default='0,1,2', help='Whole seconds, as Lambda requires.')
+    parser.add_argument('--parallelization-factors', default='1,2,4,10')
+    parser.add_argument('--frame-width', type=int, default=1280)
+    parser.add_argument('--frame-height', type=int, default=720)
+    parser.add_argument('--rekog-latency', type=float, default=0.25)
+    parser.add_argument('--s3-latency', type=float, default=0.03)
+    parser.add_argument('--sns-latency', type=float, default=0.03)
+    parser.add_argument('--ddb-latency', type=float, default=0.02)
+    parser.add_argument('--invoke-overhead', type=float, default=0.02, help='Lambda overhead per invocation.')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='How often an idle lane polls its shard.')
+    parser.add_argument('--max-growth', type=float, default=1.0,
+                        help='Seconds latency may grow over the run for a configuration to keep up.')
+    parser.add_argument('--params', default=os.path.join(base_dir, '..', 'config', 'imageprocessor-params.json'))
+    args = parser.parse_args()
+
+    with open(args.params, 'r') as params_file:
+        config = json.loads(params_file.read())
+    #Every synthetic frame is distinct, so skip hashing them.
+    config['frame_dedup_enabled'] = False
+
+    frames = [synthetic_jpeg(index, args.frame_width, args.frame_height) for index in range(16)]
+    args.frame_bytes = sum(len(frame) for frame in frames) // len(frames) + 64
+
+    timer = HandlerTimer(config, frames, args.rekog_latency, args.s3_latency, args.sns_latency, args.ddb_latency)
+
+    print("Simulating {} frames/sec from {} cameras over {} shards ({} byte frames, record_concurrency {}).".format(
+        args.fps, args.cameras, args.shards, args.frame_bytes, config.get('record_concurrency', 1)))
+
+    results = []
+    for parallelization_factor in parse_list(args.parallelization_factors, int):
+        for batch_size in parse_list(args.batch_sizes, int):
+            for window_secs in parse_list(args.windows, int):
+                result = simulate(args, timer, min(batch_size, max_batch_size),
+                                  window_secs, min(parallelization_factor, max_parallelization_factor))
+                print(result)
+                results.append(result)
+
+    stable = [result for result in results if result['keeps_up']]
+    if not stable:
+        print("No configuration keeps up with {} frames/sec. Add shards or raise record_concurrency.".format(args.fps))
+        return
+
+    #Prefer fewer concurrent invocations among configurations within 5% of the best p95.
+    best_p95 = min(result['p95'] for result in stable)
+    best = min((result for result in stable if result['p95'] <= best_p95 * 1.05),
+               key=lambda result: (result['concurrency'], result['p95']))
+
+    print("Best: {}".format(best))
+    print(json.dumps({
+        "ImageProcessorBatchSizeParameter": str(best['BatchSize']),
+        "ImageProcessorBatchingWindowParameter": str(best['MaximumBatchingWindowInSeconds']),
+        "ImageProcessorParallelizationFactorParameter": str(best['ParallelizationFactor'])
+    }, indent=4))
+
+
+if __name__ == '__main__':
+    main()
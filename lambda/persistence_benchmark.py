@@ -0,0 +1,87 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Times Image Processor with frames uploaded to S3 after analysis and during analysis.
+
+usage: persistence_benchmark.py [rekog-latency] [s3-latency] [ddb-latency] [batches] [records-per-batch]
+
+The handler is run with stand-ins for Amazon Rekognition, S3 and DynamoDB that
+only add latency. For each combination of record_concurrency and
+s3_upload_concurrency it prints the mean time per record (from the start of its
+processing until its frame is analyzed and stored in S3), the handler duration
+per batch and the handler's stage timings.
+'''
+
+import ast
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+from load_simulation import (LatencyRekognition, LatencyS3, LatencySNS, LatencyDynamoDB,
+                             synthetic_jpeg, frame_event, base_dir)
+
+import imageprocessor
+
+
+def time_batches(config, rekog_latency, s3_latency, ddb_latency, batch_count, record_count, frames):
+    runtime = imageprocessor.RuntimeContext(
+        config,
+        rekog_client=LatencyRekognition(rekog_latency),
+        sns_client=LatencySNS(0),
+        s3_client=LatencyS3(s3_latency),
+        dynamodb=LatencyDynamoDB(ddb_latency)
+    )
+    imageprocessor.reset_runtime(runtime)
+
+    handler_secs = []
+    record_secs = []
+    for batch in range(batch_count):
+        event = frame_event(frames, batch * record_count, record_count)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            start = time.time()
+            imageprocessor.handler(event, None)
+            handler_secs.append(time.time() - start)
+
+        #The handler logs the batch's stage timings
+        for line in output.getvalue().splitlines():
+            if line.startswith('Stage timings: '):
+                stages = ast.literal_eval(line[len('Stage timings: '):])
+        record_secs.append(stages['record']['mean_ms'] / 1000)
+
+    return sum(record_secs) / batch_count, sum(handler_secs) / batch_count, stages
+
+
+def main():
+    rekog_latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.3
+    s3_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    ddb_latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    batch_count = int(sys.argv[4]) if len(sys.argv) > 4 else 5
+    record_count = int(sys.argv[5]) if len(sys.argv) > 5 else 8
+
+    with open(os.path.join(base_dir, '..', 'config', 'imageprocessor-params.json'), 'r') as params_file:
+        config = json.loads(params_file.read())
+    config['frame_dedup_enabled'] = False
+    frames = [synthetic_jpeg(index, 320, 240) for index in range(8)]
+
+    print("{} batches of {} records. Rekognition {} s, S3 {} s (sum {} s, max {} s), DynamoDB batch write {} s.".format(
+        batch_count, record_count, rekog_latency, s3_latency, rekog_latency + s3_latency,
+        max(rekog_latency, s3_latency), ddb_latency))
+
+    for record_concurrency in [1, record_count]:
+        for s3_upload_concurrency in [0, record_count]:
+            mode_config = dict(config, record_concurrency=record_concurrency, s3_upload_concurrency=s3_upload_concurrency)
+            record, handler, stages = time_batches(mode_config, rekog_latency, s3_latency, ddb_latency,
+                                                   batch_count, record_count, frames)
+            print("record_concurrency {}, s3_upload_concurrency {}: {:.3f} s per record, handler {:.3f} s".format(
+                record_concurrency, s3_upload_concurrency, record, handler))
+            print("    {}".format(stages))
+
+
+if __name__ == '__main__':
+    main()
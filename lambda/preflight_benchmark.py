@@ -0,0 +1,90 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Compares the cost of shrinking frames with draft() and with a full load() and resize().
+
+usage: preflight_benchmark.py [repeats]
+
+For 720p, 1080p and 4K JPEG frames it prints the time to parse the headers
+only, as Image Processor's preflight does for every frame, and for each smaller
+target size the time to decode and resize the frame with draft() and with a
+full decode, and the time of preflight_frame() with the re-encode. Frames are
+synthetic scenes with sensor noise, so they compress like camera frames. Times
+are medians in milliseconds.
+'''
+
+import io
+import os
+import sys
+import time
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, 'imageprocessor'))
+
+from PIL import Image
+
+from load_simulation import synthetic_jpeg
+
+from frame_preflight import read_jpeg_header, preflight_frame
+
+resolutions = [('720p', 1280, 720), ('1080p', 1920, 1080), ('4K', 3840, 2160)]
+targets = [(640, 360), (1280, 720), (1920, 1080)]
+
+
+def camera_jpeg(width, height, quality=85):
+    img = Image.open(io.BytesIO(synthetic_jpeg(7, width, height)))
+    img = Image.blend(img.convert('RGB'), Image.effect_noise((width, height), 40).convert('RGB'), 0.08)
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def full_resize(img_bytes, size):
+    img = Image.open(io.BytesIO(img_bytes))
+    img.load()
+    img.thumbnail(size, Image.BILINEAR)
+    return img
+
+
+def draft_resize(img_bytes, size):
+    img = Image.open(io.BytesIO(img_bytes))
+    img.draft('RGB', size)
+    img.load()
+    img.thumbnail(size, Image.BILINEAR)
+    return img
+
+
+def median_ms(run, repeats):
+    durations = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+    return sorted(durations)[len(durations) // 2] * 1000
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+
+    print("Median of {} runs, ms.".format(repeats))
+    print("  {:<7}{:>8}{:>9}{:>12}{:>10}{:>10}{:>9}{:>11}".format(
+        'frame', 'KB', 'header', 'target', 'full', 'draft', 'speedup', 'preflight'))
+    for name, width, height in resolutions:
+        img_bytes = camera_jpeg(width, height)
+        header_ms = median_ms(lambda: read_jpeg_header(img_bytes), repeats)
+        for target in targets:
+            if target[0] >= width:
+                continue
+            assert draft_resize(img_bytes, target).size == full_resize(img_bytes, target).size == target
+            full_ms = median_ms(lambda: full_resize(img_bytes, target), repeats)
+            draft_ms = median_ms(lambda: draft_resize(img_bytes, target), repeats)
+            preflight_ms = median_ms(lambda: preflight_frame(img_bytes, target[0], target[1], 5242880), repeats)
+            print("  {:<7}{:>8}{:>9.3f}{:>12}{:>10.2f}{:>10.2f}{:>8.1f}x{:>11.2f}".format(
+                name, len(img_bytes) // 1024, header_ms, '{}x{}'.format(*target), full_ms, draft_ms,
+                full_ms / draft_ms, preflight_ms))
+
+
+if __name__ == '__main__':
+    main()
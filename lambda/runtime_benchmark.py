@@ -0,0 +1,110 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in compliance with the License. A copy of the License is located at
+#     http://aws.amazon.com/asl/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+'''Times Image Processor invocations that build their clients and read their config
+(cold) against invocations that reuse the runtime context (warm).
+
+usage: runtime_benchmark.py [invocations] [records-per-batch]
+
+The handler is run on a synthetic batch with stand-ins for Amazon Rekognition,
+S3, SNS and DynamoDB that answer at once. A cold invocation first does what
+every invocation did before the runtime context was reused: it reads
+imageprocessor-params.json and creates the boto3 Rekognition, SNS and S3
+clients and DynamoDB resource (with dummy credentials; creating them makes no
+network calls), then builds the runtime context. A warm invocation reuses the
+runtime context of the one before it.
+'''
+
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIAEXAMPLEEXAMPLE00')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'example-secret-access-key')
+os.environ.setdefault('AWS_EC2_METADATA_DISABLED', 'true')
+
+import boto3
+
+from load_simulation import (LatencyRekognition, LatencyS3, LatencySNS, LatencyDynamoDB, synthetic_jpeg,
+                             frame_event, base_dir)
+
+import imageprocessor
+
+config_path = os.path.join(base_dir, '..', 'config', 'imageprocessor-params.json')
+
+
+def stand_in_runtime(config):
+    return imageprocessor.RuntimeContext(
+        config,
+        rekog_client=LatencyRekognition(0),
+        sns_client=LatencySNS(0),
+        s3_client=LatencyS3(0),
+        dynamodb=LatencyDynamoDB(0)
+    )
+
+
+def cold_setup():
+    '''Read the config and create the clients, as every invocation did. Returns the config.'''
+    with open(config_path, 'r') as conf_file:
+        config = json.loads(conf_file.read())
+    config = dict(config, frame_dedup_enabled=False)
+
+    boto3.client('rekognition')
+    boto3.client('sns')
+    boto3.client('s3')
+    boto3.resource('dynamodb').Table(config['ddb_table'])
+    return config
+
+
+def time_invocations(frames, invocations, record_count, cold):
+    '''Returns the setup and handler durations of each invocation, in seconds.'''
+    setups = []
+    handlers = []
+    runtime = None
+    for invocation in range(invocations):
+        event = frame_event(frames, invocation * record_count + 1, record_count)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            if cold or runtime is None:
+                runtime = stand_in_runtime(cold_setup())
+                imageprocessor.reset_runtime(runtime)
+            setup_done = time.perf_counter()
+            imageprocessor.handler(event, None)
+            handlers.append(time.perf_counter() - setup_done)
+        setups.append(setup_done - start)
+    imageprocessor.reset_runtime()
+    return setups, handlers
+
+
+def median_ms(durations):
+    return sorted(durations)[len(durations) // 2] * 1000
+
+
+def main():
+    invocations = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    record_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    frames = [synthetic_jpeg(index, 320, 240) for index in range(record_count)]
+    #Import and model loading costs of the first client are paid once per process, not per invocation
+    cold_setup()
+
+    print("{} invocations of {} records, stand-in AWS services with no latency. Median per invocation:".format(
+        invocations, record_count))
+    for name, cold in [('cold', True), ('warm', False)]:
+        setups, handlers = time_invocations(frames, invocations, record_count, cold)
+        if not cold:
+            #The first warm invocation built the runtime context
+            setups, handlers = setups[1:], handlers[1:]
+        print("  {:<6} setup {:7.2f} ms, handler {:6.2f} ms, total {:7.2f} ms".format(
+            name + ':', median_ms(setups), median_ms(handlers),
+            median_ms([setup + handler for setup, handler in zip(setups, handlers)])))
+
+
+if __name__ == '__main__':
+    main()
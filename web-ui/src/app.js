@@ -19,15 +19,29 @@ var app = new Vue({
   
   methods: {
   	fetchFrames: function(){
-  		axiosInstance.get('enrichedframe')
+  		// After the first fetch, only ask for frames newer than the ones shown
+  		var params = {limit: this.frameLimit};
+  		if(this.sinceCursor){
+  			params.since = this.sinceCursor;
+  		}
+  		axiosInstance.get('enrichedframe', {params: params})
 			.then(response => {
 		      // JSON responses are automatically parsed.
 		      console.log(response.data);
-		      this.enrichedframes = response.data;
+		      if(params.since && response.data.length == this.frameLimit){
+		      	// More new frames than are shown: fetch the newest ones instead
+		      	this.sinceCursor = null;
+		      	this.fetchFrames();
+		      	return;
+		      }
+		      this.enrichedframes = response.data.concat(params.since ? this.enrichedframes : []).slice(0, this.frameLimit);
+		      this.sinceCursor = response.headers['x-next-since'] || null;
 		    })
 		    .catch(e => {
 		      //this.errors.push(e);
 		      console.log(e);
+		      // E.g. a cursor signed before Frame Fetcher was redeployed
+		      this.sinceCursor = null;
 		    })
   	},
   	toggleFetchFrames: function(){
@@ -49,6 +63,8 @@ var app = new Vue({
   },
   data: {
     enrichedframes : [],
+    frameLimit: 3,
+    sinceCursor: null,
     autoload: false,
   	autoloadTimer : null,
   },